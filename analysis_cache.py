@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import uuid
+import numpy as np
+from metrics import exited_process_file
+
+# Bump when analyze_audio changes what it computes so stale entries are ignored
+CACHE_VERSION = 3
+
+ARRAY_KEYS = ("beat_times", "onset_times", "rms", "spectral_centroid")
+SCALAR_KEYS = ("frame_count", "duration", "feature_start", "feature_step_ms")
+COUNTERS = ("hits", "misses", "evictions")
+RETIRED_STATS = "retired.json" # Summed counters of processes that have exited
+
+class AnalysisCache:
+    """
+    Persistent cache of analyze_audio results.
+    Entries are keyed by a hash of the audio bytes plus the analysis parameters
+    and stored as uncompressed .npz files. Once the directory grows past
+    max_bytes the least recently used entries are evicted.
+    Counters are kept per process and mirrored to stats/<pid>-<token>.json so
+    stats() can report totals across worker processes sharing the directory;
+    retire_exited() folds those of exited processes into one file.
+    """
+    def __init__(self, cache_dir, max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats_dir = os.path.join(cache_dir, "stats")
+        self._reset_counts()
+        os.makedirs(self._stats_dir, exist_ok=True)
+
+    def _reset_counts(self):
+        # A forked child counts from zero under its own file, and a reused pid can't overwrite a dead process's counts
+        self._pid = os.getpid()
+        self._stats_path = os.path.join(self._stats_dir, f"{self._pid}-{uuid.uuid4().hex[:8]}.json")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, audio_path, params):
+        """Content hash of the audio file combined with the analysis parameters"""
+        h = hashlib.sha256()
+        h.update(json.dumps({"version": CACHE_VERSION, **params}, sort_keys=True).encode())
+        with open(audio_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def get(self, key):
+        """Return the cached analysis dict, or None on a miss"""
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                analysis = {k: entry[k].tolist() for k in ARRAY_KEYS}
+                analysis["frame_count"] = int(entry["frame_count"])
+                analysis["duration"] = float(entry["duration"])
+                analysis["feature_start"] = float(entry["feature_start"])
+                analysis["feature_step_ms"] = float(entry["feature_step_ms"])
+            # Touch the entry so eviction sees it as recently used
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        return analysis
+
+    def put(self, key, analysis):
+        arrays = {k: np.asarray(analysis[k]) for k in ARRAY_KEYS}
+        arrays.update({k: np.asarray(analysis[k]) for k in SCALAR_KEYS})
+
+        # Write to a temp file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._evict()
+
+    def stats(self):
+        """Counters summed over every process using this cache directory"""
+        totals = dict.fromkeys(COUNTERS, 0)
+        for name in os.listdir(self._stats_dir):
+            if name.endswith(".json"):
+                _add_counts(totals, os.path.join(self._stats_dir, name))
+
+        entries = self._entries()
+        lookups = totals["hits"] + totals["misses"]
+        return {
+            **totals,
+            "hit_rate": totals["hits"] / lookups if lookups else 0.0,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes
+        }
+
+    def retire_exited(self):
+        """
+        Fold the counter files of processes that have exited into RETIRED_STATS
+        and remove them; not safe to run in two processes at once (the storage
+        sweeper takes turns). Returns the number removed.
+        """
+        exited = [name for name in os.listdir(self._stats_dir) if exited_process_file(name)]
+        if not exited: return 0
+        retired_path = os.path.join(self._stats_dir, RETIRED_STATS)
+        retired = _add_counts(dict.fromkeys(COUNTERS, 0), retired_path)
+        for name in exited:
+            _add_counts(retired, os.path.join(self._stats_dir, name))
+        _write_json(retired_path, retired)
+        for name in exited:
+            try:
+                os.remove(os.path.join(self._stats_dir, name))
+            except FileNotFoundError:
+                pass
+        return len(exited)
+
+    def _count(self, counter, n=1):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset_counts()
+            setattr(self, counter, getattr(self, counter) + n)
+            _write_json(self._stats_path, {k: getattr(self, k) for k in COUNTERS})
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _entries(self):
+        """(path, size, last_used) for every entry in the cache directory"""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for e in it:
+                if not e.name.endswith(".npz"): continue
+                try:
+                    st = e.stat()
+                except FileNotFoundError:
+                    continue # Evicted by another worker
+                entries.append((e.path, st.st_size, st.st_mtime))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes: return
+
+        # Oldest first
+        entries.sort(key=lambda e: e[2])
+        for path, size, _ in entries:
+            if total <= self.max_bytes: break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self._count("evictions")
+
+def _add_counts(totals, path):
+    try:
+        with open(path) as f:
+            counts = json.load(f)
+    except (OSError, ValueError):
+        return totals
+    for k in totals:
+        totals[k] += counts.get(k, 0)
+    return totals
+
+def _write_json(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,127 @@
+import json
+import math
+import os
+import struct
+import tempfile
+import numpy as np
+
+# Binary analysis container:
+# b"LSA1", header length (uint32 LE), JSON header padded with spaces to a
+# multiple of 8 bytes, then each array as raw little-endian values.
+# header["arrays"] maps name -> {"dtype", "offset", "count"} where offset is
+# relative to the end of the header and always 8-byte aligned, so a browser
+# can view each array in place with new Float32Array(buffer, 8 + header_length + offset, count).
+MAGIC = b"LSA1"
+PREFIX = struct.Struct("<4sI")
+MIME_TYPE = "application/vnd.lightshow.analysis"
+
+FEATURE_KEYS = ("rms", "spectral_centroid") # One value every feature_step_ms from feature_start
+EVENT_KEYS = ("beat_times", "onset_times") # Times in seconds
+META_KEYS = ("frame_count", "duration", "feature_start", "feature_step_ms")
+FEATURE_DTYPES = {"float16": "<f2", "float32": "<f4"}
+EVENT_DTYPE = "<f8"
+
+class AnalysisFormatError(Exception):
+    pass
+
+def _align(n):
+    return (n + 7) // 8 * 8
+
+def encode(meta, arrays):
+    """Pack a JSON-serializable meta dict and {name: array} into the container"""
+    layout, offset = {}, 0
+    for name, values in arrays.items():
+        layout[name] = {"dtype": values.dtype.str, "offset": offset, "count": len(values)}
+        offset = _align(offset + values.nbytes)
+
+    header = json.dumps({**meta, "arrays": layout}).encode()
+    header += b" " * (_align(PREFIX.size + len(header)) - PREFIX.size - len(header))
+
+    parts = [PREFIX.pack(MAGIC, len(header)), header]
+    for name, values in arrays.items():
+        data = np.ascontiguousarray(values).tobytes()
+        parts.append(data + b"\0" * (_align(len(data)) - len(data)))
+    return b"".join(parts)
+
+def decode(data):
+    """(meta, {name: array}) from container bytes"""
+    meta, data_offset = _parse_header(data[:PREFIX.size], lambda n: data[PREFIX.size:PREFIX.size + n])
+    arrays = {}
+    for name, info in meta.pop("arrays").items():
+        arrays[name] = np.frombuffer(data, dtype=info["dtype"], count=info["count"],
+                                     offset=data_offset + info["offset"])
+    return meta, arrays
+
+def _parse_header(prefix, read):
+    if len(prefix) < PREFIX.size:
+        raise AnalysisFormatError("Truncated analysis payload")
+    magic, header_length = PREFIX.unpack(prefix)
+    if magic != MAGIC:
+        raise AnalysisFormatError("Unknown analysis payload format")
+    try:
+        meta = json.loads(read(header_length))
+    except ValueError:
+        raise AnalysisFormatError("Invalid analysis payload header")
+    return meta, PREFIX.size + header_length
+
+def analysis_arrays(analysis, feature_dtype="<f4"):
+    """The analysis dict's arrays in container dtypes"""
+    arrays = {k: np.asarray(analysis[k], dtype=EVENT_DTYPE) for k in EVENT_KEYS}
+    arrays.update({k: np.asarray(analysis[k], dtype=feature_dtype) for k in FEATURE_KEYS})
+    return arrays
+
+def save_analysis(path, analysis):
+    """Write an analyze_audio result to path (atomic replace), features as float32"""
+    payload = encode({k: analysis[k] for k in META_KEYS}, analysis_arrays(analysis))
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class AnalysisFile:
+    """
+    Reader for a saved analysis container. Arrays are memory-mapped, so
+    fetching one feature or a short time window only touches those bytes.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.meta, self.data_offset = _parse_header(f.read(PREFIX.size), f.read)
+        self.layout = self.meta.pop("arrays", {})
+        if not all(k in self.meta for k in META_KEYS):
+            raise AnalysisFormatError("Analysis payload is missing metadata")
+
+    def array(self, name):
+        """Read-only view of a stored array"""
+        info = self.layout.get(name)
+        if info is None:
+            raise KeyError(name)
+        if info["count"] == 0:
+            return np.zeros(0, dtype=info["dtype"])
+        return np.memmap(self.path, dtype=info["dtype"], mode="r",
+                         offset=self.data_offset + info["offset"], shape=(info["count"],))
+
+    @property
+    def feature_step_s(self):
+        return self.meta["feature_step_ms"] / 1000
+
+    def window(self, name, start_s=None, end_s=None):
+        """
+        (start, values) of name over [start_s, end_s).
+        For features start is the time of values[0]; events are filtered by time.
+        """
+        values = self.array(name)
+        if name in EVENT_KEYS:
+            lo = 0 if start_s is None else np.searchsorted(values, start_s)
+            hi = len(values) if end_s is None else np.searchsorted(values, end_s)
+            return (0.0 if start_s is None else start_s), values[lo:hi]
+
+        first = self.meta["feature_start"]
+        lo = 0 if start_s is None else max(0, math.ceil((start_s - first) / self.feature_step_s))
+        hi = len(values) if end_s is None else max(lo, math.ceil((end_s - first) / self.feature_step_s))
+        return first + lo * self.feature_step_s, values[lo:hi]
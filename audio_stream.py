@@ -0,0 +1,138 @@
+import numpy as np
+# librosa, soundfile and soxr are imported where they're used, so importing
+# this module (e.g. for the constants) doesn't load the audio stack
+
+# Same framing as librosa's defaults for rms, spectral_centroid and onset_strength
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+TOP_DB = 80.0
+AMIN = 1e-10
+BLOCK_SIZE = 1 << 18 # Samples read at a time (~6 s at 44.1 kHz)
+TEMPO_AC_SIZE = 8.0 # Seconds of onset envelope per tempogram column (librosa's default)
+TEMPOGRAM_CHUNK = 1024 # Tempogram columns computed at a time
+
+class StreamingFeatures:
+    """
+    Incremental RMS, spectral centroid and onset strength over audio fed in
+    blocks of any size. Frames are centered like librosa (n_fft // 2 zeros
+    of padding at both ends), so the results line up with the whole-file
+    features. The only difference is that onset strength clips quiet bins
+    at 80 dB below the loudest bin seen so far rather than in the whole
+    track. Memory is bounded by the block size plus the per-frame outputs.
+    """
+    def __init__(self, sr, hop_length=HOP_LENGTH, n_fft=N_FFT):
+        import librosa
+        self.sr = sr
+        self.hop_length = hop_length
+        self.n_fft = n_fft
+        self.sample_count = 0
+        self.window = librosa.filters.get_window("hann", self.n_fft, fftbins=True).astype(np.float32)
+        self.freqs = librosa.fft_frequencies(sr=sr, n_fft=self.n_fft).astype(np.float32)
+        self.mel_basis = librosa.filters.mel(sr=sr, n_fft=self.n_fft, n_mels=N_MELS).T.astype(np.float32)
+
+        self._buffer = np.zeros(self.n_fft // 2, dtype=np.float32) # Leading center padding
+        self._max_db = -np.inf
+        self._prev_db = None # Unclipped dB of the last frame, for the onset difference
+        self._rms, self._centroid, self._onset_mean, self._onset_median = [], [], [], []
+
+    def feed(self, samples):
+        """Add mono samples"""
+        samples = np.asarray(samples, dtype=np.float32)
+        self.sample_count += len(samples)
+        self._buffer = np.concatenate([self._buffer, samples])
+
+        frame_count = (len(self._buffer) - self.n_fft) // self.hop_length + 1
+        if frame_count <= 0: return
+        frames = np.lib.stride_tricks.sliding_window_view(self._buffer, self.n_fft)[::self.hop_length][:frame_count]
+        self._process(frames)
+        # Keep what the next frame still overlaps
+        self._buffer = self._buffer[frame_count * self.hop_length:].copy()
+
+    def finish(self):
+        """Flush the trailing padding and return the features as arrays"""
+        self.feed(np.zeros(self.n_fft // 2, dtype=np.float32))
+        self.sample_count -= self.n_fft // 2
+
+        frame_count = 1 + self.sample_count // self.hop_length
+        rms = np.concatenate(self._rms)[:frame_count]
+        centroid = np.concatenate(self._centroid)[:frame_count]
+
+        # Onset envelopes are shifted by lag + n_fft // (2 * hop) frames, as in librosa
+        pad = np.zeros(1 + self.n_fft // (2 * self.hop_length), dtype=np.float32)
+        onset_mean = np.concatenate([pad] + self._onset_mean)[:frame_count]
+        onset_median = np.concatenate([pad] + self._onset_median)[:frame_count]
+        return rms, centroid, onset_mean, onset_median
+
+    def _process(self, frames):
+        self._rms.append(np.sqrt(np.mean(frames ** 2, axis=1)))
+
+        magnitude = np.abs(np.fft.rfft(frames * self.window, axis=1)).astype(np.float32)
+        # Spectral centroid, silent frames stay 0
+        total = magnitude.sum(axis=1)
+        weighted = magnitude @ self.freqs
+        self._centroid.append(np.divide(weighted, total, out=np.zeros_like(weighted), where=total > np.finfo(np.float32).tiny))
+
+        # Mel power in dB, clipped to TOP_DB below the running maximum
+        db = 10.0 * np.log10(np.maximum(AMIN, (magnitude ** 2) @ self.mel_basis))
+        self._max_db = max(self._max_db, float(db.max()))
+        if self._prev_db is not None:
+            db = np.vstack([self._prev_db, db])
+        self._prev_db = db[-1:]
+        clipped = np.maximum(db, self._max_db - TOP_DB)
+
+        flux = np.maximum(0.0, clipped[1:] - clipped[:-1])
+        if len(flux):
+            self._onset_mean.append(flux.mean(axis=1))
+            self._onset_median.append(np.median(flux, axis=1))
+
+def estimate_tempo(onset_envelope, sr, hop_length=HOP_LENGTH, chunk=TEMPOGRAM_CHUNK):
+    """
+    Global tempo estimate, the same as librosa.feature.tempo (which
+    beat_track calls when no bpm is given). The mean tempogram is
+    accumulated a chunk of columns at a time instead of building the
+    whole (window, frames) tempogram, which takes gigabytes for long tracks.
+    """
+    import librosa
+    win_length = librosa.time_to_frames(TEMPO_AC_SIZE, sr=sr, hop_length=hop_length).item()
+    window = librosa.filters.get_window("hann", win_length, fftbins=True)
+    n = len(onset_envelope)
+    padded = np.pad(onset_envelope, win_length // 2, mode="linear_ramp", end_values=[0, 0])
+    frames = np.lib.stride_tricks.sliding_window_view(padded, win_length)
+
+    total = np.zeros(win_length)
+    for start in range(0, n, chunk):
+        ac = librosa.autocorrelate(frames[start:min(start + chunk, n)] * window, axis=-1)
+        total += librosa.util.normalize(ac, norm=np.inf, axis=-1).sum(axis=0)
+
+    return librosa.feature.tempo(tg=(total / max(n, 1))[:, None], sr=sr, hop_length=hop_length, aggregate=None)
+
+def stream_features(audio_path, sr, hop_length=HOP_LENGTH, n_fft=N_FFT, block_size=BLOCK_SIZE):
+    """
+    Read audio_path in blocks, mixed to mono and resampled to sr like
+    librosa.load, and compute StreamingFeatures over it.
+    Returns (rms, centroid, onset_mean, onset_median, sample_count).
+    """
+    import soundfile as sf
+    import soxr
+    features = StreamingFeatures(sr, hop_length, n_fft)
+    with sf.SoundFile(audio_path) as f:
+        resampler = None
+        if f.samplerate != sr:
+            resampler = soxr.ResampleStream(f.samplerate, sr, 1, dtype="float32", quality="HQ")
+        expected = int(np.ceil(f.frames * sr / f.samplerate)) # librosa.resample's output length
+
+        for block in f.blocks(blocksize=block_size, dtype="float32", always_2d=True):
+            mono = block.mean(axis=1)
+            if resampler is not None:
+                mono = resampler.resample_chunk(mono)
+                mono = mono[:max(0, expected - features.sample_count)]
+            features.feed(mono)
+
+        if resampler is not None:
+            tail = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+            tail = tail[:max(0, expected - features.sample_count)]
+            # Zero fill any shortfall, as librosa.util.fix_length does
+            tail = np.concatenate([tail, np.zeros(max(0, expected - features.sample_count - len(tail)), dtype=np.float32)])
+            features.feed(tail)
+    return features.finish() + (features.sample_count,)
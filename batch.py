@@ -0,0 +1,289 @@
+# Generates shows for whole music libraries in the USB drive layout:
+#   python batch.py music/ playlist.m3u --output usb/ [--workers 4] [--channels 200]
+# writes usb/LightShow/<name>.fseq next to usb/LightShow/<name>.wav for every track.
+import argparse
+import contextlib
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from channel_layout import LAYOUT_CHANNEL_COUNTS
+
+SHOW_FOLDER = "LightShow" # Base-level folder on the USB drive (case sensitive)
+STATE_FILE = ".lightshow-batch.json" # Next to SHOW_FOLDER, so the drive's show folder only holds shows
+# Bump when the generated shows change for the same inputs so everything is regenerated
+BATCH_VERSION = 1
+AUDIO_INPUT_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".aif", ".aiff", ".m4a")
+SHOW_AUDIO_EXTENSIONS = (".wav", ".mp3") # What the car plays
+MANIFEST_EXTENSIONS = (".txt", ".m3u", ".m3u8", ".json")
+NAME_PATTERN = re.compile(r"[^A-Za-z0-9 ._()-]+") # Anything else in a show name becomes "_"
+MAX_NAME_LENGTH = 64
+HASH_CHUNK_BYTES = 1024 * 1024
+TMP_SUFFIX = ".tmp"
+
+class BatchError(Exception):
+    pass
+
+def _read_manifest(path):
+    """Audio paths listed in a manifest: .json (list of paths) or one path per line (.txt, .m3u), '#' comments"""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8-sig") as f:
+        if path.lower().endswith(".json"):
+            entries = json.load(f)
+            if not isinstance(entries, list) or not all(isinstance(e, str) for e in entries):
+                raise BatchError(f"{path}: expected a JSON list of paths")
+        else:
+            entries = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    return [os.path.join(base, e) for e in entries] # Relative entries are relative to the manifest
+
+def expand_inputs(inputs):
+    """Audio files from files, directories (recursively), globs and manifests, in order, without repeats"""
+    found = []
+
+    def add(path):
+        if os.path.isdir(path):
+            for dirpath, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if d != SHOW_FOLDER) # Don't pick up generated shows
+                found.extend(os.path.join(dirpath, f) for f in sorted(files)
+                             if f.lower().endswith(AUDIO_INPUT_EXTENSIONS))
+        elif path.lower().endswith(MANIFEST_EXTENSIONS):
+            for entry in _read_manifest(path):
+                add(entry)
+        else:
+            found.append(path)
+
+    for item in inputs:
+        if os.path.exists(item):
+            add(item)
+        else:
+            matches = sorted(glob.glob(item, recursive=True))
+            if not matches:
+                raise BatchError(f"No such file or directory: {item}")
+            for match in matches:
+                add(match)
+
+    seen, tracks = set(), []
+    for path in found:
+        real = os.path.realpath(path)
+        if real in seen: continue
+        seen.add(real)
+        tracks.append(path)
+    return tracks
+
+def show_names(tracks):
+    """
+    Show name for every track: its file name made safe for a FAT32 drive,
+    with " (2)", " (3)"... added where names collide (case-insensitively).
+    """
+    names, taken = [], set()
+    for path in tracks:
+        stem = NAME_PATTERN.sub("_", os.path.splitext(os.path.basename(path))[0]).strip(" .")[:MAX_NAME_LENGTH] or "show"
+        name, n = stem, 1
+        while name.lower() in taken:
+            n += 1
+            name = f"{stem} ({n})"
+        taken.add(name.lower())
+        names.append(name)
+    return names
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class BatchState:
+    """
+    What each show in an output folder was generated from: {name: {source,
+    sha256, size, mtime_ns, params}}. Saved after every show, so an
+    interrupted run picks up where it stopped. Sources whose size and mtime
+    match the state keep their recorded hash instead of being read again.
+    """
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, STATE_FILE)
+        try:
+            with open(self.path) as f:
+                self.shows = json.load(f)["shows"]
+        except (OSError, ValueError, KeyError):
+            self.shows = {}
+
+    def source_hash(self, name, path):
+        st = os.stat(path)
+        entry = self.shows.get(name)
+        if entry and entry["source"] == os.path.abspath(path) and (entry["size"], entry["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+            return entry["sha256"]
+        return file_hash(path)
+
+    def is_current(self, name, sha256, params, show_dir):
+        entry = self.shows.get(name)
+        if entry is None or entry["sha256"] != sha256 or entry["params"] != params: return False
+        return all(os.path.exists(os.path.join(show_dir, name + ext)) for ext in (".fseq", entry["audio_ext"]))
+
+    def record(self, name, path, sha256, params, audio_ext, save=True):
+        st = os.stat(path)
+        entry = {"source": os.path.abspath(path), "sha256": sha256, "size": st.st_size,
+                 "mtime_ns": st.st_mtime_ns, "params": params, "audio_ext": audio_ext}
+        if self.shows.get(name) == entry: return
+        self.shows[name] = entry
+        if save:
+            self.save()
+
+    def save(self):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=TMP_SUFFIX)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"version": BATCH_VERSION, "shows": self.shows}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+# Per-process generator, set up by _init_worker
+_generator = None
+
+def _init_worker(channel_count, aligned, cache_dir):
+    global _generator
+    from generator import TeslaLightShowGenerator
+    from analysis_cache import AnalysisCache
+    cache = AnalysisCache(cache_dir) if cache_dir else None
+    _generator = TeslaLightShowGenerator(cache=cache, aligned=aligned, channel_count=channel_count)
+
+def _write_audio(source, target, keep_mp3):
+    """Copy .wav (and .mp3 with keep_mp3) sources, transcode anything else to 16-bit .wav. Returns the extension used."""
+    import soundfile as sf
+    ext = os.path.splitext(source)[1].lower()
+    if ext == ".wav" or (keep_mp3 and ext == ".mp3"):
+        shutil.copyfile(source, target + ext)
+        return ext
+
+    # Block at a time where libsndfile can read it, otherwise whole through librosa (audioread/ffmpeg)
+    try:
+        with sf.SoundFile(source) as f, sf.SoundFile(target + ".wav", "w", f.samplerate, f.channels,
+                                                     subtype="PCM_16", format="WAV") as out:
+            for block in f.blocks(blocksize=HASH_CHUNK_BYTES // 4, dtype="float32", always_2d=True):
+                out.write(block)
+    except sf.LibsndfileError:
+        import librosa
+        y, sr = librosa.load(source, sr=None, mono=False)
+        sf.write(target + ".wav", y.T, sr, subtype="PCM_16", format="WAV")
+    return ".wav"
+
+def _generate(source, show_dir, name, keep_mp3):
+    """Worker side: write <name>.fseq and the show audio into show_dir. Returns (audio extension, duration, seconds taken)."""
+    started = time.perf_counter()
+    # Written under temporary names and renamed when complete, so an interrupted run leaves no half shows
+    tmp = os.path.join(show_dir, f".{name}{TMP_SUFFIX}")
+    with contextlib.redirect_stdout(io.StringIO()): # Keep the generator's progress out of the JSON lines
+        analysis = _generator.analyze_audio(source)
+        _generator.generate_fseq(analysis, tmp + ".fseq")
+    audio_ext = _write_audio(source, tmp, keep_mp3)
+    for ext in (".fseq", audio_ext):
+        os.replace(tmp + ext, os.path.join(show_dir, name + ext))
+    # A show regenerated with the other audio format would otherwise have two audio files
+    for ext in SHOW_AUDIO_EXTENSIONS:
+        if ext != audio_ext and os.path.exists(os.path.join(show_dir, name + ext)):
+            os.remove(os.path.join(show_dir, name + ext))
+    return audio_ext, analysis["duration"], time.perf_counter() - started
+
+def _remove_partial(show_dir):
+    """Temporary files left by an interrupted run"""
+    for entry in os.listdir(show_dir):
+        stem, ext = os.path.splitext(entry)
+        if entry.startswith(".") and stem.endswith(TMP_SUFFIX) and ext in (".fseq",) + SHOW_AUDIO_EXTENSIONS:
+            os.remove(os.path.join(show_dir, entry))
+
+def batch_generate(inputs, output_dir, workers=None, channel_count=48, aligned=False, cache_dir=None,
+                   keep_mp3=False, force=False):
+    """
+    Generates a show for every audio file found in inputs into
+    output_dir/LightShow, in parallel worker processes. Yields one record
+    per track as they finish (status generated, skipped or failed),
+    followed by a {"summary": ...} record.
+    """
+    started = time.perf_counter()
+    tracks = expand_inputs(inputs)
+    show_dir = os.path.join(output_dir, SHOW_FOLDER)
+    os.makedirs(show_dir, exist_ok=True)
+    _remove_partial(show_dir)
+    state = BatchState(output_dir)
+    params = {"version": BATCH_VERSION, "channel_count": channel_count, "aligned": aligned, "keep_mp3": keep_mp3}
+    summary = {"tracks": len(tracks), "generated": 0, "skipped": 0, "failed": 0}
+
+    pending = []
+    for path, name in zip(tracks, show_names(tracks)):
+        try:
+            sha256 = state.source_hash(name, path)
+        except OSError as e:
+            summary["failed"] += 1
+            yield {"source": path, "name": name, "status": "failed", "error": str(e)}
+            continue
+        if not force and state.is_current(name, sha256, params, show_dir):
+            # Same content (maybe touched or moved), remember the new size/mtime so it isn't hashed again
+            state.record(name, path, sha256, params, state.shows[name]["audio_ext"], save=False)
+            summary["skipped"] += 1
+            yield {"source": path, "name": name, "status": "skipped"}
+        else:
+            pending.append((path, name, sha256))
+
+    state.save()
+
+    if pending:
+        # Forked workers start with librosa's kernels already compiled
+        from generator import warm_up
+        warm_up(aligned=aligned)
+
+        executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, initializer=_init_worker,
+                                       initargs=(channel_count, aligned, cache_dir))
+        try:
+            futures = {executor.submit(_generate, path, show_dir, name, keep_mp3): (path, name, sha256)
+                       for path, name, sha256 in pending}
+            for future in as_completed(futures):
+                path, name, sha256 = futures[future]
+                try:
+                    audio_ext, duration, seconds = future.result()
+                except Exception as e:
+                    summary["failed"] += 1
+                    yield {"source": path, "name": name, "status": "failed", "error": str(e)}
+                    continue
+                state.record(name, path, sha256, params, audio_ext)
+                summary["generated"] += 1
+                yield {"source": path, "name": name, "status": "generated", "audio": name + audio_ext,
+                       "duration_s": round(duration, 3), "elapsed_s": round(seconds, 3)}
+        finally:
+            # On interruption, queued tracks are dropped; finished ones are already in the state
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    summary["elapsed_s"] = round(time.perf_counter() - started, 3)
+    yield {"summary": summary}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate light shows for many tracks into a USB drive LightShow folder")
+    parser.add_argument("inputs", nargs="+", help="audio files, directories, globs, or manifests (.txt/.m3u lists, .json arrays of paths)")
+    parser.add_argument("--output", "-o", required=True, help="USB drive root (or a folder to copy onto one); shows go in its LightShow folder")
+    parser.add_argument("--workers", type=int, default=None, help="parallel generations (default: CPU count)")
+    parser.add_argument("--channels", type=int, choices=LAYOUT_CHANNEL_COUNTS, default=48, help="channel layout (default: 48)")
+    parser.add_argument("--aligned", action="store_true", help="frame-aligned analysis (faster, one feature frame per light frame)")
+    parser.add_argument("--cache", help="analysis cache directory, shared with the server's if you like")
+    parser.add_argument("--keep-mp3", action="store_true", help="copy .mp3 tracks as they are instead of transcoding them to .wav")
+    parser.add_argument("--force", action="store_true", help="regenerate shows even if their track hasn't changed")
+    args = parser.parse_args()
+
+    ok = True
+    try:
+        for record in batch_generate(args.inputs, args.output, workers=args.workers, channel_count=args.channels,
+                                     aligned=args.aligned, cache_dir=args.cache, keep_mp3=args.keep_mp3, force=args.force):
+            if record.get("status") == "failed":
+                ok = False
+            print(json.dumps(record), flush=True)
+    except BatchError as e:
+        print(e)
+        sys.exit(2)
+    except KeyboardInterrupt:
+        print("Interrupted, run again to continue where this stopped")
+        sys.exit(130)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,90 @@
+"""
+Benchmark the default analysis against the frame-aligned one
+(TeslaLightShowGenerator(aligned=True)) on synthetic tracks.
+
+Usage: python benchmarks/bench_analysis.py [--streaming]
+
+For each track length prints analysis time, JSON payload size, how many
+beats and onsets the aligned analysis finds within one light frame of the
+default ones, and how many channel values differ in the generated .fseq.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from generator import TeslaLightShowGenerator
+from fixtures import make_audio
+
+
+def event_agreement(expected, actual, tolerance_s):
+    """Fraction of expected event times that have an actual event within tolerance_s"""
+    expected, actual = np.asarray(expected), np.asarray(actual)
+    if len(expected) == 0: return 1.0
+    if len(actual) == 0: return 0.0
+    idx = np.clip(np.searchsorted(actual, expected), 1, len(actual) - 1)
+    nearest = np.minimum(np.abs(actual[idx - 1] - expected), np.abs(actual[idx] - expected))
+    return float(np.mean(nearest <= tolerance_s))
+
+
+def timed_analysis(generator, path):
+    t0 = time.perf_counter()
+    analysis = generator.analyze_audio(path)
+    return analysis, time.perf_counter() - t0
+
+
+def fseq_bytes(generator, analysis, path):
+    generator.generate_fseq(analysis, path)
+    with open(path, 'rb') as f:
+        return np.frombuffer(f.read(), dtype=np.uint8)
+
+
+def main():
+    streaming = '--streaming' in sys.argv
+    durations = [60, 300, 900]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        audio = os.path.join(tmp, 'bench.wav')
+        out = os.path.join(tmp, 'bench.fseq')
+        # First librosa calls pay for numba compilation, keep that out of the timings
+        make_audio(audio, 5)
+        for aligned in (False, True):
+            TeslaLightShowGenerator(streaming=streaming, aligned=aligned).analyze_audio(audio)
+
+        for duration_s in durations:
+            make_audio(audio, duration_s)
+            default = TeslaLightShowGenerator(streaming=streaming)
+            aligned = TeslaLightShowGenerator(streaming=streaming, aligned=True)
+            full, full_s = timed_analysis(default, audio)
+            fast, fast_s = timed_analysis(aligned, audio)
+
+            tolerance = default.frame_interval
+            full_fseq = fseq_bytes(default, full, out)
+            fast_fseq = fseq_bytes(aligned, fast, out)
+            results.append({
+                'duration_s': duration_s,
+                'default_s': round(full_s, 3),
+                'aligned_s': round(fast_s, 3),
+                'default_json_bytes': len(json.dumps(full)),
+                'aligned_json_bytes': len(json.dumps(fast)),
+                'beat_agreement': round(event_agreement(full['beat_times'], fast['beat_times'], tolerance), 4),
+                'onset_agreement': round(event_agreement(full['onset_times'], fast['onset_times'], tolerance), 4),
+                'fseq_bytes_differing': round(float(np.mean(full_fseq != fast_fseq)), 5),
+            })
+
+    print(f"{'duration':>9} {'default s':>10} {'aligned s':>10} {'default KB':>11} {'aligned KB':>11} "
+          f"{'beats':>6} {'onsets':>7} {'fseq diff':>10}")
+    for r in results:
+        print(f"{r['duration_s']:>8}s {r['default_s']:>10.3f} {r['aligned_s']:>10.3f} "
+              f"{r['default_json_bytes'] / 1024:>11.0f} {r['aligned_json_bytes'] / 1024:>11.0f} "
+              f"{r['beat_agreement']:>6.1%} {r['onset_agreement']:>7.1%} {r['fseq_bytes_differing']:>10.3%}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
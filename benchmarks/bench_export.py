@@ -0,0 +1,116 @@
+"""
+Benchmark ProjectExporter.export_single against clip count and show length.
+
+Usage: python benchmarks/bench_export.py [--check]
+
+--check also renders every project with the original per-frame loop and
+verifies the exported bytes are identical.
+"""
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from exporter import ProjectExporter
+
+EFFECTS = ['flash', 'pulse', 'strobe']
+
+
+def make_project(clip_count, duration_s, seed=0):
+    """Random single-layer-per-10-clips project spread over the whole show"""
+    rng = random.Random(seed)
+    duration_ms = duration_s * 1000
+    layers = []
+    for i in range(clip_count):
+        if i % 10 == 0:
+            layers.append({'id': f'layer-{len(layers)}', 'muted': False, 'clips': []})
+        dur = rng.randint(100, 20000)
+        layers[-1]['clips'].append({
+            'startTime': rng.uniform(0, duration_ms - dur),
+            'duration': dur,
+            'type': rng.choice(['effect', 'effect', 'pattern']),
+            'effectType': rng.choice(EFFECTS),
+            'speed': rng.choice([0.5, 1, 2, 4]),
+            'channels': rng.sample(range(48), rng.randint(1, 8)),
+            'fadeIn': rng.choice([0, 0, 250, 1000]),
+            'fadeOut': rng.choice([0, 0, 250, 1000]),
+        })
+    return {'duration': duration_ms, 'layers': layers}
+
+
+def reference_render_clip(exporter, clip, data):
+    """The original frame-by-frame renderer, kept for output comparison"""
+    start_ms = clip.get('startTime', 0)
+    dur_ms = clip.get('duration', 1000)
+    start_frame = max(0, int(start_ms / exporter.step_time_ms))
+    end_frame = min(exporter.frame_count, int((start_ms + dur_ms) / exporter.step_time_ms))
+    if start_frame >= end_frame: return
+    clip_type = clip.get('type', 'effect')
+    channels = clip.get('channels', [])
+    fade_in_ms = clip.get('fadeIn', 0)
+    fade_out_ms = clip.get('fadeOut', 0)
+    for f in range(start_frame, end_frame):
+        rel_time_ms = (f * exporter.step_time_ms) - start_ms
+        intensity = 1.0
+        if fade_in_ms > 0 and rel_time_ms < fade_in_ms:
+            intensity = rel_time_ms / fade_in_ms
+        elif fade_out_ms > 0 and rel_time_ms > (dur_ms - fade_out_ms):
+            intensity = (dur_ms - rel_time_ms) / fade_out_ms
+        val = int(255 * intensity)
+        if clip_type == 'effect':
+            eff_type = clip.get('effectType', 'flash')
+            if eff_type == 'pulse':
+                freq = clip.get('speed', 1)
+                sine = (math.sin(rel_time_ms / 1000.0 * math.pi * 2 * freq) + 1) / 2
+                val = int(val * sine)
+            elif eff_type == 'strobe':
+                if (f % 6) < 3: val = 0
+        if clip_type in ('effect', 'pattern'):
+            for ch in channels:
+                if ch < exporter.channel_count:
+                    data[f, ch] = max(data[f, ch], val)
+
+
+def reference_export(project):
+    exporter = ProjectExporter(project)
+    data = np.zeros((exporter.frame_count, exporter.channel_count), dtype=np.uint8)
+    for layer in project['layers']:
+        if layer.get('muted'): continue
+        for clip in layer['clips']:
+            reference_render_clip(exporter, clip, data)
+    return data
+
+
+def main():
+    check = '--check' in sys.argv
+    clip_counts = [10, 100, 500]
+    durations = [60, 600, 3600, 4 * 3600]
+
+    print(f"{'clips':>6} {'duration':>9} {'export s':>9}" + (f" {'reference s':>12} {'identical':>9}" if check else ""))
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, 'bench.fseq')
+        for duration_s in durations:
+            for clip_count in clip_counts:
+                project = make_project(clip_count, duration_s)
+                t0 = time.perf_counter()
+                ProjectExporter(project).export_single(out)
+                elapsed = time.perf_counter() - t0
+                line = f"{clip_count:>6} {duration_s:>8}s {elapsed:>9.3f}"
+                if check:
+                    t0 = time.perf_counter()
+                    expected = reference_export(project)
+                    ref_elapsed = time.perf_counter() - t0
+                    with open(out, 'rb') as f:
+                        f.seek(24)
+                        identical = f.read() == expected.tobytes()
+                    line += f" {ref_elapsed:>12.3f} {str(identical):>9}"
+                print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark server and analysis startup: how long a fresh process takes to
+import the server, and what the first analysis costs cold, in the process
+that ran generator.warm_up(), and in a process forked after it (as gunicorn
+workers and job processes are with gunicorn.conf.py's preload and warm-up).
+
+Usage: python benchmarks/bench_startup.py [--repeat N] [--duration 10] [--output startup.json]
+
+Every case runs in a new interpreter, so imports and numba compilation are
+measured from scratch each time (librosa's on-disk numba cache still applies).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+CASES = ('import_server', 'export_cold', 'analysis_cold', 'warm_up', 'analysis_after_warm_up', 'analysis_forked')
+
+
+def audio_stack_loaded():
+    return 'scipy' in sys.modules or 'numba' in sys.modules
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def run_case(case, audio):
+    """Child side: run one case in this (fresh) process and return its result dict"""
+    if case == 'import_server':
+        seconds = timed(lambda: __import__('server'))
+        return {'seconds': seconds, 'audio_stack_loaded': audio_stack_loaded()}
+
+    if case == 'export_cold':
+        from fixtures import make_editor_project
+        project = make_editor_project(10, 10, 60)
+
+        def export():
+            from exporter import ProjectExporter
+            with tempfile.TemporaryDirectory() as tmp:
+                ProjectExporter(project).export_single(os.path.join(tmp, 'export.fseq'))
+        seconds = timed(export)
+        return {'seconds': seconds, 'audio_stack_loaded': audio_stack_loaded()}
+
+    from generator import TeslaLightShowGenerator, warm_up
+    analyze = lambda: TeslaLightShowGenerator().analyze_audio(audio)
+    with contextlib.redirect_stdout(io.StringIO()):
+        if case == 'analysis_cold':
+            return {'seconds': timed(analyze)}
+        if case == 'warm_up':
+            return {'seconds': timed(warm_up)}
+
+        warm_up()
+        if case == 'analysis_after_warm_up':
+            return {'seconds': timed(analyze)}
+
+        # analysis_forked: time the first analysis in a child forked after the warm-up
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            with os.fdopen(write_fd, 'w') as f:
+                f.write(repr(timed(analyze)))
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            seconds = float(f.read())
+        os.waitpid(pid, 0)
+        return {'seconds': seconds}
+
+
+def run_fresh(case, audio, cwd):
+    """Run a case in a new interpreter (cwd is where the server creates its folders)"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.path.dirname(os.path.abspath(__file__))]))
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', case, '--audio', audio],
+                          cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark server import and first-analysis times, cold and warm')
+    parser.add_argument('--repeat', type=int, default=3, help='fresh processes per case (default: 3)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of audio analysed (default: 10)')
+    parser.add_argument('--output', help='where to write the results JSON')
+    parser.add_argument('--case', choices=CASES, help=argparse.SUPPRESS) # Child process mode
+    parser.add_argument('--audio', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.case, args.audio)))
+        return
+
+    from fixtures import make_audio
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        audio = os.path.join(tmp, 'startup.wav')
+        make_audio(audio, args.duration, channels=1, subtype='PCM_16')
+        print(f"{'case':<26} {'best s':>8} {'median s':>9}  notes")
+        for case in CASES:
+            runs = [run_fresh(case, audio, tmp) for _ in range(args.repeat)]
+            seconds = [r['seconds'] for r in runs]
+            result = {'case': case, 'best_s': round(min(seconds), 4),
+                      'median_s': round(statistics.median(seconds), 4), 'runs_s': [round(s, 4) for s in seconds]}
+            notes = ''
+            if 'audio_stack_loaded' in runs[0]:
+                result['audio_stack_loaded'] = any(r['audio_stack_loaded'] for r in runs)
+                notes = 'loads scipy/numba' if result['audio_stack_loaded'] else 'no scipy/numba'
+            results.append(result)
+            print(f"{case:<26} {result['best_s']:>8.3f} {result['median_s']:>9.3f}  {notes}", flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'duration_s': args.duration, 'repeat': args.repeat, 'results': results}, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Benchmark suite for the hot paths: analyze_audio, generate_fseq,
+generate_matrix_show, ProjectExporter.export_single/export_matrix and
+validator.validate/deep_validate, on synthetic audio, analyses and editor
+projects (see fixtures.py).
+
+Usage: python benchmarks/bench_suite.py [--suite quick|full] [--only NAME]
+           [--repeat N] [--output results.json] [--baseline old.json]
+           [--tolerance 0.1]
+
+Every case records wall time (best of --repeat), throughput, peak RSS and
+peak RSS above what the process held before the case. Results are written
+as JSON; with --baseline each case is compared against the same case in
+an earlier results file, and the exit status is 1 if any case got slower
+by more than --tolerance.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from generator import TeslaLightShowGenerator
+from exporter import ProjectExporter
+from metrics import reset_peak_rss, peak_rss_bytes
+import validator
+from fixtures import make_audio, make_analysis, make_editor_project, AUDIO_KINDS
+
+RESULTS_VERSION = 1
+MAX_DURATION_S = 4 * 3600 # Longest show a car accepts
+NOISE_FLOOR_S = 0.005 # Slowdowns smaller than this are never reported as regressions
+
+SUITES = {
+    'quick': (
+        [('analyze', {'kind': kind, 'duration_s': 30}) for kind in AUDIO_KINDS] +
+        [('analyze', {'kind': 'music', 'duration_s': 30, 'aligned': True}),
+         ('generate_fseq', {'duration_s': 600}),
+         ('generate_matrix_show', {'rows': 1, 'cols': 1, 'duration_s': 60}),
+         ('generate_matrix_show', {'rows': 10, 'cols': 10, 'duration_s': 60}),
+         ('export_single', {'layers': 10, 'clips': 10, 'duration_s': 600}),
+         ('export_single', {'layers': 10, 'clips': 10, 'duration_s': 600, 'beat_synced': 0.5}),
+         ('export_matrix', {'layers': 10, 'clips': 10, 'rows': 10, 'cols': 10, 'duration_s': 60}),
+         ('validate', {'duration_s': 600}),
+         ('deep_validate', {'duration_s': 600})]
+    ),
+    'full': (
+        [('analyze', {'kind': kind, 'duration_s': 60}) for kind in AUDIO_KINDS] +
+        [('analyze', {'kind': 'music', 'duration_s': 600}),
+         ('analyze', {'kind': 'music', 'duration_s': 600, 'aligned': True}),
+         ('analyze', {'kind': 'music', 'duration_s': 3600})] + # Streamed (>= 10 minutes)
+        [('generate_fseq', {'duration_s': d}) for d in (60, 3600, MAX_DURATION_S)] +
+        [('generate_matrix_show', {'rows': 1, 'cols': 1, 'duration_s': MAX_DURATION_S}),
+         ('generate_matrix_show', {'rows': 10, 'cols': 10, 'duration_s': 600}),
+         ('generate_matrix_show', {'rows': 50, 'cols': 50, 'duration_s': 60})] +
+        [('export_single', {'layers': layers, 'clips': clips, 'duration_s': d})
+         for layers, clips in ((1, 10), (10, 10), (10, 50)) for d in (60, 3600, MAX_DURATION_S)] +
+        [('export_single', {'layers': 10, 'clips': 10, 'duration_s': MAX_DURATION_S, 'beat_synced': 0.5})] +
+        [('export_matrix', {'layers': 10, 'clips': 10, 'rows': 1, 'cols': 1, 'duration_s': 3600}),
+         ('export_matrix', {'layers': 10, 'clips': 10, 'rows': 10, 'cols': 10, 'duration_s': 600}),
+         ('export_matrix', {'layers': 10, 'clips': 10, 'rows': 50, 'cols': 50, 'duration_s': 60})] +
+        [('validate', {'duration_s': MAX_DURATION_S}),
+         ('deep_validate', {'duration_s': MAX_DURATION_S})]
+    ),
+}
+
+
+# Each prepare_* builds a case's inputs in tmp (not timed) and returns
+# (run, amount, unit): run() is what's timed, throughput is amount/s of unit
+
+def prepare_analyze(tmp, kind, duration_s, aligned=False):
+    path = os.path.join(tmp, f'{kind}.wav')
+    make_audio(path, duration_s, kind=kind, channels=1, subtype='PCM_16')
+    generator = TeslaLightShowGenerator(aligned=aligned)
+    return lambda: generator.analyze_audio(path), duration_s, 'audio_s'
+
+
+def prepare_generate_fseq(tmp, duration_s):
+    analysis = make_analysis(duration_s)
+    generator = TeslaLightShowGenerator()
+    out = os.path.join(tmp, 'show.fseq')
+    return lambda: generator.generate_fseq(analysis, out), analysis['frame_count'], 'frames'
+
+
+def prepare_generate_matrix_show(tmp, rows, cols, duration_s):
+    analysis = make_analysis(duration_s)
+    generator = TeslaLightShowGenerator()
+    out = os.path.join(tmp, 'matrix')
+    return (lambda: generator.generate_matrix_show(analysis, out, rows, cols),
+            analysis['frame_count'] * rows * cols, 'car_frames')
+
+
+def prepare_export_single(tmp, layers, clips, duration_s, beat_synced=0.0):
+    project = make_editor_project(layers, clips, duration_s, beat_synced=beat_synced)
+    out = os.path.join(tmp, 'export.fseq')
+    return lambda: ProjectExporter(project).export_single(out), ProjectExporter(project).frame_count, 'frames'
+
+
+def prepare_export_matrix(tmp, layers, clips, rows, cols, duration_s):
+    project = make_editor_project(layers, clips, duration_s)
+    out = os.path.join(tmp, 'export.zip')
+    config = {'rows': rows, 'cols': cols}
+    return (lambda: ProjectExporter(project).export_matrix(out, config),
+            ProjectExporter(project).frame_count * rows * cols, 'car_frames')
+
+
+def _show_file(tmp, duration_s):
+    path = os.path.join(tmp, 'show.fseq')
+    with contextlib.redirect_stdout(io.StringIO()):
+        TeslaLightShowGenerator().generate_fseq(make_analysis(duration_s), path)
+    return path
+
+
+def prepare_validate(tmp, duration_s):
+    path = _show_file(tmp, duration_s)
+
+    def run():
+        with open(path, 'rb') as f:
+            validator.validate(f)
+    return run, os.path.getsize(path) / 1e6, 'MB'
+
+
+def prepare_deep_validate(tmp, duration_s):
+    path = _show_file(tmp, duration_s)
+    return lambda: validator.deep_validate(path), os.path.getsize(path) / 1e6, 'MB'
+
+
+PREPARE = {
+    'analyze': prepare_analyze,
+    'generate_fseq': prepare_generate_fseq,
+    'generate_matrix_show': prepare_generate_matrix_show,
+    'export_single': prepare_export_single,
+    'export_matrix': prepare_export_matrix,
+    'validate': prepare_validate,
+    'deep_validate': prepare_deep_validate,
+}
+
+
+def case_id(name, params):
+    return name + '[' + ','.join(f'{k}={v}' for k, v in sorted(params.items())) + ']'
+
+
+def rss_bytes():
+    """Current resident memory, or 0 where /proc isn't available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+def warm_up(tmp):
+    """First librosa calls pay for numba compilation, keep that out of the timings"""
+    path = os.path.join(tmp, 'warmup.wav')
+    make_audio(path, 5, channels=1, subtype='PCM_16')
+    for aligned in (False, True):
+        TeslaLightShowGenerator(aligned=aligned).analyze_audio(path)
+
+
+def run_case(name, params, repeat):
+    tmp = tempfile.mkdtemp(prefix='bench-')
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            run, amount, unit = PREPARE[name](tmp, **params)
+            walls, peak, peak_delta = [], 0, 0
+            for _ in range(repeat):
+                reset_peak_rss()
+                before = rss_bytes()
+                t0 = time.perf_counter()
+                run()
+                walls.append(time.perf_counter() - t0)
+                peak = max(peak, peak_rss_bytes())
+                peak_delta = max(peak_delta, peak_rss_bytes() - before)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    wall = min(walls)
+    return {
+        'id': case_id(name, params),
+        'name': name,
+        'params': params,
+        'wall_s': round(wall, 6),
+        'wall_median_s': round(statistics.median(walls), 6),
+        'runs_s': [round(w, 6) for w in walls],
+        'throughput': round(amount / wall, 3) if wall > 0 else None,
+        'throughput_unit': f'{unit}/s',
+        'peak_rss_bytes': peak,
+        'peak_rss_delta_bytes': max(peak_delta, 0),
+    }
+
+
+def environment():
+    import librosa
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'librosa': librosa.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print each case against the baseline; returns the ids that got slower by more than tolerance"""
+    previous = {r['id']: r for r in baseline['results']}
+    regressions = []
+    print()
+    print(f"{'case':<70} {'baseline s':>10} {'now s':>9} {'ratio':>7} {'peak MB':>15}")
+    for r in results:
+        old = previous.get(r['id'])
+        if old is None:
+            print(f"{r['id']:<70} {'-':>10} {r['wall_s']:>9.3f} {'new':>7}")
+            continue
+        ratio = r['wall_s'] / old['wall_s'] if old['wall_s'] else float('inf')
+        change = r['wall_s'] - old['wall_s']
+        flag = ''
+        if ratio > 1 + tolerance and change >= NOISE_FLOOR_S:
+            flag = '  SLOWER'
+            regressions.append(r['id'])
+        elif ratio < 1 - tolerance and -change >= NOISE_FLOOR_S:
+            flag = '  faster'
+        memory = f"{old['peak_rss_bytes'] / 1e6:.0f} -> {r['peak_rss_bytes'] / 1e6:.0f}"
+        print(f"{r['id']:<70} {old['wall_s']:>10.3f} {r['wall_s']:>9.3f} {ratio:>7.2f} {memory:>15}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark analysis, generation, export and validation')
+    parser.add_argument('--suite', choices=sorted(SUITES), default='quick')
+    parser.add_argument('--only', action='append', choices=sorted(PREPARE), help='only run these benchmarks (repeatable)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, the fastest is reported (default: 3)')
+    parser.add_argument('--output', default='bench_results.json', help='where to write the results JSON')
+    parser.add_argument('--baseline', help='earlier results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='slowdown that counts as a regression (default: 0.1)')
+    args = parser.parse_args()
+
+    cases = [(name, params) for name, params in SUITES[args.suite] if not args.only or name in args.only]
+    if any(name == 'analyze' for name, _ in cases):
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            warm_up(tmp)
+
+    results = []
+    print(f"{'case':<70} {'wall s':>9} {'throughput':>22} {'peak MB':>8} {'+MB':>6}")
+    for name, params in cases:
+        r = run_case(name, params, args.repeat)
+        results.append(r)
+        throughput = f"{r['throughput']:,.0f} {r['throughput_unit']}"
+        print(f"{r['id']:<70} {r['wall_s']:>9.3f} {throughput:>22} "
+              f"{r['peak_rss_bytes'] / 1e6:>8.0f} {r['peak_rss_delta_bytes'] / 1e6:>6.0f}", flush=True)
+
+    report = {
+        'version': RESULTS_VERSION,
+        'suite': args.suite,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'repeat': args.repeat,
+        'environment': environment(),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
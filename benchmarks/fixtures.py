@@ -0,0 +1,137 @@
+"""
+Synthetic inputs for the benchmarks: audio tracks, the analysis dict
+analyze_audio would return for them, and editor projects.
+
+Everything is generated from a seed, so a given set of parameters always
+produces the same input.
+"""
+import random
+
+import numpy as np
+import soundfile as sf
+
+SAMPLE_RATE = 44100
+AUDIO_KINDS = ('music', 'click', 'noise', 'sweep')
+EFFECTS = ['flash', 'pulse', 'strobe']
+BEAT_EFFECTS = ['beat', 'onset']
+PATTERNS = [('wave', 'horizontal'), ('wave', 'diagonal-right'), ('sequential', 'row-by-row'),
+            ('radial', 'outward'), ('radial', 'inward')]
+BLOCK_S = 60 # Audio is synthesized and written a minute at a time
+
+
+def _music(t, rng, bpm):
+    """Stereo-ready kick/hat/chord loop with some noise, enough for every feature to have structure"""
+    beat = 60.0 / bpm
+    phase = t % beat
+    kick = np.sin(2 * np.pi * 60 * phase) * np.exp(-phase * 30)
+    hat_phase = (t + beat / 2) % beat
+    hat = rng.standard_normal(len(t)) * np.exp(-hat_phase * 80) * 0.3
+    chord_hz = np.where((t // (beat * 8)) % 2 == 0, 220.0, 330.0)
+    chord = 0.2 * np.sin(2 * np.pi * chord_hz * t) * (0.5 + 0.5 * np.sin(2 * np.pi * t / 7))
+    return kick + hat + chord + rng.standard_normal(len(t)) * 0.01
+
+
+def _click(t, rng, bpm):
+    """Metronome: a 5 ms 1 kHz click on every beat, accented on the bar"""
+    beat = 60.0 / bpm
+    phase = t % beat
+    accent = np.where((t // beat) % 4 == 0, 1.0, 0.6)
+    return np.where(phase < 0.005, np.sin(2 * np.pi * 1000 * t) * accent, 0.0)
+
+
+def _noise(t, rng, bpm):
+    return rng.standard_normal(len(t)) * 0.3
+
+
+def _sweep(t, rng, bpm, period_s=30.0, low_hz=40.0, high_hz=16000.0):
+    """Exponential sine sweep from low_hz to high_hz, restarting every period_s"""
+    k = np.log(high_hz / low_hz) / period_s
+    local = t % period_s
+    return 0.5 * np.sin(2 * np.pi * low_hz * (np.exp(k * local) - 1) / k)
+
+
+SIGNALS = {'music': _music, 'click': _click, 'noise': _noise, 'sweep': _sweep}
+
+
+def make_audio(path, duration_s, bpm=120, seed=0, kind='music', channels=2, subtype='FLOAT'):
+    """
+    Write a synthetic track (one of AUDIO_KINDS) to path, a block at a time
+    so long tracks fit in memory. Mono PCM_16 keeps a 4 hour track at 1.3 GB.
+    """
+    signal = SIGNALS[kind]
+    rng = np.random.default_rng(seed)
+    total = int(duration_s * SAMPLE_RATE)
+    with sf.SoundFile(path, 'w', SAMPLE_RATE, channels, subtype=subtype) as f:
+        for start in range(0, total, BLOCK_S * SAMPLE_RATE):
+            t = np.arange(start, min(start + BLOCK_S * SAMPLE_RATE, total)) / SAMPLE_RATE
+            mono = np.clip(signal(t, rng, bpm), -2, 2) * 0.5
+            if channels == 1:
+                f.write(mono.astype(np.float32))
+            else:
+                f.write(np.stack([mono, np.roll(mono, 100)], axis=1).astype(np.float32))
+
+
+def make_analysis(duration_s, bpm=120, seed=0, feature_step_ms=512 * 1000 / SAMPLE_RATE):
+    """
+    An analysis dict shaped like TeslaLightShowGenerator.analyze_audio's,
+    for benchmarking generation without analysing audio: a beat grid,
+    onsets on the beats and off-beats with some jitter, and slowly
+    varying RMS and spectral centroid.
+    """
+    rng = np.random.default_rng(seed)
+    beat = 60.0 / bpm
+    beat_times = np.arange(0, duration_s, beat)
+    onset_times = np.sort(np.concatenate([beat_times, beat_times + beat / 2]) + rng.normal(0, 0.01, 2 * len(beat_times)))
+    onset_times = onset_times[(onset_times >= 0) & (onset_times < duration_s)]
+    times = np.arange(int(duration_s * 1000 / feature_step_ms) + 1) * feature_step_ms / 1000
+    rms = 0.1 + 0.05 * np.sin(2 * np.pi * times / 7) + np.abs(rng.normal(0, 0.05, len(times)))
+    cent = 2000 + 1000 * np.sin(2 * np.pi * times / 13) + rng.normal(0, 300, len(times))
+    return {
+        'frame_count': int(duration_s / 0.02),
+        'beat_times': beat_times.tolist(),
+        'onset_times': onset_times.tolist(),
+        'rms': rms.tolist(),
+        'spectral_centroid': cent.tolist(),
+        'duration': float(duration_s),
+        'feature_start': 0.0,
+        'feature_step_ms': float(feature_step_ms)
+    }
+
+
+def make_editor_project(layer_count, clips_per_layer, duration_s, seed=0, patterned=0.3, beat_synced=0.0):
+    """
+    Editor project with layer_count layers of clips_per_layer clips each,
+    spread over the whole show. About `patterned` of the clips have a
+    position pattern, so matrix exports render them per car. With
+    beat_synced, the project gets an analysis and about that share of the
+    clips are beat/onset effects quantized to the beat.
+    """
+    rng = random.Random(seed)
+    duration_ms = duration_s * 1000
+    layers = []
+    for i in range(layer_count):
+        clips = []
+        for _ in range(clips_per_layer):
+            dur = min(rng.randint(100, 20000), duration_ms)
+            clip = {
+                'startTime': rng.uniform(0, duration_ms - dur),
+                'duration': dur,
+                'type': rng.choice(['effect', 'effect', 'pattern']),
+                'effectType': rng.choice(EFFECTS),
+                'speed': rng.choice([0.5, 1, 2, 4]),
+                'channels': rng.sample(range(48), rng.randint(1, 8)),
+                'fadeIn': rng.choice([0, 0, 250, 1000]),
+                'fadeOut': rng.choice([0, 0, 250, 1000]),
+                'pattern': 'uniform',
+            }
+            if rng.random() < patterned:
+                clip['pattern'], clip['patternDirection'] = rng.choice(PATTERNS)
+                clip['patternSpeed'] = rng.choice([0.5, 1, 2])
+            if beat_synced and rng.random() < beat_synced:
+                clip['type'], clip['effectType'], clip['quantize'] = 'effect', rng.choice(BEAT_EFFECTS), 'beat'
+            clips.append(clip)
+        layers.append({'id': f'layer-{i}', 'muted': False, 'clips': clips})
+    project = {'duration': duration_ms, 'layers': layers}
+    if beat_synced:
+        project['analysis'] = make_analysis(duration_s, seed=seed)
+    return project
@@ -0,0 +1,147 @@
+import functools
+import os
+import xml.etree.ElementTree as ET
+import numpy as np
+
+# xLights show folder the layout is read from
+XLIGHTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "xlights", "tesla_project", "tesla_xlights_show_folder")
+MODELS_FILE = "xlights_rgbeffects.xml" # Models (start channel, nodes) and model groups
+NETWORKS_FILE = "xlights_networks.xml" # Controllers and their channel counts
+MAPPING_FILE = "2022_mapping.xmap" # Standard lights and closures, in mapping order
+
+# Channel counts a car accepts: standard models, and Cybertruck light bars and accent lights
+LAYOUT_CHANNEL_COUNTS = (48, 200)
+
+class LayoutError(Exception):
+    pass
+
+class ChannelLayout:
+    """
+    0-indexed channels of every xLights model and model group that fits in
+    a show of channel_count channels. Lookups return numpy index arrays,
+    so callers resolve names once and render with plain fancy indexing.
+    standard is the list of light and closure names from the xLights
+    mapping, in mapping order.
+    """
+    def __init__(self, channel_count, models, groups, standard):
+        self.channel_count = channel_count
+        self.models = models # name -> int64 array of channels
+        self.groups = groups # name -> int64 array of channels
+        self.standard = standard
+
+    def __contains__(self, name):
+        return name in self.models or name in self.groups
+
+    def channels(self, *names):
+        """Sorted channels of the given models/groups; names not in this layout are skipped"""
+        found = [self.models.get(name, self.groups.get(name)) for name in names]
+        found = [ch for ch in found if ch is not None]
+        if not found: return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def describe(self):
+        """JSON-serializable {channel_count, models, groups, standard}"""
+        return {
+            "channel_count": self.channel_count,
+            "models": {name: ch.tolist() for name, ch in self.models.items()},
+            "groups": {name: ch.tolist() for name, ch in self.groups.items()},
+            "standard": list(self.standard),
+        }
+
+def _controller_offsets(path):
+    """name -> 0-indexed first channel of each controller, and the total channel count"""
+    offsets, total = {}, 0
+    for controller in ET.parse(path).getroot().iter("Controller"):
+        offsets[controller.get("Name")] = total
+        for network in controller.iter("network"):
+            total += int(network.get("MaxChannels", 0))
+    return offsets, total
+
+def _start_channel(value, offsets):
+    """0-indexed channel of an xLights StartChannel: "N" or "!Controller:N" (both 1-based)"""
+    if value.isdigit():
+        return int(value) - 1
+    if value.startswith("!") and ":" in value:
+        controller, _, channel = value[1:].rpartition(":")
+        if controller in offsets and channel.isdigit():
+            return offsets[controller] + int(channel) - 1
+    raise LayoutError(f"Unsupported start channel: {value}")
+
+def _model_channel_count(model):
+    """Channels an xLights model drives, from its shape and string type"""
+    display = model.get("DisplayAs", "")
+    string_type = model.get("StringType", "RGB Nodes")
+    parm1, parm2 = int(model.get("parm1", 1)), int(model.get("parm2", 1))
+
+    if display == "Custom":
+        # Grid of node numbers: layers split by '|', rows by ';', cells by ','
+        cells = model.get("CustomModel", "").replace("|", ";").replace(";", ",").split(",")
+        nodes = len({cell for cell in cells if cell.strip()})
+    elif display == "Poly Line":
+        nodes = parm2
+    else:
+        nodes = parm1 * parm2
+
+    if string_type.startswith("Single Color"):
+        # Every light of a string shares one channel
+        return nodes if display == "Custom" else parm1
+    if string_type.startswith("Node Single Color"):
+        return nodes
+    if "RGBW" in string_type:
+        return nodes * 4
+    return nodes * 3
+
+def _read_mapping(path):
+    """Model names listed in an xLights .xmap (first line flag, then a count, then the names)"""
+    with open(path) as f:
+        lines = f.read().splitlines()
+    count = int(lines[1])
+    return [name for name in lines[2:2 + count] if name]
+
+def _resolve_group(name, group_members, models, seen=()):
+    """Channels of a model group, following nested groups"""
+    channels = []
+    for member in group_members[name]:
+        if member in models:
+            channels.append(models[member])
+        elif member in group_members and member not in seen:
+            channels.append(_resolve_group(member, group_members, models, seen + (name,)))
+    if not channels: return np.zeros(0, dtype=np.int64)
+    return np.unique(np.concatenate(channels))
+
+@functools.lru_cache(maxsize=None)
+def load_layout(channel_count=48, folder=XLIGHTS_DIR):
+    """
+    ChannelLayout for channel_count channels from the xLights show folder.
+    Parsed once per process; models that don't fit entirely in channel_count
+    are left out, as are groups with none of their models left.
+    """
+    if channel_count not in LAYOUT_CHANNEL_COUNTS:
+        raise LayoutError(f"Channel count must be one of {LAYOUT_CHANNEL_COUNTS}")
+    try:
+        offsets, total = _controller_offsets(os.path.join(folder, NETWORKS_FILE))
+        root = ET.parse(os.path.join(folder, MODELS_FILE)).getroot()
+        standard = _read_mapping(os.path.join(folder, MAPPING_FILE))
+    except (OSError, ET.ParseError, ValueError, IndexError) as e:
+        raise LayoutError(f"Could not read the xLights layout from {folder}: {e}")
+    if total < channel_count:
+        raise LayoutError(f"xLights controllers only have {total} channels")
+
+    models = {}
+    for model in root.iter("model"):
+        if model.get("Active", "1") == "0": continue
+        start = _start_channel(model.get("StartChannel", "1"), offsets)
+        stop = start + _model_channel_count(model)
+        if stop > channel_count: continue
+        models[model.get("name")] = np.arange(start, stop, dtype=np.int64)
+
+    group_members = {}
+    for group in root.iter("modelGroup"):
+        group_members[group.get("name")] = [m.strip() for m in group.get("models", "").split(",") if m.strip()]
+    groups = {}
+    for name in group_members:
+        channels = _resolve_group(name, group_members, models)
+        if len(channels): groups[name] = channels
+
+    return ChannelLayout(channel_count, models, groups, [name for name in standard if name in models])
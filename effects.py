@@ -0,0 +1,189 @@
+import functools
+import numpy as np
+
+# Periodic waveforms whose period is a whole number of frames up to this long
+# are looked up from a one-period table instead of being evaluated per frame
+WAVE_TABLE_MAX_FRAMES = 3000
+TWINKLE_RATE_HZ = 4 # Twinkle changes per second at speed 1
+DEFAULT_CURVE_CYCLES = 1
+# Beat/onset flashes stay on as long as the generator's (5 and 3 frames at 20 ms)
+BEAT_FLASH_MS = 100
+ONSET_FLASH_MS = 60
+
+# effectType -> kernel(clip, frames, rel_time_ms, step_time_ms, channel_count, events)
+EFFECTS = {}
+# effectTypes whose kernels follow the analysis' beats/onsets
+EVENT_EFFECTS = set()
+
+def effect(name, uses_events=False):
+    """Register a kernel for clips with effectType name"""
+    def register(kernel):
+        EFFECTS[name] = kernel
+        if uses_events:
+            EVENT_EFFECTS.add(name)
+        return kernel
+    return register
+
+def intensity(clip, frames, rel_time_ms, step_time_ms, channel_count, events=None):
+    """
+    Intensity multiplier (0-1) of a clip's effect. frames is the show frame
+    index of each value, rel_time_ms the time into the clip, (frames,) or
+    (cars, frames) with per-car offsets; events is the project analysis'
+    EventIndex, if it has one. Kernels return an array that broadcasts
+    against rel_time_ms, with an extra trailing axis of one value per clip
+    channel for effects that differ per channel, or None for full
+    intensity. Unknown effect types render like flash.
+    """
+    kernel = EFFECTS.get(clip.get('effectType', 'flash'))
+    if kernel is None: return None
+    return kernel(clip, frames, rel_time_ms, step_time_ms, channel_count, events)
+
+# Waveforms over phase in [0, 1)
+WAVEFORMS = {
+    'sine': lambda phase: (np.sin(phase * (2 * np.pi)) + 1) / 2,
+    'triangle': lambda phase: 1 - np.abs(2 * phase - 1),
+    'saw': lambda phase: phase,
+    'square': lambda phase: (phase < 0.5).astype(float),
+}
+
+@functools.lru_cache(maxsize=None)
+def wave_table(waveform, speed, step_time_ms):
+    """
+    One period of waveform at speed (Hz) sampled at every frame, or None if
+    the period isn't a whole number of frames (up to WAVE_TABLE_MAX_FRAMES).
+    """
+    period_frames = 1000.0 / (speed * step_time_ms)
+    n = round(period_frames)
+    if n < 1 or n > WAVE_TABLE_MAX_FRAMES or abs(period_frames - n) > 1e-9: return None
+    table = WAVEFORMS[waveform](np.arange(n) / n)
+    table.flags.writeable = False
+    return table
+
+def periodic(waveform, speed, rel_time_ms, step_time_ms):
+    """waveform at speed (Hz) at each time; from the cached table when times fall on whole frames"""
+    table = wave_table(waveform, speed, step_time_ms)
+    if table is not None:
+        steps = rel_time_ms / step_time_ms
+        index = np.rint(steps)
+        if np.array_equal(index, steps):
+            return table[index.astype(np.int64) % len(table)]
+    return WAVEFORMS[waveform]((rel_time_ms * (speed / 1000.0)) % 1.0)
+
+def _speed(clip):
+    return clip.get('speed') or 1
+
+def _clip_phase(clip, rel_time_ms):
+    """Position in the clip from 0 (start) to 1 (end)"""
+    return np.clip(rel_time_ms / max(clip.get('duration', 1000), 1), 0, 1)
+
+def _hash_unit(*keys):
+    """Deterministic pseudo-random values in [0, 1) from integer arrays (splitmix64 over the combined keys)"""
+    x = np.zeros(np.broadcast_shapes(*(np.shape(k) for k in keys)), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for k in keys:
+            x = (x ^ np.asarray(k).astype(np.uint64)) * np.uint64(0x9E3779B97F4A7C15)
+            x ^= x >> np.uint64(30)
+            x *= np.uint64(0xBF58476D1CE4E5B9)
+            x ^= x >> np.uint64(27)
+            x *= np.uint64(0x94D049BB133111EB)
+            x ^= x >> np.uint64(31)
+    return (x >> np.uint64(11)).astype(float) / float(1 << 53)
+
+@effect('flash')
+def flash(clip, frames, rel_time_ms, step_time_ms, channel_count, events):
+    return None
+
+@effect('pulse')
+def pulse(clip, frames, rel_time_ms, step_time_ms, channel_count, events):
+    return periodic('sine', _speed(clip), rel_time_ms, step_time_ms)
+
+@effect('strobe')
+def strobe(clip, frames, rel_time_ms, step_time_ms, channel_count, events):
+    # 3 frames on, 3 off (about 8 Hz at 20 ms), in step with the show rather than the clip
+    return ((frames % 6) >= 3).astype(float)
+
+@effect('ramp')
+def ramp(clip, frames, rel_time_ms, step_time_ms, channel_count, events):
+    """Linear from startLevel to endLevel (0-100, default 0 to 100) over the clip"""
+    start, end = clip.get('startLevel', 0) / 100, clip.get('endLevel', 100) / 100
+    return start + (end - start) * _clip_phase(clip, rel_time_ms)
+
+@effect('sweep')
+def sweep(clip, frames, rel_time_ms, step_time_ms, channel_count, events):
+    """A lit spot moving across the clip's channels, in list order, speed times a second"""
+    position = periodic('saw', _speed(clip), rel_time_ms, step_time_ms)[..., None] * channel_count
+    distance = np.abs(position - (np.arange(channel_count) + 0.5))
+    distance = np.minimum(distance, channel_count - distance) # Wraps from the last channel to the first
+    return np.clip(1.5 - distance, 0, 1)
+
+@effect('twinkle')
+def twinkle(clip, frames, rel_time_ms, step_time_ms, channel_count, events):
+    """Each channel randomly on or off, changing TWINKLE_RATE_HZ * speed times a second"""
+    slot = np.floor(rel_time_ms * (_speed(clip) * TWINKLE_RATE_HZ / 1000.0)).astype(np.int64)
+    seed = int(clip.get('seed', 0))
+    values = _hash_unit(seed, slot[..., None], np.arange(channel_count))
+    return (values < clip.get('density', 0.5)).astype(float)
+
+def _event_flash(kind, clip, rel_time_ms, step_time_ms, events, flash_ms):
+    """
+    On for flashLength ms (default flash_ms) from every beat/onset since the
+    clip started, then fading out over decay ms (default 0). Off without an
+    analysis to take the events from.
+    """
+    if events is None: return np.zeros(rel_time_ms.shape)
+    start_ms = clip.get('startTime', 0)
+    # Show frame each value is at, shifted with the car's offset
+    since_ms = events.since(kind, (start_ms + rel_time_ms) / step_time_ms, first=start_ms / step_time_ms) * step_time_ms
+    hold_ms = clip.get('flashLength') or flash_ms
+    decay_ms = clip.get('decay') or 0
+    if decay_ms <= 0:
+        return (since_ms < hold_ms).astype(float)
+    return np.clip(1 - (since_ms - hold_ms) / decay_ms, 0, 1)
+
+@effect('beat', uses_events=True)
+def beat(clip, frames, rel_time_ms, step_time_ms, channel_count, events):
+    """Flash on every beat of the analysis"""
+    return _event_flash('beat', clip, rel_time_ms, step_time_ms, events, BEAT_FLASH_MS)
+
+@effect('onset', uses_events=True)
+def onset(clip, frames, rel_time_ms, step_time_ms, channel_count, events):
+    """Flash on every onset of the analysis"""
+    return _event_flash('onset', clip, rel_time_ms, step_time_ms, events, ONSET_FLASH_MS)
+
+# xLights value curve shapes over x in [0, 1], between levels a and b
+CURVES = {
+    'Flat': lambda x, a, b: np.full(np.shape(x), a),
+    'Ramp': lambda x, a, b: a + (b - a) * x,
+    'Ramp Up/Down': lambda x, a, b: a + (b - a) * (1 - np.abs(2 * x - 1)),
+    'Saw Tooth': lambda x, a, b: a + (b - a) * x,
+    'Square': lambda x, a, b: np.where(x < 0.5, a, b),
+    'Sine': lambda x, a, b: a + (b - a) * (np.sin(x * 2 * np.pi) + 1) / 2,
+    'Abs Sine': lambda x, a, b: a + (b - a) * np.abs(np.sin(x * np.pi)),
+    'Parabolic Down': lambda x, a, b: a + (b - a) * (1 - (2 * x - 1) ** 2),
+    'Parabolic Up': lambda x, a, b: a + (b - a) * (2 * x - 1) ** 2,
+    'Logarithmic Up': lambda x, a, b: a + (b - a) * np.log1p(9 * x) / np.log(10),
+    'Logarithmic Down': lambda x, a, b: b + (a - b) * np.log1p(9 * x) / np.log(10),
+    'Exponential Up': lambda x, a, b: a + (b - a) * (np.exp(3 * x) - 1) / (np.exp(3) - 1),
+    'Exponential Down': lambda x, a, b: b + (a - b) * (np.exp(3 * x) - 1) / (np.exp(3) - 1),
+}
+REPEATING_CURVES = ('Saw Tooth', 'Square', 'Sine', 'Abs Sine')
+
+@effect('curve')
+def curve(clip, frames, rel_time_ms, step_time_ms, channel_count, events):
+    """
+    Brightness value curve over the clip, like xLights': valueCurve is
+    {"type": one of CURVES, "start": 0-100, "end": 0-100, "cycles": n}
+    (cycles only for the repeating shapes) or {"type": "Custom",
+    "points": [[x, level], ...]} with x from 0 to 1 and level 0-100.
+    """
+    spec = clip.get('valueCurve') or {}
+    x = _clip_phase(clip, rel_time_ms)
+    kind = spec.get('type', 'Ramp')
+    if kind == 'Custom':
+        points = sorted(spec.get('points') or [[0, 100], [1, 100]])
+        level = np.interp(x, [p[0] for p in points], [p[1] for p in points])
+    else:
+        if kind in REPEATING_CURVES:
+            x = (x * spec.get('cycles', DEFAULT_CURVE_CYCLES)) % 1.0
+        level = CURVES.get(kind, CURVES['Ramp'])(x, spec.get('start', 0), spec.get('end', 100))
+    return np.clip(level / 100, 0, 1)
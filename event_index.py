@@ -0,0 +1,81 @@
+import functools
+import numpy as np
+
+BEATS_PER_BAR = 4
+# Clip quantize settings -> grid step in beats. The fractions are the editor's snap
+# menu values ("1" is one beat); "bar" and "beat" are aliases for whole bars/beats
+QUANTIZE_STEPS = {"1": 1, "1/2": 0.5, "1/4": 0.25, "1/8": 0.125, "bar": BEATS_PER_BAR, "beat": 1}
+
+class EventIndex:
+    """
+    Beats and onsets of an analysis on the light frame grid, built once and
+    shared by everything rendered from that analysis. beats and onsets are
+    sorted unique frames; beat positions are counted from the first beat,
+    extrapolated at the median beat interval before it and after the last.
+    """
+    def __init__(self, beats, onsets, frame_count):
+        self.beats = beats
+        self.onsets = onsets
+        self.frame_count = frame_count
+        self.interval = float(np.median(np.diff(beats))) if len(beats) > 1 else None
+
+    @functools.cached_property
+    def beat_count(self):
+        """Fractional number of beats since the first one at every frame (computed on first use)"""
+        return self.beat_at(np.arange(self.frame_count))
+
+    def events(self, kind):
+        return self.beats if kind == "beat" else self.onsets
+
+    def beat_at(self, frames):
+        """Fractional beat count at (possibly fractional) frames"""
+        frames = np.asarray(frames, dtype=float)
+        if self.interval is None: return np.zeros(frames.shape)
+        count = np.interp(frames, self.beats, np.arange(len(self.beats), dtype=float))
+        count = np.where(frames < self.beats[0], (frames - self.beats[0]) / self.interval, count)
+        return np.where(frames > self.beats[-1], len(self.beats) - 1 + (frames - self.beats[-1]) / self.interval, count)
+
+    def frame_at(self, beat_count):
+        """Frame (fractional) where the beat count is reached; inverse of beat_at"""
+        beat_count = np.asarray(beat_count, dtype=float)
+        last = len(self.beats) - 1
+        frames = np.interp(beat_count, np.arange(len(self.beats), dtype=float), self.beats)
+        frames = np.where(beat_count < 0, self.beats[0] + beat_count * self.interval, frames)
+        return np.where(beat_count > last, self.beats[-1] + (beat_count - last) * self.interval, frames)
+
+    def quantize(self, frame, step_beats):
+        """Frame on the grid of step_beats beats nearest to frame; unchanged without a beat grid"""
+        if self.interval is None: return frame
+        beat = float(self.beat_at(frame))
+        return float(self.frame_at(round(beat / step_beats) * step_beats))
+
+    def flash_mask(self, kind, length):
+        """Per-frame mask that is on for length frames after each beat/onset"""
+        frames = self.events(kind)
+        # +1 where a flash starts, -1 where it ends; on wherever the sum is positive
+        edges = np.zeros(self.frame_count + 1, dtype=np.int64)
+        np.add.at(edges, frames, 1)
+        np.add.at(edges, np.minimum(frames + length, self.frame_count), -1)
+        return np.cumsum(edges[:self.frame_count]) > 0
+
+    def since(self, kind, frames, first=0):
+        """Frames elapsed at each of frames since the latest beat/onset at or after frame first (inf before it)"""
+        events = self.events(kind)
+        events = events[np.searchsorted(events, first):]
+        if not len(events): return np.full(np.shape(frames), np.inf)
+        latest = np.searchsorted(events, frames, side="right") - 1
+        return np.where(latest >= 0, frames - events[np.maximum(latest, 0)], np.inf)
+
+def event_frames(times, frame_interval, frame_count):
+    """Sorted unique light frames of event times (s), those inside the show"""
+    frames = (np.asarray(times, dtype=float) / frame_interval).astype(np.int64)
+    return np.unique(frames[(frames >= 0) & (frames < frame_count)])
+
+def build_event_index(analysis, step_time_ms, frame_count=None):
+    """EventIndex of an analysis (beat_times/onset_times in s) on a step_time_ms frame grid"""
+    if frame_count is None:
+        frame_count = analysis["frame_count"]
+    frame_interval = step_time_ms / 1000
+    return EventIndex(event_frames(analysis.get("beat_times", []), frame_interval, frame_count),
+                      event_frames(analysis.get("onset_times", []), frame_interval, frame_count),
+                      frame_count)
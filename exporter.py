@@ -1,15 +1,95 @@
-import struct
+import hashlib
+import json
 import math
+import shutil
 import numpy as np
-import zipfile
-import os
+from metrics import stage
+from fseq import write_fseq, write_fseq_zip_chunks, patch_fseq, iter_chunks, CHUNK_FRAMES
+from sparse_show import SparseShow, merge_intervals
+from render_cache import RENDER_VERSION
+from channel_layout import load_layout
+from event_index import build_event_index, QUANTIZE_STEPS
+import effects
+import patterns
+
+MATRIX_CHUNK_BYTES = 16 * 1024 * 1024 # Rendered cars x frames x channels held at a time
+PATCH_GAP_FRAMES = 250 # Changed spans closer than this are recomposited as one
+IMAGE_CLIP_TYPES = ('pattern', 'gif') # Clips drawn from a GIF/image (see patterns.py)
+
+def pattern_offsets(clip, positions, rows, cols):
+    """
+    Per-car time offset (ms) of a clip's position pattern, matching the
+    wave/sequential/radial offsets ShowRenderer uses for the matrix preview.
+    positions is a (cars, 2) array of (row, col) grid positions.
+    """
+    row = positions[:, 0].astype(float)
+    col = positions[:, 1].astype(float)
+    pattern = clip.get('pattern', 'uniform')
+    direction = clip.get('patternDirection')
+    speed = clip.get('patternSpeed') or 1
+    
+    if pattern == 'wave':
+        distances = {
+            'horizontal': col,
+            'vertical': row,
+            'diagonal-right': row + col,
+            'diagonal-left': row + (cols - col - 1)
+        }
+        distance = distances.get(direction, np.zeros(len(positions)))
+        return distance * (100 / speed) # ms delay per grid unit
+    elif pattern == 'sequential':
+        index = row if direction == 'row-by-row' else col
+        return index * (200 / speed) # ms delay between rows/cols
+    elif pattern == 'radial':
+        center_row = rows / 2
+        center_col = cols / 2
+        distance = np.sqrt((row - center_row) ** 2 + (col - center_col) ** 2)
+        max_distance = math.sqrt(center_row ** 2 + center_col ** 2)
+        if direction == 'outward':
+            return distance * (100 / speed)
+        else: # inward
+            return (max_distance - distance) * (100 / speed)
+    return np.zeros(len(positions))
+
+class MatrixShow:
+    """
+    Rendered matrix. Clips that draw the same on every car are kept once
+    (shared), the others once per distinct set of offsets and pixels
+    (per_car); payloads maps each car to its set.
+    """
+    def __init__(self, shared, per_car, payloads):
+        self.shared = shared
+        self.per_car = per_car
+        self.payloads = payloads
+        self.cars = len(payloads)
+        self.frame_count = shared.frame_count
+        self.channel_count = shared.channel_count
+
+    def densify_distinct(self, start=0, stop=None):
+        """(distinct sets, frames, channels) for frames [start, stop)"""
+        stop = self.frame_count if stop is None else stop
+        data = np.empty((self.per_car.cars, stop - start, self.channel_count), dtype=np.uint8)
+        data[:] = self.shared.densify(start, stop)
+        return self.per_car.densify(start, stop, out=data)
+
+    def densify(self, start=0, stop=None):
+        """(cars, frames, channels) for frames [start, stop)"""
+        return self.densify_distinct(start, stop)[self.payloads]
+
+    def chunk_frames(self):
+        """Frames per chunk keeping a densify_distinct() result around MATRIX_CHUNK_BYTES"""
+        return min(CHUNK_FRAMES, max(1, MATRIX_CHUNK_BYTES // (max(self.per_car.cars, 1) * self.channel_count)))
 
 class ProjectExporter:
     def __init__(self, project_data):
         self.project = project_data
         self.step_time_ms = 20
         self.frame_interval = self.step_time_ms / 1000.0
-        self.channel_count = 48
+        # 48 channels, or 200 with the Cybertruck light bars
+        self.layout = load_layout(self.project.get('channelCount', 48))
+        self.channel_count = self.layout.channel_count
+        self._clip_channels_cache = {}
+        self._clip_images = {}
         
         # Determine duration from project or analysis
         if 'duration' in self.project and self.project['duration'] > 0:
@@ -20,157 +100,344 @@ class ProjectExporter:
             self.duration = 10.0 # Default
             
         self.frame_count = int(self.duration / self.frame_interval)
+        self._events = None # EventIndex of the project's analysis, built when a clip needs it
 
-    def export(self, output_path, matrix_mode=False, matrix_config=None, layout_data=None):
+    def export(self, output_path, matrix_mode=False, matrix_config=None, layout_data=None, compression_level=6,
+               render_cache=None, project_id=None):
         """
         Export project to FSEQ file(s)
         If matrix_mode is True, creates a .zip with multiple .fseq files
+        With a render_cache and project_id, single exports only re-render what changed
         """
         if matrix_mode and matrix_config:
-            return self.export_matrix(output_path, matrix_config, layout_data)
+            return self.export_matrix(output_path, matrix_config, layout_data, compression_level)
+        elif render_cache is not None and project_id:
+            return self.export_incremental(output_path, render_cache, project_id)
         else:
             return self.export_single(output_path)
 
     def export_single(self, output_path):
         """Export a single FSEQ file"""
-        # Initialize data grid
-        data = np.zeros((self.frame_count, self.channel_count), dtype=np.uint8)
-        
-        # Render Layers
-        for layer in self.project.get('layers', []):
-            if layer.get('muted'): continue
-            
-            for clip in layer.get('clips', []):
-                self._render_clip(clip, data)
-                
-        # Write FSEQ
-        self._write_fseq(data, output_path)
+        with stage("render"):
+            show = self.render_sparse()
+        # Frames are only made dense one chunk at a time as they're written
+        with stage("fseq_write"):
+            write_fseq(output_path, show.iter_chunks(), self.channel_count, self.step_time_ms)
         return output_path
 
-    def export_matrix(self, output_path, matrix_config, layout_data=None):
+    def export_incremental(self, output_path, render_cache, project_id):
+        """
+        Export a single FSEQ file, re-rendering only the clips that were added
+        or changed since the project's last export. Each clip's contribution
+        is cached under a hash of its parameters; frames covered by added,
+        changed or removed clips are recomposited from the clips overlapping
+        them and patched into the cached show, which is copied to output_path.
+        """
+        clips = {}
+        for clip in self._clips():
+            clips.setdefault(self.clip_key(clip), clip) # Identical clips blend to the same frames
+
+        with render_cache.project(project_id) as cache:
+            shape = [self.frame_count, self.channel_count, self.step_time_ms]
+            if cache.index is None or cache.index["shape"] != shape:
+                cache.clear()
+            cached = cache.index["clips"] if cache.index else {}
+
+            # key -> [start, stop) frames the clip's contribution covers
+            spans = {key: span for key, span in cached.items() if key in clips}
+            added = [key for key in clips if key not in cached]
+            removed = [key for key in cached if key not in clips]
+            contributions = {}
+            with stage("render"):
+                for key in added:
+                    contributions[key] = self.render_sparse([clips[key]])
+                    cache.save(key, contributions[key])
+                    starts, stops = contributions[key].covered()
+                    spans[key] = [int(starts[0]), int(stops[-1])] if len(starts) else [0, 0]
+
+            # Patching includes recompositing the dirty spans
+            with stage("fseq_write"):
+                if cache.index is None:
+                    show = SparseShow(self.frame_count, self.channel_count)
+                    for contribution in contributions.values():
+                        show.merge(contribution)
+                    write_fseq(cache.fseq_path, show.iter_chunks(), self.channel_count, self.step_time_ms)
+                else:
+                    dirty = [cached[key] for key in removed] + [spans[key] for key in added]
+                    self._patch_cached(cache, clips, spans, contributions, dirty)
+
+            for key in removed:
+                cache.remove(key)
+            cache.save_index({"shape": shape, "clips": spans})
+            shutil.copyfile(cache.fseq_path, output_path)
+
+        print(f"Re-rendered {len(added)} of {len(clips)} clips ({len(removed)} removed)")
+        render_cache.evict(keep=project_id)
+        return output_path
+
+    def _patch_cached(self, cache, clips, spans, contributions, dirty):
+        """Recomposite the dirty frame spans from the clips overlapping them and write them into the cached show"""
+        starts, stops = merge_intervals([s for s, _ in dirty], [e for _, e in dirty], gap=PATCH_GAP_FRAMES)
+        for span_start, span_stop in zip(starts.tolist(), stops.tolist()):
+            if span_start >= span_stop: continue
+            show = SparseShow(self.frame_count, self.channel_count)
+            for key, (start, stop) in spans.items():
+                if start >= span_stop or stop <= span_start: continue
+                contribution = contributions.get(key) or cache.load(key)
+                if contribution is None:
+                    # Lost from the cache, render it again
+                    contribution = self.render_sparse([clips[key]])
+                    cache.save(key, contribution)
+                show.merge(contribution)
+            for start, stop in iter_chunks(span_stop - span_start):
+                patch_fseq(cache.fseq_path, span_start + start, show.densify(span_start + start, span_start + stop))
+
+    def clip_key(self, clip):
+        """Hash of everything that affects a clip's rendered contribution"""
+        data = [RENDER_VERSION, self.frame_count, self.channel_count, self.step_time_ms, clip]
+        if clip.get('effectType') in effects.EVENT_EFFECTS and self.event_index() is not None:
+            events = self.event_index()
+            data.append(hashlib.sha256(events.beats.tobytes() + b'|' + events.onsets.tobytes()).hexdigest())
+        data = json.dumps(data, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode()).hexdigest()[:32]
+
+    def export_matrix(self, output_path, matrix_config, layout_data=None, compression_level=6):
         """Export matrix mode as a .zip file with multiple .fseq files"""
         rows = matrix_config.get('rows', 10)
         cols = matrix_config.get('cols', 10)
         
-        # Create temp directory for fseq files
-        import tempfile
-        temp_dir = tempfile.mkdtemp()
+        # Filename and grid position of each car
+        cars = []
+        for r in range(rows):
+            for c in range(cols):
+                # Check if car exists in layout
+                if layout_data and 'layout' in layout_data:
+                    try:
+                        if not layout_data['layout'][r][c].get('exists', True):
+                            continue
+                    except (IndexError, KeyError):
+                        pass
+
+                # Letter for row (y), Numbered ID for column (x)
+                # y0->A, y1->B, ... | x0->01, x1->02, ...
+                row_letter = chr(ord('A') + r)
+                col_id = f"{c + 1:02d}"  # Padded to 2 digits (e.g., 01, 02...)
+                cars.append((f"{row_letter}{col_id}.fseq", r, c))
         
-        try:
-            # Generate base frame data (same for all cars for now)
-            data = np.zeros((self.frame_count, self.channel_count), dtype=np.uint8)
-            
-            for layer in self.project.get('layers', []):
-                if layer.get('muted'): continue
-                for clip in layer.get('clips', []):
-                    self._render_clip(clip, data)
-            
-            # Create .fseq file for each position
-            fseq_files = []
-            for r in range(rows):
-                for c in range(cols):
-                    # Check if car exists in layout
-                    if layout_data and 'layout' in layout_data:
-                        try:
-                            if not layout_data['layout'][r][c].get('exists', True):
-                                continue
-                        except (IndexError, KeyError):
-                            pass
-
-                    # Letter for row (y), Numbered ID for column (x)
-                    # y0->A, y1->B, ... | x0->01, x1->02, ...
-                    row_letter = chr(ord('A') + r)
-                    col_id = f"{c + 1:02d}"  # Padded to 2 digits (e.g., 01, 02...)
-                    
-                    filename = f"{row_letter}{col_id}.fseq"
-                    filepath = os.path.join(temp_dir, filename)
-                    
-                    # For now, all cars get the same data
-                    # In the future, we can add position-based variations
-                    self._write_fseq(data, filepath)
-                    fseq_files.append((filename, filepath))
-            
-            # Create zip file
-            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for filename, filepath in fseq_files:
-                    zipf.write(filepath, filename)
-            
-            return output_path
-            
-        finally:
-            # Cleanup temp files
-            import shutil
-            shutil.rmtree(temp_dir, ignore_errors=True)
+        positions = np.array([(r, c) for _, r, c in cars]).reshape(-1, 2)
+        with stage("render"):
+            matrix = self.render_matrix(positions, rows, cols)
+        entries = [(name, int(p)) for (name, _, _), p in zip(cars, matrix.payloads)]
+        
+        chunks = (matrix.densify_distinct(start, stop) for start, stop in iter_chunks(self.frame_count, matrix.chunk_frames()))
+        with stage("zip"):
+            write_fseq_zip_chunks(output_path, entries, chunks, self.frame_count, self.channel_count,
+                                  self.step_time_ms, compression_level)
+        return output_path
+
+    def render_matrix(self, positions, rows, cols):
+        """MatrixShow of the cars at positions ((cars, 2) grid (row, col)) in a rows x cols matrix"""
+        # Time offset of every clip for every car (zero unless the clip has a position pattern),
+        # and the image pixel each car samples for image clips
+        clips = list(self._clips())
+        offsets = np.zeros((len(positions), len(clips)))
+        pixels = np.full((len(positions), len(clips)), -1, dtype=np.int64)
+        imaged = np.zeros(len(clips), dtype=bool)
+        for i, clip in enumerate(clips):
+            offsets[:, i] = pattern_offsets(clip, positions, rows, cols)
+            image = self._clip_image(clip)
+            if image is not None:
+                pixels[:, i] = self._image_cells(clip, image, rows, cols)[positions[:, 0], positions[:, 1]]
+                imaged[i] = True
+        
+        # Cars with the same offsets and pixels get the same frames, so each
+        # distinct set is rendered (and compressed) once
+        unique_keys, payloads = np.unique(np.hstack([offsets, pixels]), axis=0, return_inverse=True)
+        unique_offsets, unique_pixels = unique_keys[:, :len(clips)], unique_keys[:, len(clips):].astype(np.int64)
+        
+        # Clips without a position pattern or image draw the same on every car and are kept once,
+        # the others keep a row of values per distinct set
+        patterned = offsets.any(axis=0) | imaged
+        shared = self.render_sparse(clip for clip, p in zip(clips, patterned) if not p)
+        per_car = SparseShow(self.frame_count, self.channel_count, cars=len(unique_keys))
+        matrix = MatrixShow(shared, per_car, payloads.reshape(-1))
+        for i in np.flatnonzero(patterned):
+            self._add_clip(clips[i], per_car, unique_offsets[:, i], matrix.chunk_frames(),
+                           unique_pixels[:, i] if imaged[i] else None)
+        return matrix
 
-    def _render_clip(self, clip, data):
+    def _clips(self):
+        """Clips of all unmuted layers in render order, quantized clips moved onto the beat grid"""
+        for layer in self.project.get('layers', []):
+            if layer.get('muted'): continue
+            for clip in layer.get('clips', []):
+                yield self._quantized(clip)
+
+    def event_index(self):
+        """EventIndex of the project's analysis (beat and onset frames), or None if it has neither"""
+        if self._events is None:
+            analysis = self.project.get('analysis') or {}
+            if not analysis.get('beat_times') and not analysis.get('onset_times'): return None
+            self._events = build_event_index(analysis, self.step_time_ms, self.frame_count)
+        return self._events
+
+    def _quantized(self, clip):
+        """
+        The clip with its start snapped to the nearest step of the analysis'
+        beat grid when it has quantize ("1", "1/2", "1/4", "1/8" beats, or "beat"/"bar")
+        """
+        step_beats = QUANTIZE_STEPS.get(clip.get('quantize'))
+        if step_beats is None or self.event_index() is None: return clip
+        frame = self.event_index().quantize(clip.get('startTime', 0) / self.step_time_ms, step_beats)
+        return dict(clip, startTime=max(0, round(frame)) * self.step_time_ms)
+
+    def render_sparse(self, clips=None):
+        """SparseShow of the given clips (all unmuted layers by default), each evaluated once over its span"""
+        show = SparseShow(self.frame_count, self.channel_count)
+        for clip in (self._clips() if clips is None else clips):
+            self._add_clip(clip, show)
+        return show
+
+    def render_car_sparse(self, row, col, rows, cols):
+        """SparseShow (with cars=1) of the car at (row, col) in a rows x cols matrix, position patterns applied"""
+        show = SparseShow(self.frame_count, self.channel_count, cars=1)
+        position = np.array([[row, col]])
+        for clip in self._clips():
+            offsets = pattern_offsets(clip, position, rows, cols)
+            image = self._clip_image(clip)
+            if image is not None:
+                self._add_clip(clip, show, offsets, pixels=self._image_cells(clip, image, rows, cols)[row:row + 1, col])
+            else:
+                self._add_clip(clip, show, offsets if offsets.any() else None)
+        return show
+
+    def _add_clip(self, clip, show, offsets=None, chunk_frames=CHUNK_FRAMES, pixels=None):
+        """
+        Evaluate a clip into show a window of frames at a time, so long clips
+        never need whole-span (cars, frames) temporaries. With offsets (one per
+        car of the show, in ms) each car gets the clip shifted by its offset,
+        and image clips with pixels (one per car) show that pixel on each car.
+        """
+        start_frame, end_frame = self._clip_span(clip)
+        for window_start in range(start_frame, end_frame, chunk_frames):
+            rendered = self._clip_values(clip, window_start, min(window_start + chunk_frames, end_frame), offsets, pixels)
+            if rendered is None: return
+            _, _, channels, values = rendered
+            if values.ndim > (1 if offsets is None else 2):
+                # Per-channel effect: one value row per channel
+                for i, ch in enumerate(channels):
+                    show.add_values([ch], window_start, values[..., i])
+            else:
+                show.add_values(channels, window_start, values)
+
+    def _clip_span(self, clip):
+        """[start, end) frames a clip covers, clamped to the show"""
+        start_ms = clip.get('startTime', 0)
+        dur_ms = clip.get('duration', 1000)
+        start_frame = max(0, int(start_ms / self.step_time_ms))
+        end_frame = min(self.frame_count, int((start_ms + dur_ms) / self.step_time_ms))
+        return start_frame, end_frame
+
+    def _clip_channels(self, clip):
+        """
+        Index array of a clip's channels. Entries are channel indices or
+        names of layout models/groups (e.g. "Front Light Bar"); anything
+        outside the layout is dropped. Resolved once per distinct list.
+        """
+        key = tuple(clip.get('channels', []))
+        channels = self._clip_channels_cache.get(key)
+        if channels is None:
+            indices = [ch for ch in key if isinstance(ch, int) and 0 <= ch < self.channel_count]
+            names = [ch for ch in key if isinstance(ch, str)]
+            channels = np.union1d(np.array(indices, dtype=np.int64), self.layout.channels(*names))
+            self._clip_channels_cache[key] = channels
+        return channels
+
+    def _clip_image(self, clip):
+        """Decoded Pattern of an image clip's image (a preset or uploaded image id), or None"""
+        if clip.get('type', 'effect') not in IMAGE_CLIP_TYPES: return None
+        name = clip.get('image')
+        if not isinstance(name, str): return None
+        if name not in self._clip_images:
+            self._clip_images[name] = patterns.library.get(name)
+        return self._clip_images[name]
+
+    def _image_cells(self, clip, image, rows, cols):
+        """(rows, cols) pixel of the image each car of the matrix shows"""
+        fit = clip.get('imageFit', 'pixel')
+        return image.cells(rows, cols, fit if fit in patterns.IMAGE_FITS else 'pixel')
+
+    def _clip_values(self, clip, start=0, stop=None, offsets=None, pixels=None):
+        """
+        Evaluate a clip over its frame range (limited to [start, stop)) in one pass.
+        Returns (start_frame, end_frame, channels, values) with one uint8 value
+        per frame, or None if the clip doesn't write anything.
+        With per-car time offsets (ms), values has one row per car, and
+        effects that differ per channel add a trailing axis of one per channel.
+        Image clips show each car's pixel (one per car), or without pixels
+        spread the image's middle row across the clip's channels.
+        """
         start_ms = clip.get('startTime', 0)
         dur_ms = clip.get('duration', 1000)
         
-        start_frame = int(start_ms / self.step_time_ms)
-        end_frame = int((start_ms + dur_ms) / self.step_time_ms)
-        
-        # Clamp to bounds
-        start_frame = max(0, start_frame)
-        end_frame = min(self.frame_count, end_frame)
+        start_frame, end_frame = self._clip_span(clip)
+        start_frame = max(start, start_frame)
+        if stop is not None:
+            end_frame = min(stop, end_frame)
         
-        if start_frame >= end_frame: return
+        if start_frame >= end_frame: return None
         
         clip_type = clip.get('type', 'effect')
-        channels = clip.get('channels', [])
+        image = self._clip_image(clip)
+        # Without an image on the server, pattern clips flash and GIF clips
+        # (whose image only exists in the browser) aren't written
+        if clip_type not in ('effect', 'pattern') and image is None: return None
         
-        # Pre-calc fade
+        channels = self._clip_channels(clip)
+        if not len(channels): return None
+        
+        frames = np.arange(start_frame, end_frame)
+        rel_time_ms = (frames * self.step_time_ms) - start_ms
+        if offsets is not None:
+            # Same as the preview: each car is shifted along the clip, within the clip's own span
+            rel_time_ms = rel_time_ms + offsets[:, None]
+        
+        # Fade envelope (fade in takes precedence where both overlap)
         fade_in_ms = clip.get('fadeIn', 0)
         fade_out_ms = clip.get('fadeOut', 0)
         
-        for f in range(start_frame, end_frame):
-            rel_time_ms = (f * self.step_time_ms) - start_ms
-            
-            # Intensity
-            intensity = 1.0
-            if fade_in_ms > 0 and rel_time_ms < fade_in_ms:
-                intensity = rel_time_ms / fade_in_ms
-            elif fade_out_ms > 0 and rel_time_ms > (dur_ms - fade_out_ms):
-                intensity = (dur_ms - rel_time_ms) / fade_out_ms
-                
-            val = int(255 * intensity)
-            
-            # Effect Logic
-            if clip_type == 'effect':
-                eff_type = clip.get('effectType', 'flash')
-                
-                if eff_type == 'pulse':
-                    freq = clip.get('speed', 1)
-                    sine = (math.sin(rel_time_ms / 1000.0 * math.pi * 2 * freq) + 1) / 2
-                    val = int(val * sine)
-                elif eff_type == 'strobe':
-                    # 10Hz strobe
-                    if (f % 6) < 3: val = 0
-                
-                # Apply
-                for ch in channels:
-                    if ch < self.channel_count:
-                        # Max blending
-                        data[f, ch] = max(data[f, ch], val)
-                        
-            elif clip_type == 'pattern':
-                # TODO: Implement Pattern/GIF logic backend side if needed
-                # For now, just flash
-                for ch in channels:
-                    if ch < self.channel_count:
-                        data[f, ch] = max(data[f, ch], val)
-
-    def _write_fseq(self, data, path):
-         with open(path, "wb") as f:
-            f.write(b"PSEQ")
-            f.write(struct.pack("<H", 24))
-            f.write(struct.pack("<B", 0))
-            f.write(struct.pack("<B", 2))
-            f.write(struct.pack("<H", 0))
-            f.write(struct.pack("<I", self.channel_count))
-            f.write(struct.pack("<I", len(data)))
-            f.write(struct.pack("<B", self.step_time_ms))
-            f.write(struct.pack("<B", 0))
-            f.write(struct.pack("<H", 0))
-            f.write(struct.pack("<B", 0))
-            f.write(struct.pack("<B", 0))
-            f.write(data.tobytes())
+        intensity = np.ones(rel_time_ms.shape)
+        fading_in = np.zeros(rel_time_ms.shape, dtype=bool)
+        if fade_in_ms > 0:
+            fading_in = rel_time_ms < fade_in_ms
+            intensity[fading_in] = rel_time_ms[fading_in] / fade_in_ms
+        if fade_out_ms > 0:
+            fading_out = ~fading_in & (rel_time_ms > (dur_ms - fade_out_ms))
+            intensity[fading_out] = (dur_ms - rel_time_ms[fading_out]) / fade_out_ms
+        
+        # astype truncates toward zero, same as int()
+        val = (255 * intensity).astype(np.int64)
+        
+        if image is not None:
+            if pixels is None:
+                brightness = patterns.clip_brightness(image, clip, rel_time_ms[..., None], image.channels(len(channels)))
+                intensity = intensity[..., None]
+            else:
+                brightness = patterns.clip_brightness(image, clip, rel_time_ms, pixels[:, None])
+            val = (brightness * intensity).astype(np.int64)
+        # Effect kernel from the registry (see effects.py), with a trailing
+        # channel axis for effects that differ per channel
+        elif clip_type == 'effect':
+            level = effects.intensity(clip, frames, rel_time_ms, self.step_time_ms, len(channels),
+                                      self.event_index() if clip.get('effectType') in effects.EVENT_EFFECTS else None)
+            if level is not None:
+                if level.ndim > rel_time_ms.ndim:
+                    val = val[..., None]
+                val = (val * level).astype(np.int64)
+        
+        if offsets is not None:
+            val[rel_time_ms >= dur_ms] = 0 # Shifted past the end of the clip
+        
+        # Negative values (frames before a fade starts) never win the max blend
+        values = np.clip(val, 0, 255).astype(np.uint8)
+        return start_frame, end_frame, channels, values
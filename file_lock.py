@@ -0,0 +1,48 @@
+import os
+import time
+
+# Cross-process exclusive locks on open files: flock where there is one,
+# msvcrt's byte-range lock on Windows, none where neither exists
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+RETRY_INTERVAL_S = 0.05 # Between msvcrt attempts while waiting for a lock
+
+def lock(f, blocking=True):
+    """Lock an open file exclusively; returns False if it's held elsewhere and blocking is False"""
+    if fcntl is not None:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+    if msvcrt is not None:
+        while True:
+            f.seek(0)
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking: return False
+                time.sleep(RETRY_INTERVAL_S)
+    return True
+
+def unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def is_current(f, path):
+    """Whether the open file f is still the one at path (not removed or replaced since it was opened)"""
+    try:
+        return os.path.samestat(os.fstat(f.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
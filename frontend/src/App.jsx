@@ -1,8 +1,8 @@
 import { useState, useRef, useEffect } from 'react'
-import axios from 'axios'
 import { Upload, Zap, Download, CheckCircle, Car, Music, Eye, Play, Pause, Edit3 } from 'lucide-react'
 import { motion, AnimatePresence } from 'framer-motion'
 import { FseqParser } from './utils/FseqParser'
+import { JobClient } from './utils/JobClient'
 import JSZip from 'jszip'
 import Visualizer from './components/Visualizer'
 import MatrixVisualizer from './components/MatrixVisualizer'
@@ -201,12 +201,12 @@ function App() {
     }
 
     try {
-      const response = await axios.post('/generate', formData, {
+      const jobResult = await JobClient.run('/generate', formData, {
         headers: { 'Content-Type': 'multipart/form-data' }
       })
-      setResult(response.data)
+      setResult(jobResult)
     } catch (err) {
-      setError(err.response?.data?.error || "Failed to generate light show. Is the server running?")
+      setError(err.response?.data?.error || err.message || "Failed to generate light show. Is the server running?")
     } finally {
       setLoading(false)
     }
@@ -221,15 +221,15 @@ function App() {
     formData.append('audio', file);
 
     try {
-      const response = await axios.post('/analyze', formData, {
+      const result = await JobClient.run('/analyze', formData, {
         headers: { 'Content-Type': 'multipart/form-data' }
       });
-      if (response.data.success) {
-        setAnalysisData(response.data.analysis);
+      if (result.success) {
+        setAnalysisData(result.analysis);
         setMode('editor');
       }
     } catch (err) {
-      setError(err.response?.data?.error || "Failed to analyze audio.");
+      setError(err.response?.data?.error || err.message || "Failed to analyze audio.");
     } finally {
       setLoading(false);
     }
@@ -7,7 +7,7 @@ import { Timeline } from './Timeline';
 import Visualizer from './Visualizer';
 import MatrixPreview from './MatrixPreview';
 import ClipEditor from './ClipEditor';
-import axios from 'axios';
+import { JobClient } from '../utils/JobClient';
 
 export default function Editor({ audioFile, analysis, onExit }) {
     const [project, setProject] = useState(new ProjectState());
@@ -123,14 +123,15 @@ export default function Editor({ audioFile, analysis, onExit }) {
 
     const handleExport = async () => {
         try {
-            const response = await axios.post('/export', {
+            const result = await JobClient.run('/export', {
                 project: project,
+                projectId: project.id,
                 matrixMode: matrixMode,
                 matrixConfig: matrixConfig
             });
-            if (response.data.success) {
-                const ext = response.data.extension || '.fseq';
-                window.location.href = `/download/${response.data.file_id}${ext}`;
+            if (result.success) {
+                const ext = result.extension || '.fseq';
+                window.location.href = `/download/${result.file_id}${ext}`;
             }
         } catch (err) {
             console.error("Export failed", err);
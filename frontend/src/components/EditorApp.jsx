@@ -1,4 +1,5 @@
 import { useState, useRef, useEffect } from 'react';
+import axios from 'axios';
 import { Play, Pause, Save, Plus, Layers, Upload, Wand2, Zap, Undo, Redo, Bookmark, Image as ImageIcon, Music, FolderOpen, SkipBack } from 'lucide-react';
 import { PlayFromBookmarkIcon } from './PlayFromBookmarkIcon';
 import { ProjectState } from '../core/ProjectState';
@@ -11,7 +12,8 @@ import { FseqWriter } from '../utils/FseqWriter';
 import { XsqWriter } from '../utils/XsqWriter';
 import JSZip from 'jszip';
 import MatrixPreview2D from './MatrixPreview2D';
-import axios from 'axios';
+import { JobClient } from '../utils/JobClient';
+import { PreviewStream } from '../utils/PreviewStream';
 
 export default function EditorApp({ audioFile: initialAudioFile, analysis: initialAnalysis, bundledData, onExit }) {
     const [project, setProject] = useState(new ProjectState());
@@ -44,6 +46,7 @@ export default function EditorApp({ audioFile: initialAudioFile, analysis: initi
     const fileInputRef = useRef(null);
     const layoutInputRef = useRef(null);
     const audioUrlRef = useRef(null); // Cache audio URL
+    const previewRef = useRef(null); // Server-rendered frames while playing
 
     const handleToggleBookmark = (timeMs) => {
         setBookmarks(prev => {
@@ -196,12 +199,19 @@ export default function EditorApp({ audioFile: initialAudioFile, analysis: initi
                 // Import ImageProcessor
                 const { ImageProcessor } = await import('../utils/ImageProcessor');
 
-                // Parse image/GIF
-                let asset;
-                if (file.type === 'image/gif') {
-                    asset = await ImageProcessor.parseGIF(file);
-                } else {
-                    asset = await ImageProcessor.loadImage(file);
+                // Parse image/GIF for the in-browser renderer, and store it on the server
+                // for server-rendered previews and exports. Storing it is best effort:
+                // without it the clip still renders here, just not on the server
+                const formData = new FormData();
+                formData.append('image', file);
+                const [parsed, upload] = await Promise.allSettled([
+                    file.type === 'image/gif' ? ImageProcessor.parseGIF(file) : ImageProcessor.loadImage(file),
+                    axios.post('/images', formData)
+                ]);
+                if (parsed.status === 'rejected') throw parsed.reason;
+                const asset = parsed.value;
+                if (upload.status === 'rejected') {
+                    console.warn('Image not stored on the server:', upload.reason.response?.data?.error || upload.reason.message);
                 }
 
                 // Store asset
@@ -214,6 +224,8 @@ export default function EditorApp({ audioFile: initialAudioFile, analysis: initi
                     const clip = layer.clips.find(c => c.id === clipId);
                     if (clip) {
                         clip.assetId = assetId;
+                        if (upload.status === 'fulfilled') clip.image = upload.value.data.image;
+                        else delete clip.image; // Don't keep pointing at a previous image
                         clip.fps = asset.fps;
                         break;
                     }
@@ -223,8 +235,8 @@ export default function EditorApp({ audioFile: initialAudioFile, analysis: initi
                 rendererRef.current.setProject(newProject);
                 console.log('Image uploaded:', asset.width, 'x', asset.height, asset.frames.length, 'frames');
             } catch (err) {
-                console.error('Failed to upload image:', err);
-                alert('Failed to upload image: ' + err.message);
+                console.error('Failed to load image:', err);
+                alert('Failed to load image: ' + err.message);
             }
         };
 
@@ -232,6 +244,26 @@ export default function EditorApp({ audioFile: initialAudioFile, analysis: initi
         return () => window.removeEventListener('imageUpload', handleImageUpload);
     }, [project]);
 
+    // While playing, frames come from the server (rendered like the export) instead of
+    // being rendered here every animation frame; ShowRenderer covers editing while
+    // paused, and any frame the stream hasn't delivered (or a server that can't preview)
+    useEffect(() => {
+        if (!isPlaying) return;
+        let cancelled = false;
+        PreviewStream.create(project.toRenderJSON(), { matrixConfig })
+            .then((stream) => {
+                if (cancelled) return;
+                previewRef.current = stream;
+                stream.seek((audioRef.current?.currentTime || 0) * 1000);
+            })
+            .catch((err) => console.warn('Server preview unavailable, rendering locally:', err.response?.data?.error || err.message));
+        return () => {
+            cancelled = true;
+            previewRef.current?.close();
+            previewRef.current = null;
+        };
+    }, [isPlaying, project, matrixConfig]);
+
     const animate = () => {
         if (audioRef.current && !audioRef.current.paused) {
             const time = audioRef.current.currentTime * 1000;
@@ -396,9 +428,9 @@ export default function EditorApp({ audioFile: initialAudioFile, analysis: initi
         formData.append('audio', audioFile);
 
         try {
-            const response = await axios.post('/analyze', formData);
-            if (response.data.success) {
-                project.loadAnalysis(response.data.analysis);
+            const result = await JobClient.run('/analyze', formData);
+            if (result.success) {
+                project.loadAnalysis(result.analysis);
                 setProject(Object.assign(Object.create(Object.getPrototypeOf(project)), project));
                 alert('Audio analysis complete! Beat markers added to timeline.');
             }
@@ -455,6 +487,7 @@ export default function EditorApp({ audioFile: initialAudioFile, analysis: initi
         if (audioRef.current) {
             audioRef.current.currentTime = timeMs / 1000;
             setCurrentTime(timeMs);
+            previewRef.current?.seek(timeMs);
         }
     };
 
@@ -875,6 +908,9 @@ export default function EditorApp({ audioFile: initialAudioFile, analysis: initi
         }
     };
 
+    const matrixFrame = (isPlaying && previewRef.current?.getMatrixFrame(currentTime))
+        || rendererRef.current.getMatrixFrame(currentTime, matrixConfig);
+
     return (
         <div className="editor-container">
             <header className="editor-header">
@@ -1052,7 +1088,7 @@ export default function EditorApp({ audioFile: initialAudioFile, analysis: initi
                     {viewMode === '3d' ? (
                         <Scene3D
                             key={`${matrixConfig.rows}-${matrixConfig.cols}`}
-                            matrixData={rendererRef.current.getMatrixFrame(currentTime, matrixConfig)}
+                            matrixData={matrixFrame}
                             rows={matrixConfig.rows}
                             cols={matrixConfig.cols}
                             layoutData={layoutData}
@@ -1061,7 +1097,7 @@ export default function EditorApp({ audioFile: initialAudioFile, analysis: initi
                         />
                     ) : (
                         <MatrixPreview2D
-                            matrixData={rendererRef.current.getMatrixFrame(currentTime, matrixConfig)}
+                            matrixData={matrixFrame}
                             rows={matrixConfig.rows}
                             cols={matrixConfig.cols}
                             layoutData={layoutData}
@@ -2,6 +2,8 @@ import { v4 as uuidv4 } from 'uuid';
 
 export class ProjectState {
     constructor() {
+        // Stable across edits and saves, so /export can reuse the clips it rendered last time
+        this.id = uuidv4();
         this.layers = [
             {
                 id: 'layer-1',
@@ -63,6 +65,7 @@ export class ProjectState {
      */
     toJSON() {
         return {
+            id: this.id,
             layers: this.layers,
             assets: this.serializeAssets(),
             duration: this.duration,
@@ -70,6 +73,25 @@ export class ProjectState {
         };
     }
 
+    /**
+     * What the server needs to render the project (/preview): image clips are
+     * read from clip.image rather than the decoded assets, and of the analysis
+     * only the beats and onsets are used
+     */
+    toRenderJSON() {
+        const analysis = this.analysis && {
+            duration: this.analysis.duration,
+            beat_times: this.analysis.beat_times,
+            onset_times: this.analysis.onset_times
+        };
+        return {
+            id: this.id,
+            layers: this.layers,
+            duration: this.duration,
+            analysis
+        };
+    }
+
     /**
      * Convert ImageData assets to base64
      */
@@ -98,6 +120,7 @@ export class ProjectState {
      */
     static fromJSONSync(data) {
         const project = new ProjectState();
+        project.id = data.id || project.id;
         project.layers = JSON.parse(JSON.stringify(data.layers)); // Deep copy layers/clips
         project.duration = data.duration;
         project.analysis = data.analysis;
@@ -0,0 +1,38 @@
+import axios from 'axios';
+
+/**
+ * Client for the server's background job API.
+ * /generate, /analyze and /export answer with a job id right away;
+ * the actual result is fetched by polling /jobs/<id> until it finishes.
+ */
+export class JobClient {
+    /**
+     * POST to a job endpoint and wait for the job's result
+     * @param {string} url Job endpoint (e.g. '/analyze')
+     * @param {*} data Request body
+     * @param {Object} config axios request config
+     * @param {Object} options { interval, onProgress(progress, stage) }
+     * @returns {Promise<Object>} The job result
+     */
+    static async run(url, data, config = {}, options = {}) {
+        const response = await axios.post(url, data, config);
+        return JobClient.wait(response.data.job_id, options);
+    }
+
+    static async wait(jobId, { interval = 500, onProgress = null } = {}) {
+        for (;;) {
+            const { data: job } = await axios.get(`/jobs/${jobId}`);
+            if (onProgress) onProgress(job.progress, job.stage);
+
+            if (job.status === 'done') return job.result;
+            if (job.status === 'failed') throw new Error(job.error || 'Job failed');
+            if (job.status === 'cancelled') throw new Error('Job was cancelled');
+
+            await new Promise(resolve => setTimeout(resolve, interval));
+        }
+    }
+
+    static cancel(jobId) {
+        return axios.post(`/jobs/${jobId}/cancel`);
+    }
+}
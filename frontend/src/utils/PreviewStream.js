@@ -0,0 +1,147 @@
+import axios from 'axios';
+
+const PACKET_HEADER_BYTES = 10;
+const KEEP_BEHIND_MS = 2000; // Frames further behind the playhead are dropped
+const RETRY_MS = 1000;
+
+/**
+ * Client for the server's live preview stream.
+ * Frames are rendered by the same engine as /export and arrive as binary
+ * packets: start frame (uint32), frame count (uint16), car count (uint16),
+ * channel count (uint16), then the values frame by frame, car by car.
+ * The server keeps ~2 s ahead of the playhead; seek() reopens the stream.
+ */
+export class PreviewStream {
+    /**
+     * Start a preview session for a project
+     * @param {Object} project Project to render (ProjectState.toRenderJSON())
+     * @param {Object} options { matrixConfig } to preview every car of a matrix,
+     *     plus { row, col } to preview just one of them
+     */
+    static async create(project, { matrixConfig = null, row = null, col = null } = {}) {
+        const { data } = await axios.post('/preview', { project, matrixConfig });
+        return new PreviewStream(data, { matrixConfig, row, col });
+    }
+
+    constructor(info, { matrixConfig = null, row = null, col = null } = {}) {
+        this.info = info;
+        this.matrixConfig = matrixConfig;
+        this.row = row;
+        this.col = col;
+        this.frames = new Map(); // frame index -> Uint8Array of every car's channel values
+        this.controller = null;
+        this.failed = false; // Set when the server refuses the stream (e.g. too many open previews)
+    }
+
+    /**
+     * (Re)open the stream from timeMs, dropping frames buffered before it
+     */
+    seek(timeMs) {
+        this.close();
+        const startFrame = Math.floor(timeMs / this.info.step_time_ms);
+        for (const frame of this.frames.keys()) {
+            if (frame < startFrame) this.frames.delete(frame);
+        }
+
+        const params = new URLSearchParams({ start: timeMs / 1000 });
+        if (this.row !== null && this.col !== null) {
+            params.set('row', this.row);
+            params.set('col', this.col);
+        } else if (this.matrixConfig) {
+            params.set('matrix', '1');
+        }
+        const controller = new AbortController();
+        this.controller = controller;
+        this._read(`${this.info.stream_url}?${params}`, controller.signal).catch((err) => {
+            if (controller.signal.aborted || this.failed) return;
+            // Dropped connection: resume after the last frame received
+            console.warn('Preview stream interrupted:', err);
+            setTimeout(() => {
+                if (this.controller === controller) this.seek(this._resumeMs(timeMs));
+            }, RETRY_MS);
+        });
+    }
+
+    async _read(url, signal) {
+        const response = await fetch(url, { signal });
+        if (!response.ok) {
+            this.failed = true;
+            throw new Error(`Preview stream failed (${response.status})`);
+        }
+        const reader = response.body.getReader();
+        let buffer = new Uint8Array(0);
+        for (;;) {
+            const { done, value } = await reader.read();
+            if (done) return;
+            const joined = new Uint8Array(buffer.length + value.length);
+            joined.set(buffer);
+            joined.set(value, buffer.length);
+            buffer = joined.subarray(this._onPackets(joined));
+        }
+    }
+
+    /**
+     * Store every complete packet in bytes; returns how many bytes were used
+     */
+    _onPackets(bytes) {
+        const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+        let offset = 0;
+        while (bytes.length - offset >= PACKET_HEADER_BYTES) {
+            const start = view.getUint32(offset, true);
+            const count = view.getUint16(offset + 4, true);
+            const frameBytes = view.getUint16(offset + 6, true) * view.getUint16(offset + 8, true);
+            const end = offset + PACKET_HEADER_BYTES + count * frameBytes;
+            if (end > bytes.length) break;
+            for (let i = 0; i < count; i++) {
+                const frameStart = offset + PACKET_HEADER_BYTES + i * frameBytes;
+                this.frames.set(start + i, bytes.slice(frameStart, frameStart + frameBytes));
+            }
+            offset = end;
+        }
+        return offset;
+    }
+
+    _resumeMs(fallbackMs) {
+        const received = [...this.frames.keys()];
+        if (!received.length) return fallbackMs;
+        return (Math.max(...received) + 1) * this.info.step_time_ms;
+    }
+
+    /**
+     * Channel values at timeMs (every car's, one after the other), or null if
+     * that frame hasn't arrived yet
+     */
+    getFrame(timeMs) {
+        const frame = Math.floor(timeMs / this.info.step_time_ms);
+        const oldest = frame - Math.ceil(KEEP_BEHIND_MS / this.info.step_time_ms);
+        for (const buffered of this.frames.keys()) {
+            if (buffered < oldest) this.frames.delete(buffered);
+        }
+        return this.frames.get(frame) || null;
+    }
+
+    /**
+     * [row][col] grid of channel values at timeMs, like ShowRenderer.getMatrixFrame,
+     * or null if that frame hasn't arrived yet
+     */
+    getMatrixFrame(timeMs) {
+        const data = this.getFrame(timeMs);
+        if (!data || !this.matrixConfig) return null;
+        const { rows, cols } = this.matrixConfig;
+        const channels = this.info.channel_count;
+        const grid = [];
+        for (let r = 0; r < rows; r++) {
+            grid[r] = [];
+            for (let c = 0; c < cols; c++) {
+                const car = r * cols + c;
+                grid[r][c] = data.subarray(car * channels, (car + 1) * channels);
+            }
+        }
+        return grid;
+    }
+
+    close() {
+        if (this.controller) this.controller.abort();
+        this.controller = null;
+    }
+}
@@ -0,0 +1,353 @@
+import os
+import struct
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+HEADER_SIZE = 24
+CHANNEL_LAYOUTS = (48, 200) # Channel counts the vehicle accepts
+CHUNK_FRAMES = 3000 # Frames rendered/written at a time (1 minute at 20ms)
+
+# Header: PSEQ (4), start_offset (2), minor (1), major (1), fixed (2),
+# channel_count (4), frame_count (4), step_time (1), encoding (1),
+# reserved (2), compression (1), reserved (1)
+HEADER = struct.Struct("<4sHBBHIIBBHBB")
+FRAME_COUNT_OFFSET = 14
+
+# Max buffers per writev call (POSIX guarantees at least 16, Linux allows 1024)
+IOV_MAX = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") and "SC_IOV_MAX" in os.sysconf_names else 16
+
+class FseqError(Exception):
+    pass
+
+def pack_header(channel_count, frame_count, step_time_ms):
+    """FSEQ V2 Uncompressed header"""
+    return HEADER.pack(b"PSEQ", HEADER_SIZE, 0, 2, 0, channel_count, frame_count, step_time_ms, 0, 0, 0, 0)
+
+class FseqWriter:
+    """
+    Incremental FSEQ V2 Uncompressed writer.
+    Frame chunks are written straight from their buffers as they arrive, so
+    a show never has to exist in memory as a whole. The frame count in the
+    header is patched when the writer is closed.
+    """
+    def __init__(self, path, channel_count=48, step_time_ms=20):
+        if channel_count not in CHANNEL_LAYOUTS:
+            raise ValueError(f"Expected 48 or 200 channels, got {channel_count}")
+        self.path = path
+        self.channel_count = channel_count
+        self.step_time_ms = step_time_ms
+        self.frame_count = 0
+        self._file = open(path, "wb", buffering=0)
+        self._write_buffers([pack_header(channel_count, 0, step_time_ms)])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, frames):
+        """Append a (frames, channel_count) uint8 chunk"""
+        self.write_chunks([frames])
+
+    def write_chunks(self, chunks):
+        """Append several chunks with a single writev where available"""
+        buffers = []
+        for chunk in chunks:
+            chunk = np.ascontiguousarray(chunk, dtype=np.uint8)
+            if chunk.ndim != 2 or chunk.shape[1] != self.channel_count:
+                raise ValueError(f"Expected (frames, {self.channel_count}) chunk, got {chunk.shape}")
+            if len(chunk) == 0: continue
+            buffers.append(memoryview(chunk).cast("B"))
+            self.frame_count += len(chunk)
+        self._write_buffers(buffers)
+
+    def close(self):
+        if self._file is None: return
+        try:
+            if self.frame_count:
+                self._file.seek(FRAME_COUNT_OFFSET)
+                self._write_buffers([struct.pack("<I", self.frame_count)])
+        finally:
+            self._file.close()
+            self._file = None
+
+    def _write_buffers(self, buffers):
+        buffers = [memoryview(b).cast("B") for b in buffers]
+        if hasattr(os, "writev"):
+            fd = self._file.fileno()
+            while buffers:
+                written = os.writev(fd, buffers[:IOV_MAX])
+                # Drop what went out, keep the rest of a partially written buffer
+                while buffers and written >= len(buffers[0]):
+                    written -= len(buffers[0])
+                    buffers.pop(0)
+                if buffers and written:
+                    buffers[0] = buffers[0][written:]
+        else:
+            for buf in buffers:
+                while len(buf):
+                    buf = buf[self._file.write(buf):]
+
+def write_fseq(path, frames, channel_count=None, step_time_ms=20):
+    """
+    Write an FSEQ file from a (frames, channels) array or an iterable of
+    chunks. Returns the number of frames written.
+    """
+    if isinstance(frames, np.ndarray):
+        frames = [frames]
+        if channel_count is None:
+            channel_count = frames[0].shape[1]
+    with FseqWriter(path, channel_count or 48, step_time_ms) as writer:
+        for chunk in frames:
+            writer.write(chunk)
+    return writer.frame_count
+
+def patch_fseq(path, start_frame, frames):
+    """Overwrite frames in place, from start_frame on, in an existing FSEQ V2 Uncompressed file"""
+    with open(path, "r+b") as f:
+        header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:4] != b"PSEQ":
+            raise FseqError("Unknown file format, expected FSEQ v2.0")
+        _, data_offset, _, _, _, channel_count, frame_count, _, _, _, compression, _ = HEADER.unpack(header)
+        if compression & 0x0F:
+            raise FseqError("Expected file format to be V2 Uncompressed")
+
+        frames = np.ascontiguousarray(frames, dtype=np.uint8)
+        if frames.ndim != 2 or frames.shape[1] != channel_count:
+            raise ValueError(f"Expected (frames, {channel_count}) chunk, got {frames.shape}")
+        if start_frame < 0 or start_frame + len(frames) > frame_count:
+            raise ValueError(f"Frames {start_frame}-{start_frame + len(frames)} are outside the file's {frame_count} frames")
+        f.seek(data_offset + start_frame * channel_count)
+        f.write(memoryview(frames).cast("B"))
+
+def iter_chunks(frame_count, chunk_frames=CHUNK_FRAMES):
+    """(start, stop) frame windows covering frame_count frames"""
+    for start in range(0, frame_count, chunk_frames):
+        yield start, min(start + chunk_frames, frame_count)
+
+# Raw deflate (as stored in zip entries) with an 8 KB window and smaller hash
+# table: ~64 KB per stream instead of ~256 KB, with the same ratio on FSEQ data
+# since frames repeat within a few hundred bytes
+DEFLATE_WBITS = -13
+DEFLATE_MEMLEVEL = 6
+
+class _ZipPayload:
+    """Running CRC32 and deflate stream of one FSEQ file in a zip"""
+    def __init__(self, header, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, DEFLATE_WBITS, DEFLATE_MEMLEVEL) if level else None
+        self.crc = 0
+        self.size = 0
+        self.parts = []
+        self.feed(header)
+
+    def feed(self, buf):
+        buf = memoryview(buf).cast("B")
+        self.crc = zlib.crc32(buf, self.crc)
+        self.size += len(buf)
+        self.parts.append(self.compressor.compress(buf) if self.compressor else bytes(buf))
+
+    def finish(self):
+        """Flush the deflate stream, returning the compressed parts"""
+        if self.compressor:
+            self.parts.append(self.compressor.flush())
+            self.compressor = None
+        return self.parts
+
+# Zip records (little-endian): local file header, central directory header,
+# end of central directory, and the Zip64 end record and its locator
+ZIP_LOCAL = struct.Struct("<4s5H3L2H")
+ZIP_CENTRAL = struct.Struct("<4s6H3L5H2L")
+ZIP_END = struct.Struct("<4s4H2LH")
+ZIP64_END = struct.Struct("<4sQ2H2L4Q")
+ZIP64_LOCATOR = struct.Struct("<4sLQL")
+ZIP_LIMIT = 0xFFFFFFFF # Sizes and offsets from here on need Zip64 fields
+ZIP_MAX_ENTRIES = 0xFFFF
+ZIP_UNIX = 3 << 8 # "Version made by" host, so external_attr holds unix permissions
+
+class ZipWriter:
+    """
+    Minimal zip writer for entries that are already compressed, which
+    zipfile can't take: each entry's CRC32, size and compressed parts are
+    known up front, so headers are written once with no data descriptors.
+    Zip64 fields are added only when an entry or the archive needs them.
+    """
+    def __init__(self, f):
+        self.f = f
+        self.entries = [] # (name, flags, compress_type, dos time, dos date, crc, compressed size, size, offset)
+        t = time.localtime()
+        self.dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+        self.dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+    def add(self, name, parts, crc, size, compress_type):
+        """Append an entry from its compressed parts (a list of buffers)"""
+        encoded = name.encode("utf-8")
+        flags = 0 if name.isascii() else 0x800 # Bit 11: UTF-8 name
+        compressed_size = sum(len(part) for part in parts)
+        offset = self.f.tell()
+        zip64 = size >= ZIP_LIMIT or compressed_size >= ZIP_LIMIT
+        extra = struct.pack("<2H2Q", 1, 16, size, compressed_size) if zip64 else b""
+        self.f.write(ZIP_LOCAL.pack(b"PK\x03\x04", 45 if zip64 else 20, flags, compress_type,
+                                    self.dos_time, self.dos_date, crc,
+                                    ZIP_LIMIT if zip64 else compressed_size, ZIP_LIMIT if zip64 else size,
+                                    len(encoded), len(extra)))
+        self.f.write(encoded)
+        self.f.write(extra)
+        for part in parts:
+            self.f.write(part)
+        self.entries.append((encoded, flags, compress_type, crc, compressed_size, size, offset))
+
+    def close(self):
+        """Write the central directory"""
+        cd_offset = self.f.tell()
+        for encoded, flags, compress_type, crc, compressed_size, size, offset in self.entries:
+            # Zip64 extra: the values that don't fit, in this order
+            large = [v for v in (size, compressed_size, offset) if v >= ZIP_LIMIT]
+            extra = struct.pack(f"<2H{len(large)}Q", 1, 8 * len(large), *large) if large else b""
+            version = 45 if large else 20
+            self.f.write(ZIP_CENTRAL.pack(b"PK\x01\x02", ZIP_UNIX | version, version, flags, compress_type,
+                                          self.dos_time, self.dos_date, crc,
+                                          min(compressed_size, ZIP_LIMIT), min(size, ZIP_LIMIT),
+                                          len(encoded), len(extra), 0, 0, 0, 0o600 << 16, min(offset, ZIP_LIMIT)))
+            self.f.write(encoded)
+            self.f.write(extra)
+        cd_end = self.f.tell()
+        count, cd_size = len(self.entries), cd_end - cd_offset
+
+        if count >= ZIP_MAX_ENTRIES or cd_offset >= ZIP_LIMIT or cd_size >= ZIP_LIMIT:
+            self.f.write(ZIP64_END.pack(b"PK\x06\x06", ZIP64_END.size - 12, ZIP_UNIX | 45, 45, 0, 0,
+                                        count, count, cd_size, cd_offset))
+            self.f.write(ZIP64_LOCATOR.pack(b"PK\x06\x07", 0, cd_end, 1))
+        self.f.write(ZIP_END.pack(b"PK\x05\x06", 0, 0, min(count, ZIP_MAX_ENTRIES), min(count, ZIP_MAX_ENTRIES),
+                                  min(cd_size, ZIP_LIMIT), min(cd_offset, ZIP_LIMIT), 0))
+
+def _check_compression_level(compression_level):
+    if not 0 <= compression_level <= 9:
+        raise ValueError(f"Expected a compression level from 0 to 9, got {compression_level}")
+    return zipfile.ZIP_DEFLATED if compression_level else zipfile.ZIP_STORED
+
+def write_fseq_zip_chunks(path, entries, chunks, frame_count, channel_count=48, step_time_ms=20,
+                          compression_level=6, workers=None):
+    """
+    Write a zip of FSEQ files whose payloads are rendered a chunk at a time.
+    entries is a list of (name, payload index) and chunks yields
+    (payloads, frames, channels) uint8 arrays covering frame_count frames.
+    Each payload is compressed once as its chunks arrive, with payloads
+    compressed in parallel, so only the compressed files are kept in memory.
+    """
+    compress_type = _check_compression_level(compression_level)
+    payload_count = max((p for _, p in entries), default=-1) + 1
+    header = pack_header(channel_count, frame_count, step_time_ms)
+    streams = [_ZipPayload(header, compression_level) for _ in range(payload_count)]
+
+    written = 0
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for chunk in chunks:
+            chunk = np.ascontiguousarray(chunk, dtype=np.uint8)
+            if chunk.ndim != 3 or chunk.shape[0] != payload_count or chunk.shape[2] != channel_count:
+                raise ValueError(f"Expected ({payload_count}, frames, {channel_count}) chunk, got {chunk.shape}")
+            list(executor.map(lambda p: streams[p].feed(chunk[p]), range(payload_count)))
+            written += chunk.shape[1]
+    if written != frame_count:
+        raise ValueError(f"Expected {frame_count} frames, got {written}")
+
+    _write_zip(path, [(name, streams[p]) for name, p in entries], compress_type)
+    return path
+
+def _write_zip(path, entries, compress_type):
+    """Write (name, _ZipPayload) entries, sharing the compressed bytes of repeated payloads"""
+    with open(path, "wb") as f:
+        archive = ZipWriter(f)
+        for name, stream in entries:
+            archive.add(name, stream.finish(), stream.crc, stream.size, compress_type)
+        archive.close()
+
+class FseqFile:
+    """
+    Memory-mapped FSEQ V2 Uncompressed reader.
+    `frames` is a read-only (frames, channels) numpy view straight onto the
+    file, so even 4 hour shows are only paged in as they're accessed.
+    Truncated files map as many complete frames as they contain.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:4] != b"PSEQ":
+            raise FseqError("Unknown file format, expected FSEQ v2.0")
+
+        (_, self.data_offset, self.minor_version, self.major_version, _,
+         self.channel_count, self.frame_count, self.step_time_ms, _, _,
+         compression, _) = HEADER.unpack(header)
+        self.compression = compression & 0x0F
+
+        if self.major_version != 2:
+            raise FseqError(f"Expected FSEQ v2, got {self.major_version}.{self.minor_version}")
+        if self.compression != 0:
+            raise FseqError("Expected file format to be V2 Uncompressed")
+        if self.channel_count < 1 or self.step_time_ms < 1 or self.data_offset < HEADER_SIZE:
+            raise FseqError("Invalid FSEQ header")
+
+        self.file_size = os.path.getsize(path)
+        available = max(0, self.file_size - self.data_offset) // self.channel_count
+        mapped = min(self.frame_count, available)
+        if mapped > 0:
+            self._frames = np.memmap(path, dtype=np.uint8, mode="r", offset=self.data_offset,
+                                     shape=(mapped, self.channel_count))
+        else:
+            self._frames = np.zeros((0, self.channel_count), dtype=np.uint8)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, key):
+        return self._frames[key]
+
+    def close(self):
+        # The mapping is released once no views of it remain
+        self._frames = None
+
+    @property
+    def frames(self):
+        """(frames, channels) uint8 view of the channel data"""
+        return self._frames
+
+    @property
+    def duration_s(self):
+        return self.frame_count * self.step_time_ms / 1000
+
+    @property
+    def expected_size(self):
+        return self.data_offset + self.frame_count * self.channel_count
+
+    @property
+    def truncated(self):
+        return len(self) < self.frame_count
+
+    def frame_index(self, time_s):
+        """Frame shown at time_s, clamped to the mapped frames"""
+        return min(max(int(time_s * 1000 / self.step_time_ms), 0), len(self))
+
+    def time_slice(self, start_s=0, end_s=None):
+        """(frames, channels) view of [start_s, end_s)"""
+        stop = len(self) if end_s is None else self.frame_index(end_s)
+        return self._frames[self.frame_index(start_s):stop]
+
+    def channel(self, ch, start_s=0, end_s=None):
+        """Strided 1D view of a single channel over [start_s, end_s)"""
+        return self.time_slice(start_s, end_s)[:, ch]
+
+    def iter_chunks(self, chunk_frames=CHUNK_FRAMES, start=0, stop=None):
+        """Lazily yield (frames, channels) views of chunk_frames frames"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for chunk_start in range(start, stop, chunk_frames):
+            yield self._frames[chunk_start:min(chunk_start + chunk_frames, stop)]
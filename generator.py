@@ -1,166 +1,348 @@
+import contextlib
+import io
 import os
-import struct
+import tempfile
+import time
 import numpy as np
-import librosa
-import soundfile as sf
 import datetime
+from fseq import write_fseq, iter_chunks
+from sparse_show import SparseShow
+from metrics import stage
+from channel_layout import load_layout
+from event_index import build_event_index
+from audio_stream import HOP_LENGTH, N_FFT
+# librosa and soundfile are only imported by the analysis methods: their first
+# use loads scipy and compiles numba kernels, which rendering and exporting never need
+
+# Tracks at least this long are analyzed in blocks instead of loaded whole
+STREAMING_MIN_DURATION_S = 10 * 60
+# Aligned analysis loads at this rate with one feature frame per light frame
+ALIGNED_SAMPLE_RATE = 22050
+DEFAULT_SAMPLE_RATE = 44100
+# Length of the synthetic track warm_up analyzes
+WARM_UP_DURATION_S = 3
+# Light bar level meter peaks stay lit at least this many frames (100ms)
+METER_HOLD_FRAMES = 5
 
 class TeslaLightShowGenerator:
-    def __init__(self, step_time_ms=20):
+    def __init__(self, step_time_ms=20, cache=None, streaming=None, aligned=False, channel_count=48):
         self.step_time_ms = step_time_ms
         self.frame_interval = step_time_ms / 1000.0
-        self.channel_count = 48 # Base channels for standard models
+        self.layout = load_layout(channel_count) # 48 for standard models, 200 adds the Cybertruck light bars
+        self.channel_count = self.layout.channel_count
+        self.show_channels = self._show_channels(self.layout)
+        self.cache = cache # Optional AnalysisCache
+        self.streaming = streaming # True/False to force, None picks by track length
+        self.aligned = aligned
+        if aligned:
+            # Hop of exactly one light frame, so feature frame i is centered on light frame i.
+            # The FFT window keeps the same length in seconds as the default analysis.
+            self.sample_rate = ALIGNED_SAMPLE_RATE
+            self.hop_length = round(self.sample_rate * step_time_ms / 1000)
+            self.n_fft = N_FFT * ALIGNED_SAMPLE_RATE // DEFAULT_SAMPLE_RATE
+        else:
+            self.sample_rate = DEFAULT_SAMPLE_RATE
+            self.hop_length = HOP_LENGTH
+            self.n_fft = N_FFT
+        self.feature_step_ms = self.hop_length * 1000 / self.sample_rate
+        # Arrays derived from the analysis rendered last, reused while it's rendered again
+        self._derived_for = None
+        self._derived = {}
+        
+    def _show_channels(self, layout):
+        """
+        Index arrays of the channels each part of the shows drives, resolved
+        from the layout once. Models the layout doesn't have (the light bars
+        in 48 channels) resolve to no channels.
+        """
+        channels = layout.channels
+        # Front light bar halves as a (2, nodes) level meter growing out from the middle
+        left, right = channels("Left Front Light Bar"), channels("Right Front Light Bar")
+        meter = np.stack([left[::-1], right]) if len(left) and len(left) == len(right) else np.zeros((2, 0), dtype=np.int64)
+        return {
+            "beat": channels("GRP Tail Lights", "GRP Signatures", "Rear Light Bar"),
+            "onset": channels("GRP Outer Main Beams", "GRP Inner Main Beams", "Offroad Light Bar"),
+            "fog": channels("GRP Fogs (Front)"),
+            "turn_left": channels("Left Front Turn"),
+            "turn_right": channels("Right Front Turn"),
+            "meter": meter,
+            "matrix_low": channels("GRP Signatures"),
+            "matrix_high": channels("GRP Signatures", "GRP Outer Main Beams", "GRP Inner Main Beams",
+                                    "GRP Fogs (Front)", "All Front Lightbars", "All Rear Lightbars"),
+        }
+
+    def analysis_params(self):
+        """Parameters that affect analyze_audio output (part of the cache key)"""
+        return {
+            "sample_rate": self.sample_rate,
+            "hop_length": self.hop_length,
+            "n_fft": self.n_fft,
+            "step_time_ms": self.step_time_ms,
+            "streaming": self.streaming
+        }
         
     def analyze_audio(self, audio_path):
+        if self.cache is None:
+            return self._analyze_audio(audio_path)
+            
+        key = self.cache.key(audio_path, self.analysis_params())
+        analysis = self.cache.get(key)
+        if analysis is not None:
+            print(f"Using cached analysis for: {audio_path}")
+            return analysis
+            
+        analysis = self._analyze_audio(audio_path)
+        self.cache.put(key, analysis)
+        return analysis
+        
+    def _use_streaming(self, audio_path):
+        import soundfile as sf
+        try:
+            duration = sf.info(audio_path).duration
+        except RuntimeError:
+            return False # Not readable by libsndfile, librosa.load falls back to audioread
+        if self.streaming is not None:
+            return self.streaming
+        return duration >= STREAMING_MIN_DURATION_S
+        
+    def _analyze_audio(self, audio_path):
+        if self._use_streaming(audio_path):
+            return self._analyze_audio_streaming(audio_path)
+            
+        import librosa
         print(f"Analyzing audio: {audio_path}")
-        y, sr = librosa.load(audio_path, sr=44100)
+        with stage("load"):
+            y, sr = librosa.load(audio_path, sr=self.sample_rate)
+        hop, n_fft = self.hop_length, self.n_fft
         
         # Get duration and frame count
         duration = librosa.get_duration(y=y, sr=sr)
         frame_count = int(duration / self.frame_interval)
         
         # Extract features
-        tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
-        beat_times = librosa.frames_to_time(beats, sr=sr)
+        # (the median-aggregated envelope beat_track would compute from y)
+        with stage("beat_track"):
+            beat_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop, n_fft=n_fft, aggregate=np.median)
+            tempo, beats = librosa.beat.beat_track(onset_envelope=beat_env, sr=sr, hop_length=hop)
+        beat_times = librosa.frames_to_time(beats, sr=sr, hop_length=hop)
         
         # Onsets (sharp peaks like snares/claps)
-        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-        onsets = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr)
-        onset_times = librosa.frames_to_time(onsets, sr=sr)
+        with stage("onset"):
+            onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop, n_fft=n_fft)
+            onsets = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr, hop_length=hop)
+        onset_times = librosa.frames_to_time(onsets, sr=sr, hop_length=hop)
         
         # RMS Energy (loudness)
-        rms = librosa.feature.rms(y=y)[0]
-        rms_times = librosa.frames_to_time(range(len(rms)), sr=sr)
+        with stage("rms"):
+            rms = librosa.feature.rms(y=y, frame_length=n_fft, hop_length=hop)[0]
         
         # Spectral Centroid (brightness/high freq)
-        cent = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
+        with stage("centroid"):
+            cent = librosa.feature.spectral_centroid(y=y, sr=sr, n_fft=n_fft, hop_length=hop)[0]
+        
+        return self._analysis_result(frame_count, duration, beat_times, onset_times, rms, cent)
+
+    def _analyze_audio_streaming(self, audio_path):
+        """Same analysis as _analyze_audio with memory bounded regardless of track length"""
+        import librosa
+        from audio_stream import stream_features, estimate_tempo
+        print(f"Analyzing audio (streaming): {audio_path}")
+        sr, hop = self.sample_rate, self.hop_length
+        # Loading, RMS, centroid and both onset envelopes come from one pass
+        with stage("stream_features"):
+            rms, cent, onset_env, beat_env, sample_count = stream_features(audio_path, sr, hop, self.n_fft)
+        
+        duration = sample_count / sr
+        frame_count = int(duration / self.frame_interval)
+        
+        # beat_track would compute a median-aggregated onset envelope from y,
+        # and a whole-track tempogram unless it's given the tempo
+        with stage("beat_track"):
+            tempo, beats = librosa.beat.beat_track(onset_envelope=beat_env, sr=sr, hop_length=hop,
+                                                   bpm=estimate_tempo(beat_env, sr, hop))
+        beat_times = librosa.frames_to_time(beats, sr=sr, hop_length=hop)
         
+        with stage("onset"):
+            onsets = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr, hop_length=hop)
+        onset_times = librosa.frames_to_time(onsets, sr=sr, hop_length=hop)
+        
+        return self._analysis_result(frame_count, duration, beat_times, onset_times, rms, cent)
+
+    def _analysis_result(self, frame_count, duration, beat_times, onset_times, rms, cent):
+        # rms and spectral_centroid have one value per feature_step_ms, starting
+        # at feature_start (librosa centers frame i on sample i * hop)
         return {
             "frame_count": int(frame_count),
             "beat_times": beat_times.tolist(),
             "onset_times": onset_times.tolist(),
             "rms": rms.tolist(),
-            "rms_times": rms_times.tolist(),
             "spectral_centroid": cent.tolist(),
-            "duration": float(duration)
+            "duration": float(duration),
+            "feature_start": 0.0,
+            "feature_step_ms": float(self.feature_step_ms)
         }
 
+    def _derived_arrays(self, analysis):
+        """Cache of arrays derived from this analysis (the last one asked for)"""
+        if self._derived_for is not analysis:
+            self._derived_for, self._derived = analysis, {}
+        return self._derived
+
+    def event_index(self, analysis):
+        """EventIndex (frame-aligned beats and onsets, beat phase, bar position) of an analysis, built once"""
+        derived = self._derived_arrays(analysis)
+        if "events" not in derived:
+            derived["events"] = build_event_index(analysis, self.step_time_ms)
+        return derived["events"]
+
+    def frame_feature(self, analysis, key):
+        """
+        analysis[key] (a per-feature-frame array) with one value per light frame.
+        Aligned analyses already have one feature frame per light frame,
+        others are interpolated onto the frame grid. Computed once per
+        analysis; the returned array is read-only.
+        """
+        derived = self._derived_arrays(analysis)
+        if key not in derived:
+            derived[key] = self._frame_feature(analysis, key)
+            derived[key].flags.writeable = False
+        return derived[key]
+
+    def _frame_feature(self, analysis, key):
+        frame_count = analysis["frame_count"]
+        values = np.asarray(analysis[key], dtype=float)
+        if analysis.get("feature_step_ms") == self.step_time_ms and len(values):
+            # Feature frames are centered on light frames, just trim or repeat the last value
+            return np.pad(values[:frame_count], (0, max(0, frame_count - len(values))), mode="edge")
+        times = analysis["feature_start"] + np.arange(len(values)) * (analysis["feature_step_ms"] / 1000)
+        return np.interp(
+            np.linspace(0, analysis["duration"], frame_count),
+            times,
+            values
+        )
+
     def generate_fseq(self, analysis, output_path):
         frame_count = analysis["frame_count"]
-        # Light data: frame_count rows, channel_count columns
-        # Initialize with zeros
-        data = np.zeros((frame_count, self.channel_count), dtype=np.uint8)
-        
-        # 1. Map Beats to Tail Lights (Channels 26, 27) and Signature (5, 6)
-        for t in analysis["beat_times"]:
-            frame = int(t / self.frame_interval)
-            if frame < frame_count:
-                # Flash for 5 frames (100ms)
-                end_frame = min(frame + 5, frame_count)
-                data[frame:end_frame, 25] = 255 # Tail L (0-indexed 25)
-                data[frame:end_frame, 26] = 255 # Tail R (0-indexed 26)
-                data[frame:end_frame, 4] = 255  # Signature L (0-indexed 4)
-                data[frame:end_frame, 5] = 255  # Signature R (0-indexed 5)
-
-        # 2. Map Onsets to Main Beams (Channels 1-4)
-        for t in analysis["onset_times"]:
-            frame = int(t / self.frame_interval)
-            if frame < frame_count:
-                # Short flash for 3 frames (60ms)
-                end_frame = min(frame + 3, frame_count)
-                data[frame:end_frame, 0:4] = 255 # Beams
+        with stage("render"):
+            show = self._render_show(analysis)
+
+        # Data: Row-major (all channels for frame 0, then frame 1...)
+        # written as V2 Uncompressed one chunk at a time
+        with stage("fseq_write"):
+            write_fseq(output_path, show.iter_chunks(), self.channel_count, self.step_time_ms)
+            
+        print(f"Successfully generated {output_path}")
+        print(f"Total frames: {frame_count}, Duration: {datetime.timedelta(seconds=analysis['duration'])}")
+
+    def _render_show(self, analysis):
+        """SparseShow of the single-car show for an analysis"""
+        frame_count = analysis["frame_count"]
+        events = self.event_index(analysis)
+        
+        # 1. Map Beats to Tail Lights (Channels 26, 27), Signature (5, 6) and the rear light bar
+        # Flash for 5 frames (100ms)
+        beat_on = events.flash_mask("beat", 5)
+
+        # 2. Map Onsets to Main Beams (Channels 1-4) and the offroad light bar
+        # Short flash for 3 frames (60ms)
+        onset_on = events.flash_mask("onset", 3)
 
         # 3. Use RMS for Fog Lights (Channels 15, 16) - threshold-based
         # Resample RMS to match frame count
-        rms_resampled = np.interp(
-            np.linspace(0, analysis["duration"], frame_count),
-            analysis["rms_times"],
-            analysis["rms"]
-        )
+        rms_resampled = self.frame_feature(analysis, "rms")
         rms_threshold = np.mean(rms_resampled) * 1.5
-        for f in range(frame_count):
-            if rms_resampled[f] > rms_threshold:
-                data[f, 14] = 255 # Fog L (0-indexed 14)
-                data[f, 15] = 255 # Fog R (0-indexed 15)
+        fog_on = rms_resampled > rms_threshold
 
         # 4. Use Spectral Centroid for Turn Signals (Channels 13, 14)
         # Highly "bright" sounds trigger turn signals
-        cent_resampled = np.interp(
-            np.linspace(0, analysis["duration"], frame_count),
-            analysis["rms_times"],
-            analysis["spectral_centroid"]
-        )
+        cent_resampled = self.frame_feature(analysis, "spectral_centroid")
         cent_threshold = np.percentile(cent_resampled, 90)
-        for f in range(frame_count):
-            if cent_resampled[f] > cent_threshold:
-                # Alternate L/R
-                if (f // 10) % 2 == 0:
-                    data[f, 12] = 255 # Turn L (0-indexed 12)
-                else:
-                    data[f, 13] = 255 # Turn R (0-indexed 13)
-
-        # Write binary file
-        # Header: PSEQ (4), start_offset (2), minor (1), major (1), fixed (2), 
-        # channel_count (4), frame_count (4), step_time (1), others...
-        # Total header size should be 24 (min)
-        
-        with open(output_path, "wb") as f:
-            f.write(b"PSEQ")
-            f.write(struct.pack("<H", 24)) # Start offset
-            f.write(struct.pack("<B", 0))  # Minor version
-            f.write(struct.pack("<B", 2))  # Major version
-            f.write(struct.pack("<H", 0))  # Fixed
-            f.write(struct.pack("<I", self.channel_count))
-            f.write(struct.pack("<I", frame_count))
-            f.write(struct.pack("<B", self.step_time_ms))
-            f.write(struct.pack("<B", 0))  # Encoding
-            f.write(struct.pack("<H", 0))  # Reserved
-            f.write(struct.pack("<B", 0))  # Compression
-            f.write(struct.pack("<B", 0))  # Reserved
-            
-            # Data: Row-major (all channels for frame 0, then frame 1...)
-            # We want to ensure it's V2 Uncompressed
-            f.write(data.tobytes())
-            
-        print(f"Successfully generated {output_path}")
-        print(f"Total frames: {frame_count}, Duration: {datetime.timedelta(seconds=analysis['duration'])}")
+        turn_on = cent_resampled > cent_threshold
+        # Alternate L/R every 10 frames
+        turn_left = (np.arange(frame_count) // 10) % 2 == 0
+
+        # (0-indexed channels, per-frame on mask), kept as on/off runs
+        channels = self.show_channels
+        show = SparseShow(frame_count, self.channel_count)
+        show.add_mask(channels["beat"], beat_on) # Tail L/R, Signature L/R, rear light bar
+        show.add_mask(channels["onset"], onset_on) # Beams, offroad light bar
+        show.add_mask(channels["fog"], fog_on) # Fog L/R
+        show.add_mask(channels["turn_left"], turn_on & turn_left) # Turn L
+        show.add_mask(channels["turn_right"], turn_on & ~turn_left) # Turn R
+
+        # 5. RMS level meter on the front light bar (200 channels): node k of
+        # each half is lit while the loudness is above k / nodes of the peak,
+        # each level held for METER_HOLD_FRAMES so nodes don't flicker
+        meter = channels["meter"]
+        if meter.shape[1] and frame_count:
+            peak = np.max(rms_resampled)
+            lit_nodes = np.round(rms_resampled / peak * meter.shape[1]) if peak > 0 else np.zeros(frame_count)
+            held = np.pad(lit_nodes, (METER_HOLD_FRAMES - 1, 0), mode="edge")
+            lit_nodes = np.lib.stride_tricks.sliding_window_view(held, METER_HOLD_FRAMES).max(axis=1)
+            for k in range(meter.shape[1]):
+                show.add_mask(meter[:, k], lit_nodes > k)
+        return show
 
     def generate_matrix_show(self, analysis, output_dir, rows=10, cols=10):
+        with stage("render"):
+            level = self._matrix_levels(analysis, rows, cols)
+        
+        # Channel values for each intensity level
+        # Low intensity: Signature lights
+        # High intensity: Signature + Main Beams + Fog (+ light bars with 200 channels)
+        level_channels = np.zeros((3, self.channel_count), dtype=np.uint8)
+        level_channels[1, self.show_channels["matrix_low"]] = 255
+        level_channels[2, self.show_channels["matrix_high"]] = 255
+
+        # Generate files for each car
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        print(f"Generating matrix show {rows}x{cols}...")
+        
+        with stage("fseq_write"):
+            for r in range(rows):
+                for c in range(cols):
+                    # (frames, channels) for this car, one lookup per chunk
+                    chunks = (level_channels[level[start:stop, r, c]]
+                              for start, stop in iter_chunks(level.shape[0]))
+                    
+                    # Write individual file
+                    filename = f"{r}_{c}.fseq"
+                    path = os.path.join(output_dir, filename)
+                    write_fseq(path, chunks, self.channel_count, self.step_time_ms)
+
+    def _matrix_levels(self, analysis, rows, cols):
+        """
+        Per-car intensity level for every frame, shape (frames, rows, cols):
+        0 = off, 1 = low (signature lights), 2 = high (beams and fog).
+        """
         frame_count = analysis["frame_count"]
-        # Grid state: [frames, rows, cols]
-        # We'll use a simplified normalized intensity 0.0-1.0
-        grid_intensity = np.zeros((frame_count, rows, cols))
         
         center_r, center_c = rows / 2, cols / 2
         max_dist = np.sqrt(center_r**2 + center_c**2)
         
         # 1. Beat Ripple Effect
-        # For each beat, expand a ring
-        beat_frames = [int(t / self.frame_interval) for t in analysis["beat_times"]]
-        for t_frame in beat_frames:
-            # Effect lasts 20 frames (~400ms)
-            for i in range(20):
-                curr_frame = t_frame + i
-                if curr_frame >= frame_count: break
-                
-                # Radius expands
-                radius = (i / 20.0) * max_dist * 1.5
-                thickness = 1.5
-                
-                # Check all cells
-                for r in range(rows):
-                    for c in range(cols):
-                        dist = np.sqrt((r - center_r)**2 + (c - center_c)**2)
-                        if abs(dist - radius) < thickness:
-                            grid_intensity[curr_frame, r, c] += 0.8
-
-        # 2. Spectral Centroid Vertical Sweep
-        # Map centroid to horizontal position or vertical sweep
-        cent_resampled = np.interp(
-            np.linspace(0, analysis["duration"], frame_count),
-            analysis["rms_times"],
-            analysis["spectral_centroid"]
-        )
+        # For each beat, expand a ring over 20 frames (~400ms)
+        ripple_frames = 20
+        thickness = 1.5
+        grid_r, grid_c = np.meshgrid(np.arange(rows), np.arange(cols), indexing='ij')
+        dist = np.sqrt((grid_r - center_r)**2 + (grid_c - center_c)**2)
+        radius = (np.arange(ripple_frames) / 20.0) * max_dist * 1.5
+        rings = np.abs(dist[None, :, :] - radius[:, None, None]) < thickness
+        
+        ripple = np.zeros((frame_count, rows, cols), dtype=bool)
+        beat_frames = self.event_index(analysis).beats
+        for i in range(ripple_frames):
+            frames = beat_frames + i
+            ripple[frames[frames < frame_count]] |= rings[i]
+            
+        # A ring adds 0.8, which is above the high threshold on its own
+        level = ripple.astype(np.uint8) * 2
+
+        # 2. Spectral Centroid Sweep
+        # Active column based on frequency height (adds 0.5, i.e. low)
+        cent_resampled = self.frame_feature(analysis, "spectral_centroid")
         # Normalize centroid 0-1
         cent_min, cent_max = np.min(cent_resampled), np.max(cent_resampled)
         if cent_max > cent_min:
@@ -168,73 +350,37 @@ class TeslaLightShowGenerator:
         else:
             cent_norm = np.zeros(frame_count)
             
-        for f in range(frame_count):
-            # Bar moves from left to right based on frequency height
-            # Or simplified: Active column based on frequency
-            active_col = int(cent_norm[f] * (cols - 1))
-            grid_intensity[f, :, active_col] += 0.5
+        active_col = (cent_norm * (cols - 1)).astype(int)
+        all_frames = np.arange(frame_count)
+        level[all_frames, :, active_col] = np.maximum(level[all_frames, :, active_col], 1)
 
         # 3. RMS Global Flash
-        rms_resampled = np.interp(
-            np.linspace(0, analysis["duration"], frame_count),
-            analysis["rms_times"],
-            analysis["rms"]
-        )
+        # Override every car to full intensity on high energy frames
+        rms_resampled = self.frame_feature(analysis, "rms")
         rms_threshold = np.mean(rms_resampled) * 2.0
+        level[rms_resampled > rms_threshold] = 2
         
-        # Clamp values
-        np.clip(grid_intensity, 0, 1, out=grid_intensity)
-
-        # Generate files for each car
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        return level
 
-        print(f"Generating matrix show {rows}x{cols}...")
-        
-        for r in range(rows):
-            for c in range(cols):
-                # Init car data
-                data = np.zeros((frame_count, self.channel_count), dtype=np.uint8)
-                
-                for f in range(frame_count):
-                    val = grid_intensity[f, r, c]
-                    
-                    # Global RMS override for high energy
-                    if rms_resampled[f] > rms_threshold:
-                        val = 1.0
-                        
-                    if val > 0.1:
-                        # Map intensity to different lights based on threshold
-                        # Low intensity: Signature lights
-                        data[f, 4] = 255 # Sig L
-                        data[f, 5] = 255 # Sig R
-                        
-                        # High intensity: Main Beams + Fog
-                        if val > 0.5:
-                            data[f, 0:4] = 255 # Beams
-                            data[f, 14] = 255 # Fog L
-                            data[f, 15] = 255 # Fog R
-                
-                # Write individual file
-                filename = f"{r}_{c}.fseq"
-                path = os.path.join(output_dir, filename)
-                self._write_fseq_file(data, path)
-                
-    def _write_fseq_file(self, data, path):
-         with open(path, "wb") as f:
-            f.write(b"PSEQ")
-            f.write(struct.pack("<H", 24))
-            f.write(struct.pack("<B", 0))
-            f.write(struct.pack("<B", 2))
-            f.write(struct.pack("<H", 0))
-            f.write(struct.pack("<I", self.channel_count))
-            f.write(struct.pack("<I", len(data)))
-            f.write(struct.pack("<B", self.step_time_ms))
-            f.write(struct.pack("<B", 0))
-            f.write(struct.pack("<H", 0))
-            f.write(struct.pack("<B", 0))
-            f.write(struct.pack("<B", 0))
-            f.write(data.tobytes())
+def warm_up(aligned=False, duration_s=WARM_UP_DURATION_S):
+    """
+    Run both analysis paths on a short synthetic track, so librosa's lazily
+    loaded submodules are imported and its numba kernels compiled before the
+    first real analysis. Processes forked afterwards (gunicorn workers, job
+    workers) start with all of that done. Returns the seconds it took.
+    """
+    import soundfile as sf
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        # Clicks over a quiet tone: enough structure for beats and onsets to be found
+        sr = DEFAULT_SAMPLE_RATE
+        t = np.arange(int(duration_s * sr)) / sr
+        y = 0.1 * np.sin(2 * np.pi * 220 * t) + np.where(t % 0.5 < 0.01, np.sin(2 * np.pi * 1000 * t), 0)
+        path = os.path.join(tmp, "warm_up.wav")
+        sf.write(path, y.astype(np.float32), sr)
+        for streaming in (False, True):
+            TeslaLightShowGenerator(streaming=streaming, aligned=aligned)._analyze_audio(path)
+    return time.perf_counter() - start
 
 if __name__ == "__main__":
     import sys
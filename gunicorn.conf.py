@@ -0,0 +1,22 @@
+# gunicorn settings: gunicorn -c gunicorn.conf.py server:app
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+# Open preview streams don't hold up other requests; server.py caps them below this (PREVIEW_MAX_STREAMS)
+# so some threads are always left for everything else
+threads = 8
+# Import the app once in the master; workers are forked from it and share its memory copy-on-write
+preload_app = True
+
+WARM_UP = os.environ.get('WARM_UP', '1') == '1' # Compile librosa's kernels before forking workers
+
+def on_starting(server):
+    """
+    Runs in the master before any worker is forked. Analysing a short track
+    here loads scipy and compiles librosa's numba kernels once, instead of
+    in every worker (and every job process) on its first analysis.
+    """
+    if not WARM_UP: return
+    from generator import warm_up
+    seconds = warm_up(aligned=os.environ.get('ANALYSIS_ALIGNED', '0') == '1')
+    server.log.info(f"Audio analysis warmed up in {seconds:.1f}s")
@@ -0,0 +1,225 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from metrics import JobTracker
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    pass
+
+class JobQueueFull(Exception):
+    pass
+
+def _write_state(jobs_dir, job_id, **fields):
+    """Merge fields into the job's state file (atomic replace)"""
+    path = os.path.join(jobs_dir, f"{job_id}.json")
+    state = _read_state(jobs_dir, job_id) or {"id": job_id}
+    state.update(fields)
+    state["updated"] = time.time()
+
+    fd, tmp_path = tempfile.mkstemp(dir=jobs_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+    return state
+
+def _read_state(jobs_dir, job_id):
+    try:
+        with open(os.path.join(jobs_dir, f"{job_id}.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+class JobContext:
+    """
+    Passed to task functions inside the worker process.
+    Tasks report progress through it and call check_cancelled() between
+    stages so a running job can be stopped.
+    """
+    def __init__(self, jobs_dir, job_id):
+        self.jobs_dir = jobs_dir
+        self.job_id = job_id
+
+    def progress(self, fraction, stage=None):
+        self.check_cancelled()
+        fields = {"progress": round(float(fraction), 3)}
+        if stage is not None:
+            fields["stage"] = stage
+        _write_state(self.jobs_dir, self.job_id, **fields)
+
+    def cancelled(self):
+        return os.path.exists(os.path.join(self.jobs_dir, f"{self.job_id}.cancel"))
+
+    def check_cancelled(self):
+        if self.cancelled():
+            raise JobCancelled()
+
+def _run_job(jobs_dir, job_id, kind, fn, args, profile_path=None):
+    """Worker-side wrapper: runs the task and records its outcome, timings and peak memory"""
+    ctx = JobContext(jobs_dir, job_id)
+    tracker = JobTracker(kind, profile_path)
+    try:
+        ctx.check_cancelled()
+        _write_state(jobs_dir, job_id, status=RUNNING, started=time.time())
+        with tracker:
+            result = fn(ctx, *args)
+    except JobCancelled:
+        _write_state(jobs_dir, job_id, status=CANCELLED, metrics=tracker.finish(CANCELLED))
+        return
+    except Exception as e:
+        traceback.print_exc()
+        _write_state(jobs_dir, job_id, status=FAILED, error=str(e), metrics=tracker.finish(FAILED))
+        return
+    _write_state(jobs_dir, job_id, status=DONE, progress=1.0, result=result, metrics=tracker.finish(DONE))
+
+class JobManager:
+    """
+    Runs CPU-bound tasks in a bounded process pool.
+    Job state lives in small JSON files under jobs_dir, so any HTTP worker
+    can report status or cancel a job no matter which process submitted it.
+    Task functions must be module-level (picklable) and take a JobContext
+    as their first argument. Jobs submitted with profile=True are run under
+    cProfile, dumped to profile_dir/<job_id>.prof.
+    """
+    def __init__(self, jobs_dir, max_workers=None, max_pending=100, initializer=None, initargs=(), profile_dir=None):
+        self.jobs_dir = jobs_dir
+        self.profile_dir = profile_dir
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.initializer = initializer
+        self.initargs = initargs
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+        os.makedirs(jobs_dir, exist_ok=True)
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    def _get_executor(self):
+        # Created lazily so each forked HTTP worker gets its own pool
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=self.initializer,
+                initargs=self.initargs
+            )
+        return self._executor
+
+    def _submit(self, *args):
+        try:
+            return self._get_executor().submit(*args)
+        except BrokenProcessPool:
+            # A worker died (OOM kill, segfault) and took the pool with it; its jobs
+            # were already marked failed by _on_done, start a fresh pool for new ones
+            print("Job pool broken, starting a new one")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            return self._get_executor().submit(*args)
+
+    def pending(self):
+        """Jobs submitted from this process that haven't finished"""
+        return sum(1 for f in list(self._futures.values()) if not f.done())
+
+    def submit(self, kind, fn, *args, profile=False):
+        with self._lock:
+            pending = self.pending()
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"Too many pending jobs ({pending})")
+
+            job_id = str(uuid.uuid4())
+            profile_path = None
+            fields = {}
+            if profile and self.profile_dir:
+                profile_path = os.path.join(self.profile_dir, f"{job_id}.prof")
+                fields["profile"] = os.path.basename(profile_path)
+            _write_state(self.jobs_dir, job_id, kind=kind, status=QUEUED,
+                         progress=0.0, stage=None, created=time.time(), **fields)
+            try:
+                future = self._submit(_run_job, self.jobs_dir, job_id, kind, fn, args, profile_path)
+            except Exception as e:
+                _write_state(self.jobs_dir, job_id, status=FAILED, error=str(e))
+                raise
+            self._futures[job_id] = future
+
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        return job_id
+
+    def _on_done(self, job_id, future):
+        with self._lock:
+            self._futures.pop(job_id, None)
+        if future.cancelled():
+            _write_state(self.jobs_dir, job_id, status=CANCELLED)
+        elif future.exception() is not None:
+            # The worker process died before _run_job could record anything
+            _write_state(self.jobs_dir, job_id, status=FAILED, error=str(future.exception()))
+
+    def status(self, job_id):
+        return _read_state(self.jobs_dir, job_id)
+
+    def cancel(self, job_id):
+        """Request cancellation. Returns False if the job is unknown or already finished."""
+        state = self.status(job_id)
+        if state is None or state.get("status") in FINISHED_STATES:
+            return False
+
+        # Flag file is seen by the worker at its next stage boundary
+        open(os.path.join(self.jobs_dir, f"{job_id}.cancel"), "w").close()
+
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.cancel()
+        return True
+
+    def expire(self, max_age_s):
+        """
+        Remove the state and cancel flag files of jobs that finished more
+        than max_age_s ago, and leftover temporary files. Returns the
+        number of files removed.
+        """
+        cutoff = time.time() - max_age_s
+        removed = 0
+        with os.scandir(self.jobs_dir) as it:
+            entries = list(it)
+        for e in entries:
+            job_id, ext = os.path.splitext(e.name)
+            try:
+                if ext == ".json":
+                    state = _read_state(self.jobs_dir, job_id)
+                    if state is None or state.get("status") not in FINISHED_STATES: continue
+                    if state.get("updated", 0) > cutoff: continue
+                elif ext in (".cancel", ".tmp"):
+                    # Flags of jobs whose state is gone, temporaries of interrupted writes
+                    if ext == ".cancel" and os.path.exists(os.path.join(self.jobs_dir, f"{job_id}.json")): continue
+                    if e.stat().st_mtime > cutoff: continue
+                else:
+                    continue
+                os.remove(e.path)
+                removed += 1
+                if ext == ".json":
+                    try:
+                        os.remove(os.path.join(self.jobs_dir, f"{job_id}.cancel"))
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+            except FileNotFoundError:
+                continue # Removed by another process
+        return removed
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
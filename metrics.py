@@ -0,0 +1,290 @@
+import cProfile
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Bucket upper bounds
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+JOB_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+REQUEST_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RSS_BUCKETS = tuple(2 ** n * 1024 * 1024 for n in range(5, 15)) # 32 MiB .. 16 GiB
+
+# name -> (help, buckets)
+HISTOGRAMS = {
+    "lightshow_stage_seconds": ("Time spent in each analysis, render and write stage", STAGE_BUCKETS),
+    "lightshow_job_seconds": ("Job run time by kind and outcome", JOB_BUCKETS),
+    "lightshow_job_peak_rss_bytes": ("Peak resident memory of the worker process during a job", RSS_BUCKETS),
+    "lightshow_http_request_seconds": ("Time to produce an HTTP response (streamed bodies not included)", REQUEST_BUCKETS),
+}
+
+FLUSH_INTERVAL_S = 5 # How often a process publishes its histograms to metrics_dir
+RETIRED_FILE = "retired.json" # Summed histograms of processes that have exited
+PUBLISHED_PATTERN = re.compile(r"^(\d+)-[0-9a-f]+\.json$") # <pid>-<token>.json
+
+class MetricsRegistry:
+    """
+    Histograms for this process. With a metrics_dir each process (HTTP
+    worker or job worker) publishes its own to a file there, and collect()
+    adds up every file so /metrics reports all processes whichever one
+    serves it.
+    """
+    def __init__(self, metrics_dir=None):
+        self.metrics_dir = None
+        self._lock = threading.Lock()
+        self._reset()
+        self.configure(metrics_dir)
+
+    def configure(self, metrics_dir):
+        self.metrics_dir = metrics_dir
+        if metrics_dir:
+            os.makedirs(metrics_dir, exist_ok=True)
+
+    def _reset(self):
+        # A forked child starts from zero rather than counting its parent's observations again
+        self._pid = os.getpid()
+        self._token = f"{self._pid}-{uuid.uuid4().hex[:8]}"
+        self._values = {} # (name, sorted label items) -> [bucket counts..., sum, count]
+        self._dirty = False
+        self._flushed = 0.0
+
+    def observe(self, name, value, **labels):
+        buckets = HISTOGRAMS[name][1]
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    values[i] += 1
+                    break
+            values[-2] += value
+            values[-1] += 1
+            self._dirty = True
+
+    def flush(self, force=False):
+        """Publish this process's histograms, at most every FLUSH_INTERVAL_S unless forced"""
+        if not self.metrics_dir: return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if not self._dirty or (not force and time.monotonic() - self._flushed < FLUSH_INTERVAL_S): return
+            data = json.dumps([[name, labels, values] for (name, labels), values in self._values.items()])
+            self._dirty = False
+            self._flushed = time.monotonic()
+            token = self._token
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.metrics_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(self.metrics_dir, f"{token}.json"))
+
+    def collect(self):
+        """Summed {(name, labels): values} over this process and every published one"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            own = f"{self._token}.json"
+            total = {key: list(values) for key, values in self._values.items()}
+
+        if self.metrics_dir:
+            for name in os.listdir(self.metrics_dir):
+                if not name.endswith(".json") or name == own: continue
+                _add(total, _read(os.path.join(self.metrics_dir, name)))
+        return total
+
+    def retire_exited(self):
+        """
+        Fold the files of processes that have exited into RETIRED_FILE and
+        remove them, so totals stay cumulative while metrics_dir holds one
+        file per live process. Not safe to run in two processes at once
+        (the storage sweeper takes turns). Returns the number removed.
+        """
+        if not self.metrics_dir: return 0
+        exited = [name for name in os.listdir(self.metrics_dir) if exited_process_file(name)]
+        if not exited: return 0
+        retired_path = os.path.join(self.metrics_dir, RETIRED_FILE)
+        retired = _add({}, _read(retired_path))
+        for name in exited:
+            _add(retired, _read(os.path.join(self.metrics_dir, name)))
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.metrics_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump([[name, labels, values] for (name, labels), values in retired.items()], f)
+        os.replace(tmp_path, retired_path)
+        for name in exited:
+            try:
+                os.remove(os.path.join(self.metrics_dir, name))
+            except FileNotFoundError:
+                pass
+        return len(exited)
+
+    def render(self):
+        """Prometheus text exposition of collect()"""
+        collected = self.collect()
+        lines = []
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), values in sorted(collected.items()):
+                if metric != name: continue
+                cumulative = 0
+                for bound, count in zip(buckets, values):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, le=_number(bound))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {values[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(values[-2])}")
+                lines.append(f"{name}_count{_labels(labels)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+def _read(path):
+    """(key, values) of the valid histograms in a published file"""
+    try:
+        with open(path) as f:
+            published = json.load(f)
+    except (OSError, ValueError):
+        return
+    for metric, labels, values in published:
+        if metric not in HISTOGRAMS or len(values) != len(HISTOGRAMS[metric][1]) + 2: continue
+        yield (metric, tuple(tuple(item) for item in labels)), values
+
+def _add(total, items):
+    for key, values in items:
+        if key in total:
+            total[key] = [a + b for a, b in zip(total[key], values)]
+        else:
+            total[key] = values
+    return total
+
+def exited_process_file(name):
+    """Whether a <pid>-<token>.json file belongs to a process that no longer runs"""
+    match = PUBLISHED_PATTERN.match(name)
+    if not match or os.name == "nt": return False # os.kill(pid, 0) would terminate it on Windows
+    try:
+        os.kill(int(match.group(1)), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass # Running, as another user
+    return False
+
+def prune_profiles(profile_dir, max_files, max_age_s):
+    """Remove cProfile dumps older than max_age_s, then the oldest past max_files; returns how many"""
+    try:
+        with os.scandir(profile_dir) as it:
+            dumps = sorted(((e.stat().st_mtime, e.path) for e in it if e.name.endswith(".prof")), reverse=True)
+    except FileNotFoundError:
+        return 0
+    cutoff = time.time() - max_age_s
+    removed = 0
+    for i, (mtime, path) in enumerate(dumps):
+        if i < max_files and mtime >= cutoff: continue
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def _number(value):
+    return repr(float(value))
+
+def _labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items: return ""
+    escaped = (re.sub(r'(["\\])', r'\\\1', str(v)).replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+def gauge(name, help_text, value):
+    """Exposition lines for a single unlabelled gauge"""
+    return f"# HELP {name} {help_text}\n# TYPE {name} gauge\n{name} {_number(value)}\n"
+
+registry = MetricsRegistry()
+_local = threading.local()
+
+@contextmanager
+def stage(name):
+    """Time a block as stage `name`, also adding it to the running job's stage totals"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe("lightshow_stage_seconds", elapsed, stage=name)
+        stages = getattr(_local, "stages", None)
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + elapsed
+
+def reset_peak_rss():
+    """Start peak RSS tracking afresh (Linux only; elsewhere the peak covers the whole process)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def peak_rss_bytes():
+    """Peak resident memory in bytes, or None where it can't be read (Windows)"""
+    try:
+        with open("/proc/self/status") as f:
+            match = re.search(r"^VmHWM:\s+(\d+) kB", f.read(), re.MULTILINE)
+        if match:
+            return int(match.group(1)) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # macOS reports bytes, Linux KiB
+
+class JobTracker:
+    """
+    Stage timings, run time and peak RSS of one job run inside `with`,
+    optionally profiled with cProfile into profile_path.
+    """
+    def __init__(self, kind, profile_path=None):
+        self.kind = kind
+        self.profile_path = profile_path
+        self.stages = {}
+        self.seconds = 0.0
+        self.peak_rss = None
+        self._profiler = None
+
+    def __enter__(self):
+        _local.stages = self.stages
+        reset_peak_rss()
+        if self.profile_path:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._started
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_path)
+        self.peak_rss = peak_rss_bytes()
+        _local.stages = None
+
+    def finish(self, status):
+        """Record the job's histograms and return its summary for the job state"""
+        registry.observe("lightshow_job_seconds", self.seconds, kind=self.kind, status=status)
+        if self.peak_rss is not None:
+            registry.observe("lightshow_job_peak_rss_bytes", self.peak_rss, kind=self.kind)
+        registry.flush(force=True)
+        return {
+            "seconds": round(self.seconds, 4),
+            "peak_rss_bytes": self.peak_rss,
+            "stages": {name: round(seconds, 4) for name, seconds in self.stages.items()}
+        }
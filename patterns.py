@@ -0,0 +1,203 @@
+import functools
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# GIF presets shipped with the xLights project, referenced by file name (with or without .gif)
+PRESETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "xlights", "tesla_project", "tesla_xlights_show_folder", "presets")
+IMAGE_EXTENSIONS = (".gif", ".png", ".jpg", ".jpeg")
+# Uploaded images are stored under their content hash (see Storage.save_upload), outside the swept uploads
+UPLOADED_IMAGE_PATTERN = re.compile(r"^[0-9a-f]{64}\.(gif|png|jpg|jpeg)$")
+DECODED_CACHE_BYTES = 256 * 1024 * 1024 # Decoded frame stacks kept per process
+DEFAULT_FRAME_DURATION_MS = 100
+DEFAULT_BPM = 120
+DEFAULT_THRESHOLD = 128
+IMAGE_FITS = ("pixel", "stretch")
+
+class PatternError(Exception):
+    pass
+
+class Pattern:
+    """
+    Decoded image clip source: frames is a read-only (frames, height, width)
+    uint8 stack of brightness (luminance scaled by alpha, as the editor
+    computes it), every GIF frame composited over the ones before it.
+    """
+    def __init__(self, frames):
+        self.frames = frames
+        self.pixels = frames.reshape(len(frames), -1) # Flat pixel index -> brightness, per frame
+
+    @property
+    def height(self):
+        return self.frames.shape[1]
+
+    @property
+    def width(self):
+        return self.frames.shape[2]
+
+    @property
+    def nbytes(self):
+        return self.frames.nbytes
+
+    def cells(self, rows, cols, fit="pixel"):
+        return cell_map(self.height, self.width, rows, cols, fit)
+
+    def channels(self, count):
+        return channel_map(self.height, self.width, count)
+
+    def describe(self):
+        return {"width": self.width, "height": self.height, "frames": len(self.frames)}
+
+@functools.lru_cache(maxsize=None)
+def cell_map(height, width, rows, cols, fit="pixel"):
+    """
+    (rows, cols) flat pixel index each car of a matrix samples, -1 where
+    it falls outside the image. "pixel" maps car (row, col) to pixel
+    (row, col) like the editor preview; "stretch" scales the image over
+    the whole grid.
+    """
+    r, c = np.arange(rows)[:, None], np.arange(cols)[None, :]
+    if fit == "stretch":
+        index = ((2 * r + 1) * height // (2 * rows)) * width + (2 * c + 1) * width // (2 * cols)
+    else:
+        index = np.where((r < height) & (c < width), r * width + c, -1)
+    index.flags.writeable = False
+    return index
+
+@functools.lru_cache(maxsize=None)
+def channel_map(height, width, count):
+    """Flat pixel index each of count channels samples: evenly spaced along the image's middle row, left to right"""
+    index = (height // 2) * width + (2 * np.arange(count) + 1) * width // (2 * count)
+    index.flags.writeable = False
+    return index
+
+def decode(path):
+    """Pattern of a GIF (all frames) or still image"""
+    from PIL import Image, ImageSequence
+
+    try:
+        with Image.open(path) as image:
+            frames = [_brightness(np.asarray(frame.convert("RGBA"))) for frame in ImageSequence.Iterator(image)]
+    except (OSError, ValueError) as e:
+        raise PatternError(f"Could not decode image {os.path.basename(path)}: {e}")
+    frames = np.stack(frames)
+    frames.flags.writeable = False
+    return Pattern(frames)
+
+def _brightness(rgba):
+    rgba = rgba.astype(float)
+    luminance = 0.299 * rgba[..., 0] + 0.587 * rgba[..., 1] + 0.114 * rgba[..., 2]
+    return np.floor(luminance * (rgba[..., 3] / 255)).astype(np.uint8)
+
+def clip_brightness(pattern, clip, rel_time_ms, pixels):
+    """
+    0-255 brightness of an image clip at each time into the clip, sampled
+    at pixels (flat indices from cells() or channels(), -1 for none) which
+    broadcast against rel_time_ms. Frame timing (frameDuration, or bpm and
+    beatsPerFrame in beat timingMode; repetitions, then the last frame is
+    held) and brightnessMode follow ShowRenderer.
+    """
+    if clip.get("timingMode", "frame") == "beat":
+        frame_ms = 60000 / (clip.get("bpm") or DEFAULT_BPM) * (clip.get("beatsPerFrame") or 1)
+    else:
+        frame_ms = clip.get("frameDuration") or DEFAULT_FRAME_DURATION_MS
+    count = len(pattern.frames)
+    shown = np.clip(np.floor(rel_time_ms / frame_ms), 0, count * (clip.get("repetitions") or 1) - 1)
+    shown = shown.astype(np.int64) % count
+
+    brightness = np.where(pixels >= 0, pattern.pixels[shown, np.maximum(pixels, 0)], 0)
+    if clip.get("brightnessMode", "gradient") == "binary":
+        brightness = np.where(brightness > (clip.get("brightnessThreshold") or DEFAULT_THRESHOLD), 255, 0)
+    return brightness
+
+class PatternLibrary:
+    """
+    Resolves image names (presets, or ids of uploaded images) and keeps the
+    decoded patterns in memory, least recently used first out past
+    max_bytes. Entries are keyed by file content hash, so clips, cars and
+    exports using the same image (under any name) decode it once.
+    """
+    def __init__(self, max_bytes=DECODED_CACHE_BYTES, presets_dir=PRESETS_DIR):
+        self.max_bytes = max_bytes
+        self.presets_dir = presets_dir
+        self.image_dir = None
+        self._decoded = OrderedDict() # sha256 -> Pattern
+        self._hashes = {} # path -> (mtime_ns, size, sha256)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, image_dir):
+        """Also resolve uploaded images, stored in image_dir"""
+        self.image_dir = image_dir
+
+    def path(self, name):
+        """File of a preset or uploaded image name, or None"""
+        if not isinstance(name, str): return None
+        if UPLOADED_IMAGE_PATTERN.match(name):
+            path = os.path.join(self.image_dir, name) if self.image_dir else None
+        elif os.path.basename(name) == name and not name.startswith("."):
+            path = os.path.join(self.presets_dir, name if name.lower().endswith(IMAGE_EXTENSIONS) else f"{name}.gif")
+        else:
+            return None
+        return path if path and os.path.isfile(path) else None
+
+    def presets(self):
+        """Names of the preset images"""
+        try:
+            return sorted(os.path.splitext(f)[0] for f in os.listdir(self.presets_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+        except FileNotFoundError:
+            return []
+
+    def get(self, name):
+        """Decoded Pattern of an image name, or None if there's no such image"""
+        path = self.path(name)
+        if path is None: return None
+        key = self._file_hash(path)
+        with self._lock:
+            pattern = self._decoded.get(key)
+            if pattern is not None:
+                self._decoded.move_to_end(key)
+                self.hits += 1
+                return pattern
+            self.misses += 1
+
+        pattern = decode(path)
+        with self._lock:
+            self._decoded[key] = pattern
+            self._decoded.move_to_end(key)
+            total = sum(p.nbytes for p in self._decoded.values())
+            while total > self.max_bytes and len(self._decoded) > 1:
+                _, evicted = self._decoded.popitem(last=False)
+                total -= evicted.nbytes
+        return pattern
+
+    def _file_hash(self, path):
+        """Content hash of a file, recomputed only when its size or mtime changes"""
+        st = os.stat(path)
+        cached = self._hashes.get(path)
+        if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        self._hashes[path] = (st.st_mtime_ns, st.st_size, digest.hexdigest())
+        return digest.hexdigest()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._decoded),
+                "bytes": sum(p.nbytes for p in self._decoded.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+# Shared by every exporter in the process
+library = PatternLibrary()
@@ -0,0 +1,128 @@
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import numpy as np
+from exporter import ProjectExporter
+
+# Packet: start frame (uint32), frame count (uint16), car count (uint16), channel count (uint16),
+# then frame count x car count x channel count uint8 values, frame-major like FSEQ
+PACKET_HEADER = struct.Struct("<IHHH")
+PACKET_FRAMES = 25 # 0.5 s per packet at 20 ms
+LEAD_FRAMES = 100 # Rendered ahead of the playhead (2 s)
+RENDERED_SHOWS = 8 # Rendered previews kept per process
+PREVIEW_TTL_S = 24 * 3600 # Sessions untouched for this long are removed
+
+class PreviewNotFound(Exception):
+    pass
+
+def encode_packet(start_frame, frames):
+    """Binary packet for (frames, cars, channels) uint8 frames starting at start_frame"""
+    frames = np.ascontiguousarray(frames, dtype=np.uint8)
+    return PACKET_HEADER.pack(start_frame, *frames.shape) + frames.tobytes()
+
+def preview_info(exporter):
+    return {
+        "frame_count": exporter.frame_count,
+        "channel_count": exporter.channel_count,
+        "step_time_ms": exporter.step_time_ms
+    }
+
+class PreviewStore:
+    """
+    Live preview sessions. The posted project is saved under previews_dir
+    so any HTTP worker can stream it; each process keeps its most recently
+    used rendered shows so seeking doesn't render the project again.
+    """
+    def __init__(self, previews_dir, rendered_shows=RENDERED_SHOWS):
+        self.previews_dir = previews_dir
+        self.rendered_shows = rendered_shows
+        self._shows = OrderedDict() # (preview_id, row, col, matrix) -> (exporter, SparseShow or MatrixShow)
+        self._lock = threading.Lock()
+        os.makedirs(previews_dir, exist_ok=True)
+
+    def create(self, project, matrix_config=None):
+        """Save a session and return (preview_id, info)"""
+        self._prune()
+        preview_id = str(uuid.uuid4())
+        fd, tmp_path = tempfile.mkstemp(dir=self.previews_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"project": project, "matrix_config": matrix_config}, f)
+        os.replace(tmp_path, self._path(preview_id))
+        return preview_id, preview_info(ProjectExporter(project))
+
+    def show(self, preview_id, row=None, col=None, matrix=False):
+        """
+        (exporter, show) for a session: every car of the matrix (a MatrixShow)
+        with matrix, one car of it if row/col are given, else the single-car show
+        """
+        key = (preview_id, row, col, matrix)
+        with self._lock:
+            if key in self._shows:
+                self._shows.move_to_end(key)
+                return self._shows[key]
+
+        try:
+            with open(self._path(preview_id)) as f:
+                session = json.load(f)
+        except (OSError, ValueError):
+            raise PreviewNotFound(preview_id)
+        os.utime(self._path(preview_id))
+
+        exporter = ProjectExporter(session["project"])
+        matrix_config = session.get("matrix_config") or {}
+        rows, cols = matrix_config.get('rows', 10), matrix_config.get('cols', 10)
+        if matrix:
+            positions = np.array([(r, c) for r in range(rows) for c in range(cols)]).reshape(-1, 2)
+            show = exporter.render_matrix(positions, rows, cols)
+        elif row is None or col is None:
+            show = exporter.render_sparse()
+        else:
+            show = exporter.render_car_sparse(row, col, rows, cols)
+
+        with self._lock:
+            self._shows[key] = (exporter, show)
+            while len(self._shows) > self.rendered_shows:
+                self._shows.popitem(last=False)
+        return exporter, show
+
+    def _path(self, preview_id):
+        return os.path.join(self.previews_dir, f"{preview_id}.json")
+
+    def _prune(self):
+        cutoff = time.time() - PREVIEW_TTL_S
+        with os.scandir(self.previews_dir) as it:
+            for e in it:
+                try:
+                    if e.name.endswith(".json") and e.stat().st_mtime < cutoff:
+                        os.remove(e.path)
+                except FileNotFoundError:
+                    pass
+
+def stream_frames(exporter, show, start_frame=0, realtime=True, lead_frames=LEAD_FRAMES,
+                  packet_frames=PACKET_FRAMES, clock=time.monotonic, sleep=time.sleep):
+    """
+    Binary packets of frames from start_frame to the end of the show (see
+    encode_packet; one car unless show is a MatrixShow). With realtime the
+    stream is paced at playback speed, staying lead_frames ahead of the playhead.
+    """
+    frame_count = exporter.frame_count
+    start_frame = min(max(0, start_frame), frame_count)
+
+    started = clock()
+    step_s = exporter.step_time_ms / 1000
+    for start in range(start_frame, frame_count, packet_frames):
+        if realtime:
+            # Frames up to the playhead plus the lead may be sent
+            ahead = (start - start_frame) - (clock() - started) / step_s
+            if ahead > lead_frames:
+                sleep((ahead - lead_frames) * step_s)
+
+        stop = min(start + packet_frames, frame_count)
+        frames = show.densify(start, stop)
+        frames = frames[:, None] if show.cars is None else frames.transpose(1, 0, 2)
+        yield encode_packet(start, frames)
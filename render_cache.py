@@ -0,0 +1,169 @@
+import json
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import file_lock
+
+# Bump when clip rendering changes so stale contributions are ignored
+RENDER_VERSION = 3
+
+PROJECT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def valid_project_id(project_id):
+    return isinstance(project_id, str) and PROJECT_ID_PATTERN.match(project_id) is not None
+
+def _atomic_write(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class ProjectRenderCache:
+    """
+    One project's cached render, used under an exclusive lock:
+    index.json (show shape plus every cached clip key and the frame range
+    its contribution covers), clips/<key>.pkl (each clip's SparseShow)
+    and show.fseq (the composite of the indexed clips).
+    """
+    def __init__(self, project_dir):
+        self.project_dir = project_dir
+        self.clips_dir = os.path.join(project_dir, "clips")
+        self.fseq_path = os.path.join(project_dir, "show.fseq")
+        self.index = None
+        self._lock_file = None
+
+    def __enter__(self):
+        lock_path = os.path.join(self.project_dir, "lock")
+        while True:
+            os.makedirs(self.clips_dir, exist_ok=True)
+            try:
+                self._lock_file = open(lock_path, "w")
+            except FileNotFoundError:
+                continue # Evicted in between
+            file_lock.lock(self._lock_file)
+            # RenderCache.evict may have removed the project while we waited; start over in a fresh directory
+            if file_lock.is_current(self._lock_file, lock_path): break
+            file_lock.unlock(self._lock_file)
+            self._lock_file.close()
+        try:
+            with open(os.path.join(self.project_dir, "index.json")) as f:
+                self.index = json.load(f)
+            if self.index.get("version") != RENDER_VERSION or not os.path.exists(self.fseq_path):
+                self.index = None
+        except (OSError, ValueError):
+            self.index = None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Touch the project so eviction sees it as recently used
+        os.utime(self.project_dir)
+        file_lock.unlock(self._lock_file)
+        self._lock_file.close()
+        self._lock_file = None
+
+    def load(self, key):
+        """Cached contribution for a clip key, or None"""
+        try:
+            with open(os.path.join(self.clips_dir, f"{key}.pkl"), "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def save(self, key, show):
+        _atomic_write(os.path.join(self.clips_dir, f"{key}.pkl"), pickle.dumps(show, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def remove(self, key):
+        try:
+            os.remove(os.path.join(self.clips_dir, f"{key}.pkl"))
+        except FileNotFoundError:
+            pass
+
+    def save_index(self, index):
+        self.index = {**index, "version": RENDER_VERSION}
+        _atomic_write(os.path.join(self.project_dir, "index.json"), json.dumps(self.index).encode())
+
+    def clear(self):
+        """Drop everything cached for the project (kept locked)"""
+        self.index = None
+        shutil.rmtree(self.clips_dir, ignore_errors=True)
+        os.makedirs(self.clips_dir, exist_ok=True)
+        for name in ("index.json", "show.fseq"):
+            try:
+                os.remove(os.path.join(self.project_dir, name))
+            except FileNotFoundError:
+                pass
+
+class RenderCache:
+    """
+    Per-project cache of rendered clip contributions for incremental
+    re-export (see ProjectExporter.export_incremental). Projects are
+    directories under cache_dir; once they total more than max_bytes the
+    least recently exported ones are removed.
+    """
+    def __init__(self, cache_dir, max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def project(self, project_id):
+        """Locked ProjectRenderCache context for project_id"""
+        if not valid_project_id(project_id):
+            raise ValueError(f"Invalid project id: {project_id!r}")
+        return ProjectRenderCache(os.path.join(self.cache_dir, project_id))
+
+    def _projects(self):
+        """(path, size, last_used) for every project directory"""
+        projects = []
+        with os.scandir(self.cache_dir) as it:
+            for e in it:
+                if not e.is_dir(): continue
+                size = 0
+                for root, _, files in os.walk(e.path):
+                    for name in files:
+                        try:
+                            size += os.path.getsize(os.path.join(root, name))
+                        except FileNotFoundError:
+                            pass
+                try:
+                    projects.append((e.path, size, e.stat().st_mtime))
+                except FileNotFoundError:
+                    continue # Evicted by another worker
+        return projects
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used projects (never keep) until under
+        max_bytes. Projects locked by an export in progress are skipped.
+        """
+        projects = self._projects()
+        total = sum(size for _, size, _ in projects)
+        if total <= self.max_bytes: return
+
+        # Oldest first
+        projects.sort(key=lambda p: p[2])
+        for path, size, _ in projects:
+            if total <= self.max_bytes: break
+            if keep is not None and os.path.basename(path) == keep: continue
+            if self._remove_unlocked(path):
+                total -= size
+
+    def _remove_unlocked(self, path):
+        """Remove a project directory unless it's locked; whether it was removed"""
+        try:
+            lock = open(os.path.join(path, "lock"), "a")
+        except FileNotFoundError:
+            return False # Evicted by another worker
+        with lock:
+            if not file_lock.lock(lock, blocking=False): return False
+            try:
+                shutil.rmtree(path, ignore_errors=True)
+            finally:
+                file_lock.unlock(lock)
+        return True
@@ -1,21 +1,161 @@
-from flask import Flask, request, send_file, jsonify, send_from_directory
+from flask import Flask, Request, request, send_file, jsonify, send_from_directory, Response, g
 from flask_cors import CORS
+import cProfile
 import os
+import threading
+import time
 import uuid
-import zipfile
-import shutil
-from generator import TeslaLightShowGenerator
+import metrics
+import patterns
+from analysis_cache import AnalysisCache
+from render_cache import valid_project_id
+from preview import PreviewStore, PreviewNotFound, stream_frames
+from storage import Storage
+from channel_layout import load_layout, LAYOUT_CHANNEL_COUNTS
+from analysis_payload import AnalysisFile, AnalysisFormatError, encode, MIME_TYPE, FEATURE_DTYPES, FEATURE_KEYS, EVENT_KEYS
+from jobs import JobManager, JobQueueFull
+import tasks
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Uploaded audio is written to the uploads dir and hashed as it's received
+        return storage.upload_stream()
 
 app = Flask(__name__, static_folder='dist', static_url_path='/')
+app.request_class = UploadRequest
 CORS(app)
 
 UPLOAD_FOLDER = 'uploads'
+IMAGES_FOLDER = 'clip_images' # Uploaded images of image clips, kept for as long as projects may use them
 OUTPUT_FOLDER = 'outputs'
+CACHE_FOLDER = os.path.join('cache', 'analysis')
+CACHE_MAX_MB = int(os.environ.get('ANALYSIS_CACHE_MAX_MB', 1024))
+ANALYSIS_ALIGNED = os.environ.get('ANALYSIS_ALIGNED', '0') == '1' # One feature frame per light frame
+RENDER_CACHE_FOLDER = os.path.join('cache', 'render')
+RENDER_CACHE_MAX_MB = int(os.environ.get('RENDER_CACHE_MAX_MB', 1024))
+JOBS_FOLDER = 'jobs'
+PREVIEW_FOLDER = 'previews'
+METRICS_FOLDER = 'metrics'
+PROFILE_FOLDER = 'profiles'
+PROFILING = os.environ.get('PROFILING', '0') == '1' # Allow cProfile dumps of requests sent with X-Profile: 1
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 200)) # Newest dumps kept
+PROFILE_TTL_HOURS = float(os.environ.get('PROFILE_TTL_HOURS', 24))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 0)) or None # Defaults to CPU count
+JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', 100))
+MAX_GRID_SIZE = int(os.environ.get('MAX_GRID_SIZE', 64)) # Rows/cols of a matrix (the editor defaults to 16 x 63); bounds a job's memory
+STORAGE_TTL_HOURS = float(os.environ.get('STORAGE_TTL_HOURS', 24)) # Uploads and outputs unused this long are removed
+STORAGE_MAX_MB = int(os.environ.get('STORAGE_MAX_MB', 10240)) # Oldest are removed past this total
+STORAGE_SWEEP_INTERVAL_S = int(os.environ.get('STORAGE_SWEEP_INTERVAL_S', 300))
+JOB_TTL_HOURS = float(os.environ.get('JOB_TTL_HOURS', 24)) # State of jobs finished this long ago is removed
+# Open preview streams per process; each holds a request thread (gunicorn.conf.py threads) for its whole length
+PREVIEW_MAX_STREAMS = int(os.environ.get('PREVIEW_MAX_STREAMS', 4))
+# Let a fronting nginx/Apache send downloads (X-Sendfile); gunicorn already uses sendfile() otherwise
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '0') == '1'
+
+storage = Storage(UPLOAD_FOLDER, OUTPUT_FOLDER, ttl_s=STORAGE_TTL_HOURS * 3600, max_bytes=STORAGE_MAX_MB * 1024 * 1024)
+os.makedirs(IMAGES_FOLDER, exist_ok=True)
+patterns.library.configure(IMAGES_FOLDER)
+
+metrics.registry.configure(METRICS_FOLDER)
+analysis_cache = AnalysisCache(CACHE_FOLDER, max_bytes=CACHE_MAX_MB * 1024 * 1024)
+previews = PreviewStore(PREVIEW_FOLDER)
+preview_streams = threading.BoundedSemaphore(PREVIEW_MAX_STREAMS)
+jobs = JobManager(
+    JOBS_FOLDER,
+    max_workers=JOB_WORKERS,
+    max_pending=JOB_MAX_PENDING,
+    initializer=tasks.init_worker,
+    initargs=(CACHE_FOLDER, analysis_cache.max_bytes, ANALYSIS_ALIGNED,
+              RENDER_CACHE_FOLDER, RENDER_CACHE_MAX_MB * 1024 * 1024, METRICS_FOLDER, IMAGES_FOLDER),
+    profile_dir=PROFILE_FOLDER if PROFILING else None
+)
+storage.start_sweeper(STORAGE_SWEEP_INTERVAL_S, also=[
+    lambda: jobs.expire(JOB_TTL_HOURS * 3600),
+    metrics.registry.retire_exited,
+    analysis_cache.retire_exited,
+    lambda: metrics.prune_profiles(PROFILE_FOLDER, PROFILE_MAX_FILES, PROFILE_TTL_HOURS * 3600)
+])
+
+def _profile_requested():
+    return PROFILING and request.headers.get('X-Profile') == '1'
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.profiler = None
+    if _profile_requested():
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+@app.after_request
+def record_request_metrics(response):
+    profiler = g.get('profiler')
+    if profiler is not None:
+        # Only the handler is profiled; a queued job gets its own dump (see submit_job)
+        profiler.disable()
+        name = f"request-{int(time.time() * 1000)}-{request.endpoint or 'unmatched'}.prof"
+        profiler.dump_stats(os.path.join(PROFILE_FOLDER, name))
+        response.headers['X-Profile-Url'] = f"/profiles/{name}"
+    if 'request_started' in g:
+        metrics.registry.observe('lightshow_http_request_seconds', time.perf_counter() - g.request_started,
+                                 endpoint=request.endpoint or 'unmatched', method=request.method,
+                                 status=response.status_code)
+        metrics.registry.flush()
+    return response
 
-generator = TeslaLightShowGenerator()
+def _form_int(name, default):
+    """Whole-number form field: default when it's absent, None when it isn't a number"""
+    if name not in request.form: return default
+    return request.form.get(name, type=int)
+
+def _project_error(data):
+    """Why a posted {"project": ..., "matrixConfig": ...} body can't be rendered, or None"""
+    if not isinstance(data, dict) or not isinstance(data.get('project'), dict):
+        return "Invalid project data"
+    project = data['project']
+    layers = project.get('layers', [])
+    if not isinstance(layers, list) or not all(isinstance(l, dict) and isinstance(l.get('clips', []), list) and
+                                               all(isinstance(c, dict) for c in l.get('clips', [])) for l in layers):
+        return "project layers must be a list of objects with a list of clip objects"
+    if project.get('channelCount', 48) not in LAYOUT_CHANNEL_COUNTS:
+        return f"channelCount must be one of {LAYOUT_CHANNEL_COUNTS}"
+    matrix_config = data.get('matrixConfig')
+    if matrix_config is not None:
+        if not isinstance(matrix_config, dict):
+            return "matrixConfig must be an object"
+        for key in ('rows', 'cols'):
+            value = matrix_config.get(key, 10)
+            if not isinstance(value, int) or isinstance(value, bool) or not 1 <= value <= MAX_GRID_SIZE:
+                return f"matrixConfig rows and cols must be whole numbers from 1 to {MAX_GRID_SIZE}"
+    unknown_image = _unknown_image(project)
+    if unknown_image is not None:
+        return f"Unknown image: {unknown_image}"
+    return None
+
+def _unknown_image(project):
+    """First image referenced by the project's clips that isn't a preset or stored upload, or None"""
+    for layer in project.get('layers', []):
+        for clip in layer.get('clips', []):
+            name = clip.get('image')
+            if name is None: continue
+            if patterns.library.path(name) is None: return name
+    return None
+
+def submit_job(kind, fn, *args, **extra):
+    """Queue a job and return the 202 response pointing at its status"""
+    profile = _profile_requested()
+    try:
+        job_id = jobs.submit(kind, fn, *args, profile=profile)
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    if profile:
+        extra["profile_url"] = f"/profiles/{job_id}.prof"
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        **extra
+    }), 202
 
 @app.route('/')
 def serve_index():
@@ -38,49 +178,20 @@ def generate():
         return jsonify({"error": "No selected file"}), 400
     
     mode = request.form.get('mode', 'single')
+    rows = _form_int('rows', 10)
+    cols = _form_int('cols', 10)
+    if rows is None or cols is None or not (1 <= rows <= MAX_GRID_SIZE and 1 <= cols <= MAX_GRID_SIZE):
+        return jsonify({"error": f"rows and cols must be whole numbers from 1 to {MAX_GRID_SIZE}"}), 400
+    channel_count = _form_int('channels', 48)
+    if channel_count not in LAYOUT_CHANNEL_COUNTS:
+        return jsonify({"error": f"channels must be one of {LAYOUT_CHANNEL_COUNTS}"}), 400
     
-    # Save uploaded file
+    # Keep the uploaded file (stored once per content hash)
     file_id = str(uuid.uuid4())
-    audio_ext = os.path.splitext(audio_file.filename)[1]
-    audio_path = os.path.join(UPLOAD_FOLDER, f"{file_id}{audio_ext}")
-    audio_file.save(audio_path)
+    audio_path = storage.save_upload(audio_file)
     
-    try:
-        # Analyze
-        analysis = generator.analyze_audio(audio_path)
-        
-        if mode == 'matrix':
-            rows = int(request.form.get('rows', 10))
-            cols = int(request.form.get('cols', 10))
-            
-            matrix_dir = os.path.join(OUTPUT_FOLDER, f"{file_id}_matrix")
-            generator.generate_matrix_show(analysis, matrix_dir, rows, cols)
-            
-            # Zip the result
-            zip_path = os.path.join(OUTPUT_FOLDER, f"{file_id}.zip")
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for root, dirs, files in os.walk(matrix_dir):
-                    for file in files:
-                        zipf.write(os.path.join(root, file), file)
-            
-            # Cleanup raw files
-            shutil.rmtree(matrix_dir)
-            
-        else:
-            output_filename = f"{file_id}.fseq"
-            output_path = os.path.join(OUTPUT_FOLDER, output_filename)
-            generator.generate_fseq(analysis, output_path)
-        
-        return jsonify({
-            "success": True,
-            "file_id": file_id,
-            "duration": analysis["duration"],
-            "frame_count": analysis["frame_count"],
-            "mode": mode
-        })
-    except Exception as e:
-        print(e)
-        return jsonify({"error": str(e)}), 500
+    return submit_job('generate', tasks.generate_show, audio_path, OUTPUT_FOLDER, file_id, mode, rows, cols,
+                      channel_count, file_id=file_id)
 
 @app.route('/analyze', methods=['POST'])
 def analyze():
@@ -91,50 +202,174 @@ def analyze():
     if audio_file.filename == '':
         return jsonify({"error": "No selected file"}), 400
         
-    # Save uploaded file
+    # Keep the uploaded file (stored once per content hash)
     file_id = str(uuid.uuid4())
-    audio_ext = os.path.splitext(audio_file.filename)[1]
-    audio_path = os.path.join(UPLOAD_FOLDER, f"{file_id}{audio_ext}")
-    audio_file.save(audio_path)
+    audio_path = storage.save_upload(audio_file)
     
+    return submit_job('analyze', tasks.analyze, audio_path, OUTPUT_FOLDER, file_id, file_id=file_id)
+
+def _open_analysis(file_id):
+    """(AnalysisFile, None) or (None, error response)"""
+    path = os.path.join(OUTPUT_FOLDER, f"{file_id}.analysis")
     try:
-        analysis = generator.analyze_audio(audio_path)
-        return jsonify({
-            "success": True,
-            "file_id": file_id,
-            "analysis": analysis
-        })
-    except Exception as e:
-        print(e)
-        return jsonify({"error": str(e)}), 500
+        analysis = AnalysisFile(path)
+        storage.touch(path)
+        return analysis, None
+    except FileNotFoundError:
+        return None, (jsonify({"error": "Analysis not found"}), 404)
+    except AnalysisFormatError as e:
+        return None, (jsonify({"error": str(e)}), 500)
+
+def _analysis_response(meta, arrays):
+    """
+    JSON or the binary container, whichever the Accept header prefers (JSON by default).
+    ?dtype=float16 halves the size of binary features.
+    """
+    dtype = FEATURE_DTYPES.get(request.args.get('dtype', 'float32'))
+    if dtype is None:
+        return jsonify({"error": f"dtype must be one of {', '.join(FEATURE_DTYPES)}"}), 400
+
+    if request.accept_mimetypes.best_match(['application/json', MIME_TYPE]) == MIME_TYPE:
+        arrays = {k: v.astype(dtype) if k in FEATURE_KEYS else v for k, v in arrays.items()}
+        response = Response(encode(meta, arrays), mimetype=MIME_TYPE)
+    else:
+        response = jsonify({**meta, **{k: v.tolist() for k, v in arrays.items()}})
+    response.vary.add('Accept')
+    return response
+
+@app.route('/analysis/<uuid:file_id>', methods=['GET'])
+def get_analysis(file_id):
+    analysis, error = _open_analysis(file_id)
+    if error: return error
+
+    arrays = {name: analysis.array(name) for name in analysis.layout}
+    return _analysis_response(analysis.meta, arrays)
+
+@app.route('/analysis/<uuid:file_id>/<feature>', methods=['GET'])
+def get_analysis_feature(file_id, feature):
+    """One feature, optionally limited to ?start=&end= (seconds)"""
+    if feature not in FEATURE_KEYS + EVENT_KEYS:
+        return jsonify({"error": f"Unknown feature: {feature}"}), 404
+    analysis, error = _open_analysis(file_id)
+    if error: return error
+    start_s = request.args.get('start', type=float)
+    end_s = request.args.get('end', type=float)
+
+    start, values = analysis.window(feature, start_s, end_s)
+    meta = {"feature": feature, "start": start}
+    if feature in FEATURE_KEYS:
+        meta["feature_step_ms"] = analysis.meta["feature_step_ms"]
+    return _analysis_response(meta, {feature: values})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    state = jobs.status(job_id)
+    if state is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(state)
+
+@app.route('/jobs/<job_id>/progress', methods=['GET'])
+def job_progress(job_id):
+    state = jobs.status(job_id)
+    if state is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({k: state.get(k) for k in ('id', 'status', 'progress', 'stage')})
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if jobs.status(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    if not jobs.cancel(job_id):
+        return jsonify({"error": "Job already finished"}), 409
+    return jsonify({"success": True, "job_id": job_id})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition: stage, job, job peak RSS and request histograms from every process"""
+    body = metrics.registry.render()
+    body += metrics.gauge('lightshow_jobs_pending', 'Jobs queued or running from this HTTP worker', jobs.pending())
+    body += metrics.gauge('lightshow_job_workers', 'Size of the job process pool', jobs.max_workers)
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@app.route('/profiles/<name>', methods=['GET'])
+def download_profile(name):
+    """cProfile dump of a profiled request or job (pstats format)"""
+    path = os.path.abspath(os.path.join(PROFILE_FOLDER, os.path.basename(name)))
+    if not PROFILING or not name.endswith('.prof') or not os.path.exists(path):
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(path, as_attachment=True)
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(analysis_cache.stats())
 
 @app.route('/download/<file_id>', methods=['GET'])
 def download_file(file_id):
+    """Supports Range requests and conditional GETs; the body is sent with sendfile() where available"""
     # 1. Try direct path (in case extension is already in file_id)
-    direct_path = os.path.join(OUTPUT_FOLDER, file_id)
-    if os.path.exists(direct_path):
-        return send_file(direct_path, as_attachment=True)
+    direct_path = storage.output_path(file_id)
+    if direct_path:
+        storage.touch(direct_path)
+        return send_file(os.path.abspath(direct_path), as_attachment=True)
         
     # 2. Try both extensions
     for ext in ['.fseq', '.zip']:
-        file_path = os.path.join(OUTPUT_FOLDER, f"{file_id}{ext}")
-        if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True, download_name=f"lightshow{ext}")
+        file_path = storage.output_path(f"{file_id}{ext}")
+        if file_path:
+            storage.touch(file_path)
+            return send_file(os.path.abspath(file_path), as_attachment=True, download_name=f"lightshow{ext}")
     
     return jsonify({"error": "File not found"}), 404
 
-from exporter import ProjectExporter
+@app.route('/layout', methods=['GET'])
+def get_layout():
+    """Channels of every xLights model and group in a 48- (default) or 200-channel show (?channels=)"""
+    channel_count = request.args.get('channels', 48, type=int)
+    if channel_count not in LAYOUT_CHANNEL_COUNTS:
+        return jsonify({"error": f"channels must be one of {LAYOUT_CHANNEL_COUNTS}"}), 400
+    return jsonify(load_layout(channel_count).describe())
+
+@app.route('/images', methods=['GET'])
+def list_images():
+    """Names of the preset GIFs image clips can use"""
+    return jsonify({"presets": patterns.library.presets()})
+
+@app.route('/images', methods=['POST'])
+def upload_image():
+    """Store a GIF/PNG/JPEG for image clips; clips reference it by the returned id (their "image")"""
+    if 'image' not in request.files:
+        return jsonify({"error": "No image file provided"}), 400
+    image_file = request.files['image']
+    if not image_file.filename.lower().endswith(patterns.IMAGE_EXTENSIONS):
+        return jsonify({"error": f"Image must be one of {', '.join(patterns.IMAGE_EXTENSIONS)}"}), 400
+
+    path = storage.save_upload(image_file, IMAGES_FOLDER)
+    image_id = os.path.basename(path)
+    try:
+        pattern = patterns.library.get(image_id)
+    except patterns.PatternError as e:
+        os.remove(path)
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"success": True, "image": image_id, **pattern.describe()})
 
 @app.route('/export', methods=['POST'])
 def export_show():
     data = request.json
-    if not data or 'project' not in data:
-        return jsonify({"error": "Invalid project data"}), 400
+    error = _project_error(data)
+    if error is not None:
+        return jsonify({"error": error}), 400
         
     project = data['project']
     matrix_mode = data.get('matrixMode', False)
     matrix_config = data.get('matrixConfig', {'rows': 10, 'cols': 10})
     layout_data = data.get('layoutData')
+    compression_level = data.get('compressionLevel', 6)
+    if not isinstance(compression_level, int) or not 0 <= compression_level <= 9:
+        return jsonify({"error": "compressionLevel must be an integer from 0 to 9"}), 400
+    # Stable id of the project being edited, re-exports then only re-render changed clips
+    project_id = data.get('projectId')
+    if project_id is not None and not valid_project_id(project_id):
+        return jsonify({"error": "projectId must be 1-64 letters, digits, '-' or '_'"}), 400
     
     # Generate ID
     file_id = str(uuid.uuid4())
@@ -143,20 +378,54 @@ def export_show():
     ext = '.zip' if matrix_mode else '.fseq'
     output_path = os.path.join(OUTPUT_FOLDER, f"{file_id}{ext}")
     
+    return submit_job('export', tasks.export_project, project, output_path, file_id, ext,
+                      matrix_mode, matrix_config, layout_data, compression_level, project_id,
+                      file_id=file_id, extension=ext)
+
+@app.route('/preview', methods=['POST'])
+def create_preview():
+    """Start a live preview session for a project; frames come from /preview/<id>/stream"""
+    data = request.json
+    error = _project_error(data)
+    if error is not None:
+        return jsonify({"error": error}), 400
+
+    preview_id, info = previews.create(data['project'], data.get('matrixConfig'))
+    return jsonify({
+        "success": True,
+        "preview_id": preview_id,
+        "stream_url": f"/preview/{preview_id}/stream",
+        **info
+    })
+
+@app.route('/preview/<uuid:preview_id>/stream', methods=['GET'])
+def stream_preview(preview_id):
+    """
+    Binary stream of rendered frames from ?start= (seconds), paced at playback
+    speed (packet format in preview.py). ?matrix=1 sends every car of the matrix,
+    ?row=&col= one car of it. Seek (or resume) by reopening the stream. At most
+    PREVIEW_MAX_STREAMS are open at once so streams can't take every request
+    thread; past that it's a 503.
+    """
+    row = request.args.get('row', type=int)
+    col = request.args.get('col', type=int)
+    matrix = request.args.get('matrix') == '1'
+    if not preview_streams.acquire(blocking=False):
+        return jsonify({"error": "Too many open previews, try again shortly"}), 503, {'Retry-After': '5'}
     try:
-        exporter = ProjectExporter(project)
-        exporter.export(output_path, matrix_mode=matrix_mode, matrix_config=matrix_config, layout_data=layout_data)
-        
-        return jsonify({
-            "success": True,
-            "file_id": file_id,
-            "extension": ext
-        })
-    except Exception as e:
-        print(e)
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        exporter, show = previews.show(str(preview_id), row, col, matrix)
+    except PreviewNotFound:
+        preview_streams.release()
+        return jsonify({"error": "Preview not found"}), 404
+    except BaseException:
+        preview_streams.release()
+        raise
+
+    start_frame = int(request.args.get('start', 0, type=float) * 1000 / exporter.step_time_ms)
+    response = Response(stream_frames(exporter, show, start_frame), mimetype='application/octet-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(preview_streams.release) # Also when the client disconnects mid-stream
+    return response
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    app.run(debug=True, port=5000, threaded=True)
@@ -0,0 +1,177 @@
+import numpy as np
+from fseq import iter_chunks, CHUNK_FRAMES
+
+DIFF_GAP_FRAMES = 256 # Covered spans closer than this are compared in one window
+
+def mask_runs(mask):
+    """(starts, stops) of the runs where a boolean mask is True"""
+    edges = np.diff(np.asarray(mask, dtype=np.int8), prepend=0, append=0)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def merge_intervals(starts, stops, gap=0):
+    """Union of [start, stop) intervals, also joining ones less than gap apart. Returns sorted (starts, stops)."""
+    starts, stops = np.asarray(starts, dtype=np.int64), np.asarray(stops, dtype=np.int64)
+    if len(starts) == 0: return starts, stops
+    order = np.argsort(starts, kind="stable")
+    starts, stops = starts[order], stops[order]
+    reach = np.maximum.accumulate(stops)
+    first = np.r_[True, starts[1:] > reach[:-1] + gap]
+    last = np.r_[first[1:], True]
+    return starts[first], reach[last]
+
+class SparseShow:
+    """
+    Show channel data kept as what was drawn instead of a dense
+    (frames, channels) array: runs of a constant value (flashes, on/off
+    masks) and per-frame value ramps (fades, pulses, strobes), each over a
+    set of channels. Overlapping items max-blend and anything not covered
+    is 0, the same as blending into a zeroed array.
+    Memory scales with the lit spans, not the show length; dense frames
+    are only produced a chunk at a time by densify()/iter_chunks() when
+    the FSEQ is written.
+    With cars, ramps hold one row of values per car (matrix shows where a
+    clip's timing differs per car) and densify() returns (cars, frames, channels).
+    """
+    def __init__(self, frame_count, channel_count=48, cars=None):
+        self.frame_count = frame_count
+        self.channel_count = channel_count
+        self.cars = cars
+        self._runs = [] # (channels, starts, stops, value), starts sorted
+        self._ramps = [] # (channels, start, values), values (frames,) or (cars, frames)
+
+    def _channels(self, channels):
+        return [ch for ch in channels if 0 <= ch < self.channel_count]
+
+    def add_runs(self, channels, starts, stops, value=255):
+        """Set channels to value over each [start, stop) frame range"""
+        channels = self._channels(channels)
+        starts = np.clip(np.asarray(starts, dtype=np.int64), 0, self.frame_count)
+        stops = np.clip(np.asarray(stops, dtype=np.int64), 0, self.frame_count)
+        keep = starts < stops
+        if not channels or value == 0 or not keep.any(): return
+        order = np.argsort(starts[keep], kind="stable")
+        self._runs.append((channels, starts[keep][order], stops[keep][order], int(value)))
+
+    def add_mask(self, channels, mask, value=255):
+        """Set channels to value on every frame where mask (one bool per frame from 0) is True"""
+        starts, stops = mask_runs(mask)
+        self.add_runs(channels, starts, stops, value)
+
+    def add_values(self, channels, start, values):
+        """
+        Max-blend per-frame uint8 values into channels from frame start on.
+        values is (frames,), or (cars, frames) for a show with cars.
+        """
+        channels = self._channels(channels)
+        values = np.asarray(values, dtype=np.uint8)
+        # Zeros never win the max blend, so only the lit span is kept
+        lit = np.flatnonzero(values.reshape(-1, values.shape[-1]).any(axis=0))
+        if not channels or len(lit) == 0: return
+        start, values = start + lit[0], values[..., lit[0]:lit[-1] + 1]
+        if start < 0:
+            start, values = 0, values[..., -start:]
+        values = values[..., :max(0, self.frame_count - start)]
+        if values.shape[-1] == 0: return
+
+        if (values == values.flat[0]).all():
+            self.add_runs(channels, [start], [start + values.shape[-1]], values.flat[0])
+        else:
+            self._ramps.append((channels, start, values))
+
+    def merge(self, other):
+        """Max-blend another show of the same shape into this one"""
+        if (other.frame_count, other.channel_count, other.cars) != (self.frame_count, self.channel_count, self.cars):
+            raise ValueError("Can only merge shows with the same frame, channel and car count")
+        self._runs.extend(other._runs)
+        self._ramps.extend(other._ramps)
+        return self
+
+    def copy(self):
+        show = SparseShow(self.frame_count, self.channel_count, self.cars)
+        return show.merge(self)
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the runs and ramps"""
+        return (sum(starts.nbytes + stops.nbytes for _, starts, stops, _ in self._runs) +
+                sum(values.nbytes for _, _, values in self._ramps))
+
+    def densify(self, start=0, stop=None, out=None):
+        """
+        Dense (frames, channels) uint8 array of frames [start, stop),
+        (cars, frames, channels) with cars. With out, max-blends into it instead.
+        """
+        if stop is None: stop = self.frame_count
+        n = stop - start
+        if out is None:
+            shape = (n, self.channel_count) if self.cars is None else (self.cars, n, self.channel_count)
+            out = np.zeros(shape, dtype=np.uint8)
+
+        for channels, starts, stops, value in self._runs:
+            hi = np.searchsorted(starts, stop)
+            sel = stops[:hi] > start
+            run_starts = np.maximum(starts[:hi][sel], start) - start
+            run_stops = np.minimum(stops[:hi][sel], stop) - start
+            if len(run_starts) == 0: continue
+            if len(run_starts) == 1:
+                rows = slice(run_starts[0], run_stops[0])
+                out[..., rows, channels] = np.maximum(out[..., rows, channels], value)
+                continue
+            # +1 where a run starts, -1 where it ends; lit wherever the sum is positive
+            edges = np.bincount(run_starts, minlength=n + 1) - np.bincount(run_stops, minlength=n + 1)
+            lit = np.cumsum(edges[:n]) > 0
+            out[..., channels] = np.maximum(out[..., channels], np.where(lit, value, 0).astype(np.uint8)[:, None])
+
+        for channels, ramp_start, values in self._ramps:
+            lo, hi = max(start, ramp_start), min(stop, ramp_start + values.shape[-1])
+            if lo >= hi: continue
+            rows = slice(lo - start, hi - start)
+            out[..., rows, channels] = np.maximum(out[..., rows, channels], values[..., lo - ramp_start:hi - ramp_start, None])
+        return out
+
+    def iter_chunks(self, chunk_frames=CHUNK_FRAMES):
+        """Yield dense (frames, channels) chunks for write_fseq"""
+        for start, stop in iter_chunks(self.frame_count, chunk_frames):
+            yield self.densify(start, stop)
+
+    def covered(self):
+        """Merged (starts, stops) of every frame range anything is drawn on"""
+        starts = [s for _, s, _, _ in self._runs] + [np.array([s]) for _, s, _ in self._ramps]
+        stops = [e for _, _, e, _ in self._runs] + [np.array([s + v.shape[-1]]) for _, s, v in self._ramps]
+        if not starts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return merge_intervals(np.concatenate(starts), np.concatenate(stops))
+
+    def diff(self, other, chunk_frames=CHUNK_FRAMES):
+        """
+        (channel, start, stop) frame ranges where this show and other differ,
+        sorted by channel then frame. Only frames either show draws on are compared.
+        """
+        if (other.frame_count, other.channel_count, other.cars) != (self.frame_count, self.channel_count, self.cars):
+            raise ValueError("Can only diff shows with the same frame, channel and car count")
+        a_starts, a_stops = self.covered()
+        b_starts, b_stops = other.covered()
+        starts, stops = merge_intervals(np.r_[a_starts, b_starts], np.r_[a_stops, b_stops], gap=DIFF_GAP_FRAMES)
+
+        changes = []
+        for span_start, span_stop in zip(starts.tolist(), stops.tolist()):
+            for start in range(span_start, span_stop, chunk_frames):
+                stop = min(start + chunk_frames, span_stop)
+                differs = self.densify(start, stop) != other.densify(start, stop)
+                if self.cars is not None:
+                    differs = differs.any(axis=0) # Any car
+                # Runs down each channel column
+                edges = np.diff(differs.T.astype(np.int8), axis=1, prepend=0, append=0)
+                ch, run_starts = np.nonzero(edges == 1)
+                _, run_stops = np.nonzero(edges == -1)
+                changes.extend(zip(ch.tolist(), (run_starts + start).tolist(), (run_stops + start).tolist()))
+
+        # Join runs split at window boundaries
+        changes.sort()
+        merged = []
+        for ch, start, stop in changes:
+            if merged and merged[-1][0] == ch and merged[-1][2] == start:
+                merged[-1] = (ch, merged[-1][1], stop)
+            else:
+                merged.append((ch, start, stop))
+        return merged
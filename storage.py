@@ -0,0 +1,186 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import file_lock
+
+PART_SUFFIX = ".part" # Uploads still being received
+EXTENSION_PATTERN = re.compile(r"^\.[a-z0-9]{1,8}$")
+OUTPUT_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}(\.[a-z0-9]{1,8})?$")
+COPY_CHUNK_BYTES = 1024 * 1024
+
+class UploadFile:
+    """
+    Temporary file in the uploads directory that hashes everything written
+    to it. Used as the multipart parser's file stream, so an upload lands
+    on disk and is hashed as it arrives rather than being buffered and
+    copied afterwards. Removed on close unless Storage.save_upload kept it.
+    """
+    def __init__(self, directory):
+        fd, self.tmp_path = tempfile.mkstemp(dir=directory, suffix=PART_SUFFIX)
+        self._file = os.fdopen(fd, "w+b")
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def close(self):
+        self._file.close()
+        if not self.committed:
+            try:
+                os.remove(self.tmp_path)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        # read, readline, seek, tell, flush... go to the underlying file
+        return getattr(self._file, name)
+
+class Storage:
+    """
+    Lifecycle of uploaded audio and job outputs.
+    Uploads are stored once per content hash (<sha256><ext>), so the same
+    track uploaded again reuses the existing file. sweep() removes files
+    not used for ttl_s, then the least recently used ones while uploads and
+    outputs together exceed max_bytes; files younger than min_age_s are
+    kept either way since queued jobs may still need them.
+    """
+    def __init__(self, uploads_dir, outputs_dir, ttl_s=24 * 3600, max_bytes=10 * 1024 ** 3, min_age_s=3600):
+        self.uploads_dir = uploads_dir
+        self.outputs_dir = outputs_dir
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.min_age_s = min_age_s
+        self._sweeper = None
+        os.makedirs(uploads_dir, exist_ok=True)
+        os.makedirs(outputs_dir, exist_ok=True)
+
+    def upload_stream(self):
+        return UploadFile(self.uploads_dir)
+
+    def save_upload(self, file_storage, directory=None):
+        """
+        Keep an uploaded werkzeug FileStorage under its content hash and
+        return its path. Stored in the uploads dir (and swept) unless another
+        directory is given.
+        """
+        stream = file_storage.stream
+        if not isinstance(stream, UploadFile):
+            # Parsed without upload_stream (e.g. a different request class), hash it while copying
+            upload = UploadFile(self.uploads_dir)
+            try:
+                for block in iter(lambda: stream.read(COPY_CHUNK_BYTES), b""):
+                    upload.write(block)
+            except BaseException:
+                upload.close()
+                raise
+            stream = upload
+
+        ext = os.path.splitext(file_storage.filename or "")[1].lower()
+        if not EXTENSION_PATTERN.match(ext):
+            ext = ""
+        path = os.path.join(directory or self.uploads_dir, f"{stream.hexdigest()}{ext}")
+
+        stream.flush()
+        if os.path.exists(path):
+            os.utime(path) # Already stored, count it as recently used
+        else:
+            shutil.move(stream.tmp_path, path) # A rename unless directory is on another filesystem
+            stream.committed = True
+        stream.close()
+        return path
+
+    def output_path(self, name):
+        """Path of an existing output file, or None (also for names that aren't plain file names)"""
+        if not OUTPUT_NAME_PATTERN.match(name): return None
+        path = os.path.join(self.outputs_dir, name)
+        return path if os.path.isfile(path) else None
+
+    def touch(self, path):
+        """Mark a file as used so it outlives the TTL"""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _entries(self):
+        """(path, size, last_used, is_dir) for everything stored"""
+        entries = []
+        for directory in (self.uploads_dir, self.outputs_dir):
+            with os.scandir(directory) as it:
+                for e in it:
+                    if e.name.startswith("."): continue
+                    try:
+                        if e.is_dir():
+                            size = sum(os.path.getsize(os.path.join(root, f))
+                                       for root, _, files in os.walk(e.path) for f in files)
+                            entries.append((e.path, size, e.stat().st_mtime, True))
+                        else:
+                            st = e.stat()
+                            entries.append((e.path, st.st_size, st.st_mtime, False))
+                    except FileNotFoundError:
+                        continue # Removed while scanning
+        return entries
+
+    def sweep(self):
+        """Remove expired files, then the oldest until under max_bytes. Returns (files removed, bytes freed)."""
+        now = time.time()
+        entries = sorted(self._entries(), key=lambda e: e[2]) # Oldest first
+        total = sum(size for _, size, _, _ in entries)
+        removed = freed = 0
+        for path, size, last_used, is_dir in entries:
+            age = now - last_used
+            if age < self.min_age_s: break
+            if age < self.ttl_s and total <= self.max_bytes: break
+            if is_dir:
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            freed += size
+            removed += 1
+        return removed, freed
+
+    def start_sweeper(self, interval_s=300, also=()):
+        """
+        Sweep every interval_s in a daemon thread; processes sharing the
+        directories take turns. Each callable in also (returning how many
+        files it removed) runs with every sweep, for other state that
+        needs expiring.
+        """
+        if self._sweeper is not None: return
+
+        def run():
+            lock_path = os.path.join(self.uploads_dir, ".sweep.lock")
+            while True:
+                time.sleep(interval_s)
+                try:
+                    with open(lock_path, "w") as lock:
+                        if not file_lock.lock(lock, blocking=False): continue # Another process is sweeping
+                        try:
+                            removed, freed = self.sweep()
+                            expired = sum(fn() for fn in also)
+                        finally:
+                            file_lock.unlock(lock)
+                    if removed:
+                        print(f"Storage sweep removed {removed} files ({freed / 1024 / 1024:.1f} MB)")
+                    if expired:
+                        print(f"Storage sweep expired {expired} other files")
+                except Exception as e:
+                    print(f"Storage sweep failed: {e}")
+
+        self._sweeper = threading.Thread(target=run, name="storage-sweeper", daemon=True)
+        self._sweeper.start()
@@ -0,0 +1,97 @@
+# Job task functions run inside JobManager worker processes.
+# Each takes a JobContext first and returns a JSON-serializable result.
+import os
+import zipfile
+import shutil
+from generator import TeslaLightShowGenerator
+from analysis_cache import AnalysisCache
+from analysis_payload import save_analysis, FEATURE_KEYS
+from exporter import ProjectExporter
+from render_cache import RenderCache
+import metrics
+import patterns
+
+# Per-process generators (one per channel count) and render cache, set up by init_worker
+_generators = {}
+_generator_options = {}
+_render_cache = None
+
+def init_worker(cache_dir, cache_max_bytes, aligned=False, render_cache_dir=None, render_cache_max_bytes=None,
+                metrics_dir=None, image_dir=None):
+    global _render_cache
+    metrics.registry.configure(metrics_dir)
+    patterns.library.configure(image_dir) # Uploaded images of image clips
+    _generator_options.update(cache=AnalysisCache(cache_dir, max_bytes=cache_max_bytes), aligned=aligned)
+    _get_generator()
+    if render_cache_dir:
+        _render_cache = RenderCache(render_cache_dir, max_bytes=render_cache_max_bytes or cache_max_bytes)
+
+def _get_generator(channel_count=48):
+    # Generators for other channel counts share the analysis cache and settings
+    if channel_count not in _generators:
+        _generators[channel_count] = TeslaLightShowGenerator(channel_count=channel_count, **_generator_options)
+    return _generators[channel_count]
+
+def generate_show(ctx, audio_path, output_folder, file_id, mode, rows, cols, channel_count=48):
+    generator = _get_generator(channel_count)
+
+    ctx.progress(0.0, 'analyzing')
+    analysis = generator.analyze_audio(audio_path)
+
+    ctx.progress(0.6, 'rendering')
+    if mode == 'matrix':
+        matrix_dir = os.path.join(output_folder, f"{file_id}_matrix")
+        try:
+            generator.generate_matrix_show(analysis, matrix_dir, rows, cols)
+
+            # Zip the result
+            ctx.progress(0.9, 'zipping')
+            zip_path = os.path.join(output_folder, f"{file_id}.zip")
+            with metrics.stage("zip"), zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                for root, dirs, files in os.walk(matrix_dir):
+                    for file in files:
+                        zipf.write(os.path.join(root, file), file)
+        finally:
+            # Cleanup raw files
+            shutil.rmtree(matrix_dir, ignore_errors=True)
+    else:
+        output_path = os.path.join(output_folder, f"{file_id}.fseq")
+        generator.generate_fseq(analysis, output_path)
+
+    return {
+        "success": True,
+        "file_id": file_id,
+        "duration": analysis["duration"],
+        "frame_count": analysis["frame_count"],
+        "channel_count": generator.channel_count,
+        "mode": mode
+    }
+
+def analyze(ctx, audio_path, output_folder, file_id):
+    ctx.progress(0.0, 'analyzing')
+    analysis = _get_generator().analyze_audio(audio_path)
+
+    # Per-frame features are fetched from /analysis/<file_id> on demand,
+    # the job result only carries the beats, onsets and timing
+    ctx.progress(0.9, 'saving')
+    save_analysis(os.path.join(output_folder, f"{file_id}.analysis"), analysis)
+    summary = {k: v for k, v in analysis.items() if k not in FEATURE_KEYS}
+    summary["features"] = list(FEATURE_KEYS)
+    summary["analysis_url"] = f"/analysis/{file_id}"
+    return {
+        "success": True,
+        "file_id": file_id,
+        "analysis": summary
+    }
+
+def export_project(ctx, project, output_path, file_id, ext, matrix_mode, matrix_config, layout_data, compression_level=6,
+                   project_id=None):
+    ctx.progress(0.0, 'rendering')
+    exporter = ProjectExporter(project)
+    exporter.export(output_path, matrix_mode=matrix_mode, matrix_config=matrix_config, layout_data=layout_data,
+                    compression_level=compression_level, render_cache=_render_cache, project_id=project_id)
+    return {
+        "success": True,
+        "file_id": file_id,
+        "extension": ext
+    }
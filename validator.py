@@ -1,8 +1,17 @@
 # Requires Python 3.7+
+# --deep additionally requires numpy
+import argparse
 import dataclasses
+import glob
+import json
+import os
 import struct
 import sys
+import tempfile
+import time
 import datetime
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 class ValidationError(Exception):
     pass
@@ -12,15 +21,71 @@ class ValidationResults:
     frame_count: int
     step_time: int
     duration_s: int
+    warnings: list = dataclasses.field(default_factory=list)
+
+AUDIO_EXTENSIONS = (".wav", ".mp3")
+SHOW_FOLDER = "LightShow" # Base-level folder on the USB drive (case sensitive)
+
+# Deep validation settings (see README: Boolean Light Channels, Ramping, Closures)
+LIGHT_LEVELS = (0, 10, 20, 30, 70, 80, 90, 100) # Documented ramping brightness levels (%)
+CLOSURE_LEVELS = (0, 25, 50, 75, 100) # Idle, Open (Q), Dance (A), Close (Z), Stop (F)
+CLOSURE_COMMAND_STATES = (1, 2, 3) # Open, Dance and Close count towards the limits
+LEVEL_TOLERANCE = 2 # Allowed distance (0-255 counts) from a documented level
+MIN_RUN_MS = 100 # On/off times shorter than this are hard to see
+RUN_BINS_MS = (50, 100, 250, 500, 1000) # Run length histogram bin edges
+
+# 0-indexed closure channels: (name, command limit per show)
+CLOSURES = {
+    30: ("Left Falcon Door", 6),
+    31: ("Right Falcon Door", 6),
+    32: ("Left Front Door", 6),
+    33: ("Right Front Door", 6),
+    34: ("Left Mirror", 20),
+    35: ("Right Mirror", 20),
+    36: ("Left Front Window", 6),
+    37: ("Left Rear Window", 6),
+    38: ("Right Front Window", 6),
+    39: ("Right Rear Window", 6),
+    40: ("Liftgate", 6),
+    41: ("Left Front Door Handle", 20),
+    42: ("Left Rear Door Handle", 20),
+    43: ("Right Front Door Handle", 20),
+    44: ("Right Rear Door Handle", 20),
+    45: ("Charge Port", 3),
+}
+# Rear turns and brake have full brightness control on Cybertruck, as do the light bars (47+)
+FULL_BRIGHTNESS_CHANNELS = (22, 23, 24)
+FIRST_LIGHT_BAR_CHANNEL = 46
+
+@dataclasses.dataclass
+class DeepValidationReport:
+    path: str
+    valid: bool
+    frame_count: int
+    channel_count: int
+    step_time: int
+    duration_s: float
+    file_size: int
+    expected_size: int
+    errors: list
+    warnings: list
+    channels: list
+    elapsed_s: float
+
+def _read_header(file, size):
+    data = file.read(size)
+    if len(data) < size:
+        raise ValidationError("File is too short to be an FSEQ file")
+    return data
 
 def validate(file):
     """Checks format and length of the provided .fseq file"""
-    magic = file.read(4)
-    start, minor, major = struct.unpack("<HBB", file.read(4))
+    magic = _read_header(file, 4)
+    start, minor, major = struct.unpack("<HBB", _read_header(file, 4))
     file.seek(10)
-    channel_count, frame_count, step_time = struct.unpack("<IIB", file.read(9))
+    channel_count, frame_count, step_time = struct.unpack("<IIB", _read_header(file, 9))
     file.seek(20)
-    compression_type, = struct.unpack("<B", file.read(1))
+    compression_type, = struct.unpack("<B", _read_header(file, 1))
 
     if (magic != b'PSEQ') or (start < 24) or (frame_count < 1) or (step_time < 15):
         raise ValidationError("Unknown file format, expected FSEQ v2.0")
@@ -31,34 +96,393 @@ def validate(file):
     duration_s = (frame_count * step_time / 1000)
     if duration_s > 4*60*60:
         raise ValidationError(f"Expected total duration to be less than 4 hours, got {datetime.timedelta(seconds=duration_s)}")
+    warnings = []
     if ((minor != 0) and (minor != 2)) or (major != 2):
-        print("")
-        print(f"WARNING: FSEQ version is {major}.{minor}. Only version 2.0 and 2.2 have been validated.")
-        print(f"If the car fails to read this file, download an older version of XLights at https://github.com/smeighan/xLights/releases")
-        print(f"Please report this message at https://github.com/teslamotors/light-show/issues")
-        print("")
+        warnings.append(f"FSEQ version is {major}.{minor}. Only version 2.0 and 2.2 have been validated.")
    
-    return ValidationResults(frame_count, step_time, duration_s)
+    return ValidationResults(frame_count, step_time, duration_s, warnings)
+
+def _level_luts(np, levels):
+    """(state, valid) lookup tables mapping a 0-255 value to its nearest documented level"""
+    targets = np.array([l * 255 / 100 for l in levels])
+    values = np.arange(256)
+    distance = np.abs(values[:, None] - targets[None, :])
+    state = distance.argmin(axis=1).astype(np.uint8)
+    valid = distance.min(axis=1) <= LEVEL_TOLERANCE
+    return state, valid
+
+def deep_validate(path, chunk_frames=16384):
+    """
+    Single pass over the memory-mapped frame data checking file size,
+    per-channel on/off run lengths, closure command counts and value ranges.
+    """
+    import numpy as np
+    from fseq import FseqFile, FseqError
+
+    started = time.perf_counter()
+    try:
+        show = FseqFile(path)
+    except FseqError as e:
+        raise ValidationError(str(e))
+
+    channel_count = show.channel_count
+    step_time = show.step_time_ms
+    errors, warnings = [], []
+
+    if show.file_size < show.expected_size:
+        errors.append(f"File is truncated: expected {show.expected_size} bytes for {show.frame_count} frames, got {show.file_size}")
+    elif show.file_size > show.expected_size:
+        warnings.append(f"{show.file_size - show.expected_size} unexpected bytes after the last frame")
+
+    # Per channel kind lookup tables: light, full brightness light, closure
+    # Light state is on/off (above 50% turns a boolean light on), closure state is the command
+    light_state = (np.arange(256) > 127).astype(np.uint8)
+    _, light_valid = _level_luts(np, LIGHT_LEVELS)
+    closure_state, closure_valid = _level_luts(np, CLOSURE_LEVELS)
+    state_lut = np.stack([light_state, light_state, closure_state])
+    valid_lut = np.stack([light_valid, np.ones(256, dtype=bool), closure_valid])
+
+    all_cols = np.arange(channel_count)
+    is_closure = np.isin(all_cols, list(CLOSURES))
+    kinds = np.where(is_closure, 2, (np.isin(all_cols, FULL_BRIGHTNESS_CHANNELS) | (all_cols >= FIRST_LIGHT_BAR_CHANNEL)).astype(int))
+    is_command_state = np.isin(np.arange(len(CLOSURE_LEVELS)), CLOSURE_COMMAND_STATES)
+
+    nbins = len(RUN_BINS_MS) + 1
+    bin_edges = np.array(RUN_BINS_MS)
+    toggles = np.zeros(channel_count, dtype=np.int64)
+    commands = np.zeros(channel_count, dtype=np.int64)
+    invalid = np.zeros(channel_count, dtype=np.int64)
+    run_hist = np.zeros((channel_count, nbins), dtype=np.int64)
+    last_change = np.full(channel_count, -1, dtype=np.int64) # Frame of each channel's last state change
+    last_values = np.zeros(channel_count, dtype=np.uint8) # Everything starts idle/off
+    last_state = np.zeros(channel_count, dtype=np.uint8)
+    changes = None
+
+    # Only frames where a value changes need a closer look, so the dense work
+    # per chunk is a single comparison and the rest scales with the changes
+    for chunk_start, chunk in zip(range(0, len(show), chunk_frames), show.iter_chunks(chunk_frames)):
+        n = len(chunk)
+        chunk_end = chunk_start + n
+        if changes is None or changes.shape != chunk.shape:
+            changes = np.empty(chunk.shape, dtype=bool)
+        np.not_equal(chunk[0], last_values, out=changes[0])
+        np.not_equal(chunk[1:], chunk[:-1], out=changes[1:])
+
+        # Value changes grouped by channel, then frame
+        f, ch = np.divmod(np.flatnonzero(changes), channel_count)
+        order = np.argsort(ch.astype(np.uint16), kind="stable")
+        f, ch = f[order], ch[order]
+        first = np.ones(len(ch), dtype=bool)
+        first[1:] = ch[1:] != ch[:-1]
+        last = np.ones(len(ch), dtype=bool)
+        last[:-1] = first[1:]
+
+        values = chunk[f, ch]
+        k = kinds[ch]
+        f = f + chunk_start
+
+        # Frames holding undocumented values: runs starting at each change,
+        # plus the run carried over from the previous chunk
+        run_end = np.empty_like(f)
+        run_end[:-1] = f[1:]
+        run_end[last] = chunk_end
+        bad = ~valid_lut[k, values]
+        invalid += np.bincount(ch[bad], weights=(run_end - f)[bad], minlength=channel_count).astype(np.int64)
+        carried = np.full(channel_count, chunk_end, dtype=np.int64)
+        carried[ch[first]] = f[first]
+        invalid += np.where(valid_lut[kinds, last_values], 0, carried - chunk_start)
+
+        # Keep the value changes that change the light/closure state
+        state = state_lut[k, values]
+        prev_state = np.empty_like(state)
+        prev_state[1:] = state[:-1]
+        prev_state[first] = last_state[ch[first]]
+        last_state[ch[last]] = state[last]
+        toggled = state != prev_state
+        f, ch, state = f[toggled], ch[toggled], state[toggled]
+
+        if len(ch):
+            first = np.ones(len(ch), dtype=bool)
+            first[1:] = ch[1:] != ch[:-1]
+            last = np.ones(len(ch), dtype=bool)
+            last[:-1] = first[1:]
+
+            prev_f = np.empty_like(f)
+            prev_f[1:] = f[:-1]
+            prev_f[first] = last_change[ch[first]]
+
+            # Runs bounded by two changes (the leading idle run isn't a flip)
+            done = prev_f >= 0
+            run_ms = (f[done] - prev_f[done]) * step_time
+            bins = np.searchsorted(bin_edges, run_ms, side="right")
+            run_hist += np.bincount(ch[done] * nbins + bins, minlength=channel_count * nbins).reshape(channel_count, nbins)
+
+            toggles += np.bincount(ch, minlength=channel_count)
+            is_command = is_closure[ch] & is_command_state[state]
+            commands += np.bincount(ch[is_command], minlength=channel_count)
+            last_change[ch[last]] = f[last]
+
+        last_values = chunk[-1].copy()
+
+    short_bins = int(np.searchsorted(bin_edges, MIN_RUN_MS, side="right"))
+    short_runs = run_hist[:, :short_bins].sum(axis=1)
+    labels = ["<" + str(RUN_BINS_MS[0])] + [f"{a}-{b}" for a, b in zip(RUN_BINS_MS, RUN_BINS_MS[1:])] + [f">={RUN_BINS_MS[-1]}"]
+
+    channels = []
+    for c in range(channel_count):
+        if not (toggles[c] or invalid[c]): continue
+        info = {
+            "channel": c + 1,
+            "toggles": int(toggles[c]),
+            "short_runs": int(short_runs[c]),
+            "invalid_values": int(invalid[c]),
+            "run_histogram_ms": dict(zip(labels, run_hist[c].tolist()))
+        }
+        if c in CLOSURES:
+            name, limit = CLOSURES[c]
+            info.update(name=name, commands=int(commands[c]), command_limit=limit)
+            if commands[c] > limit:
+                errors.append(f"Channel {c + 1} ({name}) has {commands[c]} commands, limit is {limit}")
+        if short_runs[c]:
+            warnings.append(f"Channel {c + 1} has {short_runs[c]} on/off times shorter than {MIN_RUN_MS} ms")
+        if invalid[c]:
+            kind = "closure command" if c in CLOSURES else "brightness"
+            warnings.append(f"Channel {c + 1} has {invalid[c]} frames with an undocumented {kind} value")
+        channels.append(info)
+
+    return DeepValidationReport(
+        path=path,
+        valid=not errors,
+        frame_count=show.frame_count,
+        channel_count=channel_count,
+        step_time=step_time,
+        duration_s=show.duration_s,
+        file_size=show.file_size,
+        expected_size=show.expected_size,
+        errors=errors,
+        warnings=warnings,
+        channels=channels,
+        elapsed_s=round(time.perf_counter() - started, 4)
+    )
+
+def validation_report(path, deep=False, name=None):
+    """Validation results for one .fseq file as a JSON-serializable dict (never raises)"""
+    name = name or path
+    try:
+        with open(path, "rb") as file:
+            results = validate(file)
+        if deep:
+            report = dataclasses.asdict(deep_validate(path))
+            del report["path"]
+            report["warnings"] = results.warnings + report["warnings"]
+        else:
+            report = {"valid": True, **dataclasses.asdict(results), "errors": []}
+    except (OSError, ValidationError) as e:
+        report = {"valid": False, "errors": [str(e)], "warnings": []}
+    except ImportError:
+        report = {"valid": False, "errors": ["--deep requires numpy (pip install numpy)"], "warnings": []}
+    return {"path": name, **report}
+
+def _zip_member_report(zip_path, member, deep=False):
+    """validation_report for a .fseq inside a zip archive"""
+    name = f"{zip_path}/{member}"
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            if not deep:
+                with archive.open(member) as file:
+                    results = validate(file)
+                return {"path": name, "valid": True, **dataclasses.asdict(results), "errors": []}
+
+            # Deep checks memory-map the frame data, so they need a real file
+            fd, tmp_path = tempfile.mkstemp(suffix=".fseq")
+            try:
+                with os.fdopen(fd, "wb") as tmp, archive.open(member) as src:
+                    while True:
+                        block = src.read(1024 * 1024)
+                        if not block: break
+                        tmp.write(block)
+                return validation_report(tmp_path, deep=True, name=name)
+            finally:
+                os.remove(tmp_path)
+    except (OSError, zipfile.BadZipFile, ValidationError) as e:
+        return {"path": name, "valid": False, "errors": [str(e)], "warnings": []}
+
+def check_layout(names):
+    """
+    Checks a USB drive image (relative paths with / separators) against the
+    README requirements: a base-level LightShow folder with matching
+    .fseq and .wav/.mp3 names, and no base-level TeslaCam folder.
+    Returns (errors, warnings).
+    """
+    errors, warnings = [], []
+    top_level = {n.split("/")[0] for n in names}
+    if "TeslaCam" in top_level:
+        errors.append("Must not contain a base-level TeslaCam folder")
+
+    prefix = SHOW_FOLDER + "/"
+    shows = [n[len(prefix):] for n in names if n.startswith(prefix) and "/" not in n[len(prefix):]]
+    if not any(n.startswith(prefix) for n in names):
+        misnamed = [t for t in top_level if t.lower() == SHOW_FOLDER.lower()]
+        if misnamed:
+            errors.append(f"Found a \"{misnamed[0]}\" folder, the name must be \"{SHOW_FOLDER}\" (case sensitive)")
+        else:
+            errors.append(f"Missing base-level \"{SHOW_FOLDER}\" folder")
+        return errors, warnings
+
+    sequences, audio = set(), {}
+    for show in shows:
+        stem, ext = os.path.splitext(show)
+        if ext.lower() == ".fseq":
+            sequences.add(stem)
+        elif ext.lower() in AUDIO_EXTENSIONS:
+            audio.setdefault(stem, []).append(show)
+
+    if not sequences:
+        errors.append(f"{SHOW_FOLDER} folder has no .fseq file")
+    if not audio:
+        errors.append(f"{SHOW_FOLDER} folder has no .wav or .mp3 file")
+    for stem in sorted(sequences - audio.keys()):
+        errors.append(f"{stem}.fseq has no matching .wav or .mp3 file")
+    for stem in sorted(audio.keys() - sequences):
+        warnings.append(f"{audio[stem][0]} has no matching .fseq file")
+    for stem in sorted(audio.keys() & sequences):
+        if len(audio[stem]) > 1:
+            warnings.append(f"{stem}.fseq has more than one audio file: {', '.join(sorted(audio[stem]))}")
+    return errors, warnings
+
+def _expand_inputs(inputs):
+    """
+    Resolves files, directories, globs and zip archives into
+    (jobs, layouts): jobs are (fn, args) validation calls, layouts are
+    (root, relative names) of every directory/zip to check as a USB drive.
+    """
+    jobs, layouts = [], []
+
+    def add(path):
+        if os.path.isdir(path):
+            root = os.path.dirname(os.path.abspath(path)) if os.path.basename(os.path.normpath(path)) == SHOW_FOLDER else path
+            names = []
+            for dirpath, _, files in os.walk(root):
+                for file in sorted(files):
+                    full = os.path.join(dirpath, file)
+                    names.append(os.path.relpath(full, root).replace(os.sep, "/"))
+                    if file.lower().endswith(".fseq"):
+                        jobs.append((validation_report, (full,)))
+            layouts.append((root, names))
+        elif zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                names = [n for n in archive.namelist() if not n.endswith("/")]
+            jobs.extend((_zip_member_report, (path, n)) for n in names if n.lower().endswith(".fseq"))
+            layouts.append((path, names))
+        else:
+            jobs.append((validation_report, (path,)))
+
+    for item in inputs:
+        if os.path.exists(item):
+            add(item)
+        else:
+            matches = sorted(glob.glob(item, recursive=True))
+            if not matches:
+                jobs.append((validation_report, (item,))) # Reported as missing
+            for match in matches:
+                add(match)
+    return jobs, layouts
+
+def batch_validate(inputs, deep=False, layout=False, workers=None):
+    """
+    Validates every .fseq found in inputs concurrently, yielding one report
+    dict per file (and per USB drive image when layout is set) as they
+    finish, followed by a {"summary": ...} record.
+    """
+    started = time.perf_counter()
+    jobs, layouts = _expand_inputs(inputs)
+    summary = {"files": 0, "valid": 0, "invalid": 0, "warnings": 0, "layouts": 0, "invalid_layouts": 0}
+
+    if layout:
+        for root, names in layouts:
+            errors, warnings = check_layout(names)
+            summary["layouts"] += 1
+            summary["invalid_layouts"] += bool(errors)
+            yield {"layout": root, "valid": not errors, "errors": errors, "warnings": warnings}
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        futures = [executor.submit(fn, *args, deep=deep) for fn, args in jobs]
+        for future in as_completed(futures):
+            report = future.result()
+            summary["files"] += 1
+            summary["valid" if report["valid"] else "invalid"] += 1
+            summary["warnings"] += bool(report["warnings"])
+            yield report
+
+    summary["elapsed_s"] = round(time.perf_counter() - started, 3)
+    yield {"summary": summary}
+
+def _is_batch(paths):
+    return len(paths) > 1 or any(os.path.isdir(p) or zipfile.is_zipfile(p) or glob.has_magic(p) for p in paths)
 
 if __name__ == "__main__":
-    # Expected usage: python3 validator.py lightshow.fseq
+    # Expected usage: python3 validator.py lightshow.fseq [--deep] [--json]
+    #             or: python3 validator.py --batch shows/ *.zip "usb/**/*.fseq" [--layout]
+    parser = argparse.ArgumentParser(description="Validate Tesla light show .fseq files")
+    parser.add_argument("paths", nargs="*", help=".fseq files, or directories, globs and .zip archives with --batch")
+    parser.add_argument("--deep", action="store_true", help="also check frame data (requires numpy)")
+    parser.add_argument("--json", action="store_true", help="print a machine-readable report and don't prompt")
+    parser.add_argument("--batch", action="store_true", help="validate many files, printing JSON lines and a summary (implied by several paths, directories, globs or zips)")
+    parser.add_argument("--layout", action="store_true", help="in batch mode, check directories and zips follow the USB drive LightShow folder layout")
+    parser.add_argument("--workers", type=int, default=None, help="parallel validations in batch mode (default: CPU count)")
+    args = parser.parse_args()
+
+    if args.batch or _is_batch(args.paths):
+        ok = True
+        for record in batch_validate(args.paths, deep=args.deep, layout=args.layout, workers=args.workers):
+            if "summary" not in record:
+                ok = ok and record["valid"]
+            print(json.dumps(record), flush=True)
+        sys.exit(0 if ok else 1)
 
     # Check if a file argument is provided
-    if len(sys.argv) > 1:
-        file_path = sys.argv[1]
+    if args.paths:
+        file_path = args.paths[0]
     else:
         file_path = input("Please enter the path by dragging and dropping the .fseq file: ")
         print("")
         file_path = file_path.strip('"') # Remove surrounding quotes if they exist (Windows)
         file_path = file_path.strip(' ') # Remove spaces (macOS)
-        
-    with open(file_path, "rb") as file:
-        try:
+
+    if args.json:
+        report = validation_report(file_path, deep=args.deep)
+        print(json.dumps(report))
+        sys.exit(0 if report["valid"] else 1)
+
+    try:
+        with open(file_path, "rb") as file:
             results = validate(file)
-        except ValidationError as e:
-            print(e)
-            input("Press Enter to exit...")
-            sys.exit(1)
+        report = deep_validate(file_path) if args.deep else None
+    except (OSError, ValidationError) as e:
+        print(e)
+        input("Press Enter to exit...")
+        sys.exit(1)
+    except ImportError:
+        print("--deep requires numpy (pip install numpy)")
+        input("Press Enter to exit...")
+        sys.exit(1)
+
+    for warning in results.warnings:
+        print("")
+        print(f"WARNING: {warning}")
+        print(f"If the car fails to read this file, download an older version of XLights at https://github.com/smeighan/xLights/releases")
+        print(f"Please report this message at https://github.com/teslamotors/light-show/issues")
+        print("")
 
     print(f"Found {results.frame_count} frames, step time of {results.step_time} ms for a total duration of {datetime.timedelta(seconds=results.duration_s)}.")
+    if report is not None:
+        for channel in report.channels:
+            if "commands" in channel:
+                print(f"  {channel['name']}: {channel['commands']}/{channel['command_limit']} commands")
+        for warning in report.warnings:
+            print(f"Warning: {warning}")
+        for error in report.errors:
+            print(f"Error: {error}")
+        print(f"Deep validation {'passed' if report.valid else 'FAILED'} in {report.elapsed_s:.2f} s.")
     input("Press Enter to exit...")
+    sys.exit(0 if report is None or report.valid else 1)